@@ -0,0 +1,115 @@
+# Copyright (C) by Pietrobon Andrea - All Rights Reserved
+#
+# This file is part of the project: TelegramBot-AmazonOffers
+# It can only be distributed from Andrea Pietrobon's official Github profile
+# The use of the project TelegramBot-AmazonOffers or of this file follow
+# the rules indicated in the LICENSE file.
+# The redistribution or sale of the files without the written consent
+# of the author is not authorized.
+#
+# Written by Pietrobon Andrea, Jan 2024
+# Official website <https://pietrobonandrea.com>
+# Github website <https://github.com/Piero24>
+
+# Benchmark of the harvest against the stub PA-API server, without network
+# and credentials. It sends the SearchItems requests of the bot through
+# amz_paapi_sdk, then filters the offers and converts the items to products
+# as the pipeline does, and prints the time of each step.
+#
+# Run it from the root of the repository:
+#
+# python benchmarks/harvest_benchmark.py --requests 50 --latency 0.05 --throttle 0.1
+
+# Standard library modules
+import os
+import sys
+import time
+import argparse
+import statistics
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCHMARKS_DIR), 'src'))
+
+# External libraries
+from paapi5_python_sdk.condition import Condition
+
+# Importing internal modules
+import utils
+from configs import api_keys
+from utils import amz_paapi_sdk, list_manager
+from utils.product import Product
+from paapi_stub_server import PaapiStub
+
+KEYWORDS = ["cuffie", "tastiera", "caffè", "lego", "manubri"]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Harvest benchmark on the "
+                                                 "stub PA-API server.")
+    parser.add_argument("--requests", type=int, default=30,
+                        help="Number of SearchItems requests.")
+    parser.add_argument("--items", type=int, default=10,
+                        help="Number of items of each response.")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Delay in seconds of the stub responses.")
+    parser.add_argument("--throttle", type=float, default=0.0,
+                        help="Share of requests refused with 429 (0-1).")
+    parser.add_argument("--item-bytes", type=int, default=0,
+                        help="Minimum size of the features of each item.")
+    parser.add_argument("--fixtures", default=None,
+                        help="Directory of recorded responses to replay.")
+    args = parser.parse_args()
+
+    stub = PaapiStub(args.items, args.latency, args.throttle,
+                     args.item_bytes, args.fixtures)
+    host = stub.start()
+
+    durations = []
+    items = []
+    seen = set()
+    throttled = 0
+
+    start = time.perf_counter()
+    for index in range(args.requests):
+        keyword = KEYWORDS[index % len(KEYWORDS)]
+        page = index // len(KEYWORDS) % 10 + 1
+
+        sent = time.perf_counter()
+        response = amz_paapi_sdk.search_items_by_kw(
+            api_keys.ACCESS_KEY, api_keys.SECRET_KEY, api_keys.PARTNER_TAG,
+            host, "eu-west-1", keyword, Condition.NEW, args.items, page)
+        durations.append(time.perf_counter() - sent)
+
+        if response == 429:
+            throttled += 1
+            continue
+
+        if response is not None and response.search_result is not None:
+            for item in response.search_result.items or []:
+                if item.asin not in seen:
+                    seen.add(item.asin)
+                    items.append(item)
+    requests_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    offers = list_manager.offers_checker(items)
+    filter_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    products = Product.list_to_products(offers)
+    convert_time = time.perf_counter() - start
+
+    stub.stop()
+
+    durations.sort()
+    p95 = durations[min(len(durations) - 1, int(len(durations) * 0.95))]
+
+    print(f"Requests: {args.requests} - Items: {args.items} - Latency: "
+          f"{args.latency} s - Throttle: {args.throttle}")
+    print(f"Requests:   {requests_time:8.3f} s "
+          f"({args.requests / requests_time:.1f} req/s, "
+          f"median {statistics.median(durations) * 1000:.1f} ms, "
+          f"p95 {p95 * 1000:.1f} ms, {throttled} throttled)")
+    print(f"Filter:     {filter_time * 1000:8.2f} ms "
+          f"({len(items)} items, {len(offers)} offers)")
+    print(f"Conversion: {convert_time * 1000:8.2f} ms "
+          f"({len(products)} products)")
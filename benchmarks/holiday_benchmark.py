@@ -0,0 +1,125 @@
+# Copyright (C) by Pietrobon Andrea - All Rights Reserved
+#
+# This file is part of the project: TelegramBot-AmazonOffers
+# It can only be distributed from Andrea Pietrobon's official Github profile
+# The use of the project TelegramBot-AmazonOffers or of this file follow
+# the rules indicated in the LICENSE file.
+# The redistribution or sale of the files without the written consent
+# of the author is not authorized.
+#
+# Written by Pietrobon Andrea, Jan 2024
+# Official website <https://pietrobonandrea.com>
+# Github website <https://github.com/Piero24>
+
+# Benchmark of the holiday check. It compares, in fresh interpreters, the
+# startup cost (import + first check) of building holidays.CountryHoliday
+# with the HolidayCalendar loaded from its cache file, then the cost of each
+# following check.
+#
+# Run it from the root of the repository:
+#
+# python benchmarks/holiday_benchmark.py --country IT --runs 5
+
+# Standard library modules
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'src')
+
+# Code run in a fresh interpreter, it prints the startup time in seconds.
+# The modules of the bot are imported before the timer in both cases.
+LIBRARY_STARTUP = '''
+import sys, time
+sys.path.insert(0, {src!r})
+import utils
+start = time.perf_counter()
+import holidays
+from datetime import date
+date.today() in holidays.CountryHoliday({country!r})
+print(time.perf_counter() - start)
+'''
+
+CALENDAR_STARTUP = '''
+import sys, time
+sys.path.insert(0, {src!r})
+import utils
+from utils.holiday_calendar import HolidayCalendar
+start = time.perf_counter()
+from datetime import date
+HolidayCalendar({cache!r}).is_holiday(date.today(), {country!r})
+print(time.perf_counter() - start)
+'''
+
+def startup(code: str, runs: int) -> float:
+    """Runs a snippet in fresh interpreters and returns the best time.
+
+    Args:
+        code (str): The snippet, it must print its time in seconds.
+        runs (int): The number of interpreters to start.
+
+    Returns:
+        float: The best time in milliseconds.
+    """
+    times = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", code], check=True,
+                                capture_output=True, text=True).stdout
+        times.append(float(output.strip().splitlines()[-1]))
+    return min(times) * 1000
+
+def check_time(check, checks: int) -> float:
+    """Returns the average time of a check in microseconds."""
+    start = time.perf_counter()
+    for _ in range(checks):
+        check()
+    return (time.perf_counter() - start) / checks * 1e6
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Holiday check benchmark.")
+    parser.add_argument("--country", default="IT",
+                        help="ISO code of the country.")
+    parser.add_argument("--runs", type=int, default=5,
+                        help="Number of fresh interpreters for each mode.")
+    parser.add_argument("--checks", type=int, default=200,
+                        help="Number of checks measured for each mode.")
+    args = parser.parse_args()
+
+    sys.path.insert(0, SRC_DIR)
+
+    # Importing internal modules
+    import holidays
+    from datetime import date
+    from utils.holiday_calendar import HolidayCalendar
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache = os.path.join(directory, "holidays.json")
+
+        # Fill the cache file, as the bot does the first time in a year
+        calendar = HolidayCalendar(cache)
+        calendar.is_holiday(date.today(), args.country)
+
+        library = startup(LIBRARY_STARTUP.format(src=SRC_DIR,
+                                                 country=args.country),
+                          args.runs)
+        cached = startup(CALENDAR_STARTUP.format(src=SRC_DIR, cache=cache,
+                                                 country=args.country),
+                         args.runs)
+
+    rebuilt = check_time(lambda: date.today() in holidays.CountryHoliday(
+        args.country), args.checks)
+    lookup = check_time(lambda: calendar.is_holiday(date.today(),
+                                                    args.country),
+                        args.checks)
+
+    print(f"Country: {args.country}")
+    print(f"Startup, holidays library: {library:8.2f} ms")
+    print(f"Startup, cached calendar:  {cached:8.2f} ms "
+          f"({library / cached:.1f}x)")
+    print(f"Check, new CountryHoliday: {rebuilt:8.2f} us")
+    print(f"Check, cached calendar:    {lookup:8.2f} us "
+          f"({rebuilt / lookup:.0f}x)")
@@ -0,0 +1,376 @@
+# Copyright (C) by Pietrobon Andrea - All Rights Reserved
+#
+# This file is part of the project: TelegramBot-AmazonOffers
+# It can only be distributed from Andrea Pietrobon's official Github profile
+# The use of the project TelegramBot-AmazonOffers or of this file follow
+# the rules indicated in the LICENSE file.
+# The redistribution or sale of the files without the written consent
+# of the author is not authorized.
+#
+# Written by Pietrobon Andrea, Jan 2024
+# Official website <https://pietrobonandrea.com>
+# Github website <https://github.com/Piero24>
+
+# Stub of the PA-API 5.0 for the benchmarks. It answers the SearchItems and
+# GetItems requests of the SDK with recorded responses (the JSON files of a
+# fixtures directory, replayed in turn) or with generated items, so the
+# harvest can run on a machine without network and without credentials.
+#
+# The latency, the share of requests refused with Status Code: 429 and the
+# size of the items are configurable. Run it from the root of the repository:
+#
+# python benchmarks/paapi_stub_server.py --port 8001 --latency 0.2 --throttle 0.1
+#
+# and point the bot to it in configs/api_keys.py:
+#
+# HOST = "http://localhost:8001"
+#
+# Recorded responses are the bodies of real responses, saved in the fixtures
+# directory as searchitems*.json and getitems*.json.
+
+# Standard library modules
+import os
+import glob
+import json
+import time
+import random
+import hashlib
+import argparse
+import itertools
+import threading
+from typing import Union
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SEARCH_PATH = "/paapi5/searchitems"
+GET_PATH = "/paapi5/getitems"
+
+THROTTLED_BODY = {
+    "__type": "com.amazon.paapi5#TooManyRequestsException",
+    "Errors": [{
+        "Code": "TooManyRequests",
+        "Message": "The request was denied due to request throttling. Please "
+                   "verify the number of requests made per second to the "
+                   "Amazon Product Advertising API."
+    }]
+}
+
+# Category paths of the generated items, from the root to the leaf
+CATEGORIES = [
+    ("Elettronica", "Informatica", "Accessori", "Tastiere"),
+    ("Elettronica", "Home Audio e Hi-Fi", "Cuffie", "Cuffie over-ear"),
+    ("Casa e cucina", "Elettrodomestici", "Macchine da caffè", "Capsule"),
+    ("Giochi e giocattoli", "Costruzioni", "Set di costruzioni", "Mattoncini"),
+    ("Sport e tempo libero", "Fitness", "Pesi", "Manubri"),
+]
+
+BRANDS = ["Acme", "Contoso", "Fabrikam", "Northwind", "Tailspin", "Litware"]
+
+def money(amount: float) -> dict:
+    """Returns a price in the format of the PA-API."""
+    return {"Amount": amount, "Currency": "EUR",
+            "DisplayAmount": f"{amount:.2f} €".replace(".", ",")}
+
+def make_asin(seed: str) -> str:
+    """Returns a stable ASIN for a seed."""
+    return "B0" + hashlib.sha1(seed.encode()).hexdigest()[:8].upper()
+
+def make_item(asin: str, rng: random.Random, item_bytes: int = 0) -> dict:
+    """Generates an item with the resources requested by the bot.
+
+    Args:
+        asin (str): The ASIN of the item.
+        rng (random.Random): The generator of the prices and categories.
+        item_bytes (int): The minimum size of the features of the item, to
+            simulate bigger payloads.
+
+    Returns:
+        dict: The item in the JSON format of the PA-API.
+    """
+    path = rng.choice(CATEGORIES)
+    brand = rng.choice(BRANDS)
+    old_price = round(rng.uniform(15, 400), 2)
+    percentage = rng.randint(5, 70)
+    price = round(old_price * (100 - percentage) / 100, 2)
+    savings = money(round(old_price - price, 2))
+    savings["Percentage"] = percentage
+
+    ancestor = None
+    for position, name in enumerate(path[:-1]):
+        node = {"Id": str(1000 + position), "ContextFreeName": name,
+                "DisplayName": name}
+        if ancestor is not None:
+            node["Ancestor"] = ancestor
+        ancestor = node
+
+    features = [f"{brand} {path[-1]}, caratteristica {n + 1}"
+                for n in range(3)]
+    while item_bytes > 0 and sum(map(len, features)) < item_bytes:
+        features.append("Lorem ipsum dolor sit amet, consectetur adipiscing "
+                        "elit, sed do eiusmod tempor incididunt ut labore.")
+
+    image = f"https://m.media-amazon.com/images/I/{asin}._SL500_.jpg"
+
+    return {
+        "ASIN": asin,
+        "DetailPageURL": f"https://www.amazon.it/dp/{asin}?tag=stub-21",
+        "Images": {"Primary": {"Large": {"URL": image, "Height": 500,
+                                         "Width": 500}}},
+        "ItemInfo": {
+            "Title": {"DisplayValue": f"{brand} {path[-1]} {asin[-4:]}",
+                      "Label": "Title", "Locale": "it_IT"},
+            "ByLineInfo": {"Brand": {"DisplayValue": brand, "Label": "Brand",
+                                     "Locale": "it_IT"}},
+            "Classifications": {
+                "Binding": {"DisplayValue": path[-1], "Label": "Binding",
+                            "Locale": "it_IT"},
+                "ProductGroup": {"DisplayValue": path[0],
+                                 "Label": "ProductGroup", "Locale": "it_IT"}},
+            "Features": {"DisplayValues": features, "Label": "Features",
+                         "Locale": "it_IT"},
+        },
+        "BrowseNodeInfo": {
+            "BrowseNodes": [{
+                "Id": "2000", "ContextFreeName": path[-1],
+                "DisplayName": path[-1], "IsRoot": False,
+                "SalesRank": rng.randint(1, 5000), "Ancestor": ancestor}],
+            "WebsiteSalesRank": {"ContextFreeName": path[0],
+                                 "DisplayName": path[0],
+                                 "SalesRank": rng.randint(1, 50000)},
+        },
+        "Offers": {
+            "Listings": [{
+                "Id": f"stub-{asin}",
+                "Condition": {"Value": "New"},
+                "IsBuyBoxWinner": True,
+                "ViolatesMAP": False,
+                "Availability": {"Type": "Now",
+                                 "Message": "Disponibilità immediata."},
+                "DeliveryInfo": {"IsAmazonFulfilled": True,
+                                 "IsFreeShippingEligible": True,
+                                 "IsPrimeEligible": True},
+                "Price": dict(money(price), Savings=savings),
+                "SavingBasis": money(old_price),
+            }],
+            "Summaries": [{
+                "Condition": {"Value": "New"},
+                "HighestPrice": money(old_price),
+                "LowestPrice": money(price),
+                "OfferCount": 1,
+            }],
+        },
+    }
+
+class PaapiStub:
+    """Stub PA-API server running on a thread of the process.
+
+    Attributes:
+        items (int): The maximum number of items of a generated SearchItems
+            response (the ItemCount of the request is used if lower).
+        latency (float): The delay in seconds before each response.
+        throttle (float): The share of requests refused with Status Code:
+            429, between 0 and 1.
+        item_bytes (int): The minimum size of the features of each
+            generated item.
+        fixtures (dict[str, list[bytes]]): The recorded responses by path.
+        requests (int): The number of requests received.
+        throttled (int): The number of requests refused with 429.
+
+    Methods:
+        start: Starts the server.
+        stop: Stops the server.
+        respond: Returns the status and the body of a response.
+    """
+    def __init__(
+            self,
+            items: int = 10,
+            latency: float = 0.0,
+            throttle: float = 0.0,
+            item_bytes: int = 0,
+            fixtures: Union[str, None] = None,
+            seed: int = 0
+        ) -> None:
+        """Initializes the stub.
+
+        Args:
+            items (int): The maximum number of generated items.
+            latency (float): The delay in seconds before each response.
+            throttle (float): The share of requests refused with 429.
+            item_bytes (int): The minimum size of the features of each item.
+            fixtures (Union[str, None]): The directory of the recorded
+                responses. None generates the responses.
+            seed (int): The seed of the 429 injection.
+        """
+        self.items = items
+        self.latency = latency
+        self.throttle = throttle
+        self.item_bytes = item_bytes
+        self.fixtures = load_fixtures(fixtures) if fixtures else {}
+        self.requests = 0
+        self.throttled = 0
+        self._replay = {path: itertools.cycle(bodies)
+                        for path, bodies in self.fixtures.items() if bodies}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Starts the server on a daemon thread.
+
+        Args:
+            host (str): The address to listen on.
+            port (int): The port, 0 picks a free one.
+
+        Returns:
+            str: The value of api_keys.HOST pointing to the stub.
+        """
+        stub = self
+
+        class Handler(StubHandler):
+            pass
+        Handler.stub = stub
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever,
+                         name="paapi-stub", daemon=True).start()
+        return f"http://{host}:{self._server.server_address[1]}"
+
+    def stop(self) -> None:
+        """Stops the server."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def respond(self, path: str, request: dict) -> tuple[int, bytes]:
+        """Returns the status and the body of a response.
+
+        Args:
+            path (str): The path of the request.
+            request (dict): The body of the request.
+
+        Returns:
+            tuple[int, bytes]: The status code and the JSON body.
+        """
+        with self._lock:
+            self.requests += 1
+            if self._random.random() < self.throttle:
+                self.throttled += 1
+                return 429, json.dumps(THROTTLED_BODY).encode()
+            replay = self._replay.get(path)
+            if replay is not None:
+                return 200, next(replay)
+
+        if path == SEARCH_PATH:
+            body = self.search_items(request)
+        else:
+            body = self.get_items(request)
+        return 200, json.dumps(body, ensure_ascii=False).encode()
+
+    def search_items(self, request: dict) -> dict:
+        """Generates a SearchItems response, the same for the same keywords,
+            category and page."""
+        seed = (f"{request.get('Keywords')}|{request.get('SearchIndex')}|"
+                f"{request.get('ItemPage', 1)}")
+        rng = random.Random(seed)
+        count = min(self.items, request.get("ItemCount") or self.items)
+        items = [make_item(make_asin(f"{seed}|{n}"), rng, self.item_bytes)
+                 for n in range(count)]
+
+        return {"SearchResult": {
+            "Items": items,
+            "TotalResultCount": count * 10,
+            "SearchURL": "https://www.amazon.it/s?k="
+                         f"{request.get('Keywords', '')}",
+        }}
+
+    def get_items(self, request: dict) -> dict:
+        """Generates a GetItems response with the requested ASINs."""
+        items = [make_item(asin, random.Random(asin), self.item_bytes)
+                 for asin in request.get("ItemIds", [])]
+        return {"ItemsResult": {"Items": items}}
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Handler of the requests of the stub PA-API server."""
+    stub = None
+    protocol_version = "HTTP/1.1"
+    # The headers and the body are written apart: with Nagle each response
+    # would wait for the delayed ACK of the client
+    disable_nagle_algorithm = True
+
+    def do_POST(self) -> None:
+        """Answers the SearchItems and GetItems requests."""
+        length = int(self.headers.get("Content-Length", 0))
+        payload = self.rfile.read(length)
+
+        if self.path not in (SEARCH_PATH, GET_PATH):
+            status, body = 404, json.dumps({"Errors": [{
+                "Code": "UnrecognizedClient",
+                "Message": f"Unknown operation {self.path}."}]}).encode()
+        else:
+            try:
+                request = json.loads(payload or b"{}")
+            except ValueError:
+                request = {}
+            if self.stub.latency > 0:
+                time.sleep(self.stub.latency)
+            status, body = self.stub.respond(self.path, request)
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("x-amzn-RequestId",
+                         hashlib.md5(payload + os.urandom(8)).hexdigest())
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        """Keeps the output of the benchmarks clean."""
+        pass
+
+def load_fixtures(directory: str) -> dict[str, list[bytes]]:
+    """Loads the recorded responses of a directory.
+
+    Args:
+        directory (str): The directory with the searchitems*.json and
+            getitems*.json files.
+
+    Returns:
+        dict[str, list[bytes]]: The responses by path, in name order.
+    """
+    fixtures = {}
+    for path, prefix in ((SEARCH_PATH, "searchitems"), (GET_PATH, "getitems")):
+        files = sorted(glob.glob(os.path.join(directory, f"{prefix}*.json")))
+        fixtures[path] = []
+        for file in files:
+            with open(file, "rb") as fixture:
+                fixtures[path].append(fixture.read())
+    return fixtures
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub PA-API 5.0 server.")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="Address to listen on.")
+    parser.add_argument("--port", type=int, default=8001,
+                        help="Port to listen on.")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Delay in seconds before each response.")
+    parser.add_argument("--throttle", type=float, default=0.0,
+                        help="Share of requests refused with 429 (0-1).")
+    parser.add_argument("--items", type=int, default=10,
+                        help="Maximum number of items of a response.")
+    parser.add_argument("--item-bytes", type=int, default=0,
+                        help="Minimum size of the features of each item.")
+    parser.add_argument("--fixtures", default=None,
+                        help="Directory of the recorded responses.")
+    args = parser.parse_args()
+
+    stub = PaapiStub(args.items, args.latency, args.throttle,
+                     args.item_bytes, args.fixtures)
+    url = stub.start(args.host, args.port)
+    print(f"Stub PA-API listening on {url} - set HOST = \"{url}\"")
+
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        stub.stop()
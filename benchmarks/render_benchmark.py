@@ -0,0 +1,100 @@
+# Copyright (C) by Pietrobon Andrea - All Rights Reserved
+#
+# This file is part of the project: TelegramBot-AmazonOffers
+# It can only be distributed from Andrea Pietrobon's official Github profile
+# The use of the project TelegramBot-AmazonOffers or of this file follow
+# the rules indicated in the LICENSE file.
+# The redistribution or sale of the files without the written consent
+# of the author is not authorized.
+#
+# Written by Pietrobon Andrea, Jan 2024
+# Official website <https://pietrobonandrea.com>
+# Github website <https://github.com/Piero24>
+
+# Benchmark of the offer image generation. It measures how many images per
+# second gen_img can produce with a shared RenderContext (warm) and with a
+# new RenderContext for each image (cold, the cost paid before the context
+# was introduced).
+#
+# Run it from the root of the repository:
+#
+# python benchmarks/render_benchmark.py --images 50
+
+# Standard library modules
+import io
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'src'))
+
+# External libraries
+from PIL import Image
+
+# Importing internal modules
+import utils
+from media import image_generator
+
+def sample_image(width: int, height: int) -> bytes:
+    """Generates a noisy JPEG similar in size and entropy to
+        an Amazon product image.
+
+    Args:
+        width (int): The width of the image.
+        height (int): The height of the image.
+
+    Returns:
+        bytes: The encoded JPEG.
+    """
+    image = Image.effect_noise((width, height), 60).convert('RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+def run(image_data: bytes, images: int, warm: bool) -> float:
+    """Renders the same product a number of times.
+
+    Args:
+        image_data (bytes): The encoded product image.
+        images (int): The number of images to render.
+        warm (bool): If True reuse the shared render context, otherwise
+            create a new one for each image.
+
+    Returns:
+        float: The number of images rendered per second.
+    """
+    start = time.perf_counter()
+
+    for index in range(images):
+        context = None if warm else image_generator.RenderContext()
+        image_generator.gen_img("B0BENCHMARK", image_data, f"{index},99",
+                                "€", "129,99", "€", 23, 2, context)
+
+    elapsed = time.perf_counter() - start
+    return images / elapsed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offer image render "
+                                                 "benchmark.")
+    parser.add_argument("--images", type=int, default=30,
+                        help="Number of images rendered for each mode.")
+    parser.add_argument("--width", type=int, default=500,
+                        help="Width of the sample product image.")
+    parser.add_argument("--height", type=int, default=500,
+                        help="Height of the sample product image.")
+    args = parser.parse_args()
+
+    data = sample_image(args.width, args.height)
+
+    # Warm up the shared context so that its creation is not measured
+    image_generator.get_render_context()
+
+    cold = run(data, args.images, warm=False)
+    warm = run(data, args.images, warm=True)
+
+    print(f"Images: {args.images} - Product image: "
+          f"{args.width}x{args.height}")
+    print(f"Cold context: {cold:8.2f} images/s")
+    print(f"Warm context: {warm:8.2f} images/s ({warm / cold:.2f}x)")
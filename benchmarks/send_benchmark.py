@@ -0,0 +1,126 @@
+# Copyright (C) by Pietrobon Andrea - All Rights Reserved
+#
+# This file is part of the project: TelegramBot-AmazonOffers
+# It can only be distributed from Andrea Pietrobon's official Github profile
+# The use of the project TelegramBot-AmazonOffers or of this file follow
+# the rules indicated in the LICENSE file.
+# The redistribution or sale of the files without the written consent
+# of the author is not authorized.
+#
+# Written by Pietrobon Andrea, Jan 2024
+# Official website <https://pietrobonandrea.com>
+# Github website <https://github.com/Piero24>
+
+# Benchmark of the send path against the fake Telegram Bot API server. It
+# queues posts for some chats in an Outbox that sends them with
+# communication_handler.send_post, then prints the throughput, the 429
+# answers and retries, the failures and whether each chat received its
+# posts in order.
+#
+# Run it from the root of the repository:
+#
+# python benchmarks/send_benchmark.py --chats 3 --posts 20 --limit 10 --window 2
+
+# Standard library modules
+import io
+import os
+import sys
+import time
+import argparse
+import threading
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCHMARKS_DIR), 'src'))
+
+# External libraries
+import telebot
+from PIL import Image
+
+# Importing internal modules
+import utils
+from messages.outbox import Outbox, Post
+from messages.communication_handler import send_post
+from telegram_stub_server import TelegramStub
+
+def sample_image(index: int) -> bytes:
+    """Returns a small JPEG, different for each index."""
+    image = Image.new('RGB', (64, 64), (index % 256, 80, 160))
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Send benchmark on the fake "
+                                                 "Telegram Bot API server.")
+    parser.add_argument("--chats", type=int, default=3,
+                        help="Number of chats.")
+    parser.add_argument("--posts", type=int, default=20,
+                        help="Number of posts for each chat.")
+    parser.add_argument("--photos", action="store_true",
+                        help="Send the posts as photos.")
+    parser.add_argument("--per-minute", type=float, default=600,
+                        help="Posts per minute per chat of the Outbox.")
+    parser.add_argument("--burst", type=int, default=5,
+                        help="Burst per chat of the Outbox.")
+    parser.add_argument("--limit", type=int, default=10,
+                        help="Messages per chat in a window of the server.")
+    parser.add_argument("--window", type=float, default=2.0,
+                        help="Rate limit window of the server in seconds.")
+    parser.add_argument("--failure-rate", type=float, default=0.0,
+                        help="Share of requests that fail (0-1).")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Delay in seconds of the server responses.")
+    args = parser.parse_args()
+
+    stub = TelegramStub(args.limit, args.window, args.failure_rate,
+                        latency=args.latency)
+    telebot.apihelper.API_URL = stub.start()
+    bot = telebot.TeleBot("123456:STUB", threaded=False)
+
+    results = []
+    lock = threading.Lock()
+
+    def on_result(post: Post, delivered: bool) -> None:
+        with lock:
+            results.append((post, delivered))
+
+    outbox = Outbox(lambda post: send_post(bot, post), on_result,
+                    per_minute=args.per_minute, burst=args.burst)
+    chats = [-1000000000000 - chat for chat in range(args.chats)]
+    queued = {chat_id: [] for chat_id in chats}
+
+    start = time.perf_counter()
+    for index in range(args.posts):
+        for chat_id in chats:
+            image = sample_image(index) if args.photos else None
+            post = Post(f"B0POST{index:04d}", chat_id, f"Offer {index}",
+                        None, image)
+            queued[chat_id].append(post)
+            outbox.put(post)
+    outbox.join()
+    elapsed = time.perf_counter() - start
+    outbox.close(timeout=5)
+    stub.stop()
+
+    delivered = {id(post) for post, ok in results if ok}
+    throttled = sum(1 for call in stub.calls if call["status"] == 429)
+    failed = sum(1 for call in stub.calls
+                 if call["status"] not in (200, 429))
+
+    in_order = True
+    for chat_id in chats:
+        expected = [post.html for post in queued[chat_id]
+                    if id(post) in delivered]
+        received = [message.get("text", message.get("caption"))
+                    for message in stub.sent_to(chat_id)]
+        in_order &= expected == received
+
+    print(f"Chats: {args.chats} - Posts: {args.chats * args.posts} - "
+          f"Server limit: {args.limit}/{args.window} s - Failure rate: "
+          f"{args.failure_rate}")
+    print(f"Delivered:  {len(delivered)} in {elapsed:.2f} s "
+          f"({len(delivered) / elapsed:.1f} posts/s)")
+    print(f"Calls:      {len(stub.calls)} ({throttled} answered 429, "
+          f"{failed} failed)")
+    print(f"Not sent:   {len(results) - len(delivered)}")
+    print(f"In order:   {in_order}")
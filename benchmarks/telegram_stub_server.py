@@ -0,0 +1,372 @@
+# Copyright (C) by Pietrobon Andrea - All Rights Reserved
+#
+# This file is part of the project: TelegramBot-AmazonOffers
+# It can only be distributed from Andrea Pietrobon's official Github profile
+# The use of the project TelegramBot-AmazonOffers or of this file follow
+# the rules indicated in the LICENSE file.
+# The redistribution or sale of the files without the written consent
+# of the author is not authorized.
+#
+# Written by Pietrobon Andrea, Jan 2024
+# Official website <https://pietrobonandrea.com>
+# Github website <https://github.com/Piero24>
+
+# Fake Telegram Bot API for the benchmarks. It answers sendMessage, sendPhoto
+# and getMe like Telegram does and records every call, so the send path of
+# the bot (communication_handler, Outbox) can be measured and checked on a
+# machine without network.
+#
+# Each chat can send a limited number of messages in a window of time: over
+# the limit the server answers 429 with parameters.retry_after, as Telegram
+# does. A share of the requests can fail with a configurable error code and
+# the latency is configurable. Run it from the root of the repository:
+#
+# python benchmarks/telegram_stub_server.py --port 8002 --limit 20 --window 60
+#
+# and point telebot to it before the bot is created:
+#
+# telebot.apihelper.API_URL = "http://localhost:8002/bot{0}/{1}"
+
+# Standard library modules
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import threading
+from email import message_from_bytes
+from email.policy import HTTP
+from urllib.parse import parse_qsl, urlsplit
+from typing import Any, Union
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ERROR_DESCRIPTIONS = {
+    400: "Bad Request: chat not found",
+    403: "Forbidden: bot is not a member of the channel chat",
+    500: "Internal Server Error",
+    502: "Bad Gateway",
+}
+
+def parse_form(content_type: str, body: bytes) -> tuple[dict, dict]:
+    """Parses the body of a request of telebot.
+
+    Args:
+        content_type (str): The Content-Type header of the request.
+        body (bytes): The body of the request.
+
+    Returns:
+        tuple[dict, dict]: The fields and the uploaded files (as bytes).
+    """
+    if content_type.startswith("application/x-www-form-urlencoded"):
+        return dict(parse_qsl(body.decode())), {}
+
+    if not content_type.startswith("multipart/form-data"):
+        return {}, {}
+
+    message = message_from_bytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode() + body, policy=HTTP)
+    fields, files = {}, {}
+    for part in message.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        payload = part.get_payload(decode=True) or b""
+        if part.get_filename() is not None:
+            files[name] = payload
+        else:
+            fields[name] = payload.decode()
+    return fields, files
+
+class TelegramStub:
+    """Fake Telegram Bot API server running on a thread of the process.
+
+    Attributes:
+        limit (int): The number of messages a chat can send in a window.
+            0 disables the rate limit.
+        window (float): The length of the window in seconds.
+        failure_rate (float): The share of requests that fail, between 0
+            and 1.
+        failure_code (int): The error code of the failed requests.
+        latency (float): The delay in seconds before each response.
+        calls (list[dict]): Every call received, with its method, chat and
+            status code.
+        messages (list[dict]): The messages sent, in the order they were
+            accepted.
+
+    Methods:
+        start: Starts the server.
+        stop: Stops the server.
+        reset: Forgets the calls, the messages and the rate limits.
+        sent_to: Returns the messages sent to a chat.
+        call: Answers a call of the Bot API.
+    """
+    def __init__(
+            self,
+            limit: int = 20,
+            window: float = 60.0,
+            failure_rate: float = 0.0,
+            failure_code: int = 500,
+            latency: float = 0.0,
+            seed: int = 0
+        ) -> None:
+        """Initializes the stub.
+
+        Args:
+            limit (int): The number of messages a chat can send in a window.
+            window (float): The length of the window in seconds.
+            failure_rate (float): The share of requests that fail.
+            failure_code (int): The error code of the failed requests.
+            latency (float): The delay in seconds before each response.
+            seed (int): The seed of the failure injection.
+        """
+        self.limit = limit
+        self.window = window
+        self.failure_rate = failure_rate
+        self.failure_code = failure_code
+        self.latency = latency
+        self.calls = []
+        self.messages = []
+        self._sent = defaultdict(deque)
+        self._files = set()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Starts the server on a daemon thread.
+
+        Args:
+            host (str): The address to listen on.
+            port (int): The port, 0 picks a free one.
+
+        Returns:
+            str: The value of telebot.apihelper.API_URL pointing to the stub.
+        """
+        class Handler(StubHandler):
+            pass
+        Handler.stub = self
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever,
+                         name="telegram-stub", daemon=True).start()
+        return f"http://{host}:{self._server.server_address[1]}/bot{{0}}/{{1}}"
+
+    def stop(self) -> None:
+        """Stops the server."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def reset(self) -> None:
+        """Forgets the calls, the messages and the rate limits."""
+        with self._lock:
+            self.calls.clear()
+            self.messages.clear()
+            self._sent.clear()
+
+    def sent_to(self, chat_id: Union[int, str]) -> list[dict]:
+        """Returns the messages sent to a chat, in order.
+
+        Args:
+            chat_id (Union[int, str]): The chat.
+
+        Returns:
+            list[dict]: The messages.
+        """
+        with self._lock:
+            return [message for message in self.messages
+                    if str(message["chat"]["id"]) == str(chat_id)]
+
+    def call(self, method: str, fields: dict, files: dict) -> tuple[int, dict]:
+        """Answers a call of the Bot API.
+
+        Args:
+            method (str): The method, e.g. sendMessage.
+            fields (dict): The parameters of the call.
+            files (dict): The uploaded files.
+
+        Returns:
+            tuple[int, dict]: The status code and the JSON answer.
+        """
+        chat_id = fields.get("chat_id")
+        status, answer = self._answer(method, fields, files)
+
+        with self._lock:
+            self.calls.append({"method": method, "chat_id": chat_id,
+                               "status": status, "at": time.time()})
+        return status, answer
+
+    def _answer(self, method: str, fields: dict, files: dict) -> tuple[int, dict]:
+        """Returns the status code and the JSON answer of a call."""
+        if method == "getMe":
+            return 200, {"ok": True, "result": {
+                "id": 1, "is_bot": True, "first_name": "Stub",
+                "username": "stub_bot"}}
+
+        if method not in ("sendMessage", "sendPhoto"):
+            return error(404, "Not Found")
+
+        chat_id = fields.get("chat_id")
+        if not chat_id:
+            return error(400, "Bad Request: chat_id is empty")
+
+        with self._lock:
+            if self._random.random() < self.failure_rate:
+                code = self.failure_code
+                return error(code, ERROR_DESCRIPTIONS.get(code, "Error"))
+
+            wait = self._throttle(chat_id)
+            if wait is not None:
+                return error(429, f"Too Many Requests: retry after {wait}",
+                             {"retry_after": wait})
+
+            message = {
+                "message_id": len(self.messages) + 1,
+                "date": int(time.time()),
+                "chat": {"id": to_id(chat_id), "type": "channel",
+                         "title": "Stub channel"},
+            }
+
+            if method == "sendMessage":
+                message["text"] = fields.get("text", "")
+            else:
+                photo = self._photo(fields, files)
+                if photo is None:
+                    self._sent[chat_id].pop()
+                    return error(400, "Bad Request: wrong file identifier/"
+                                      "HTTP URL specified")
+                message["photo"] = photo
+                if "caption" in fields:
+                    message["caption"] = fields["caption"]
+
+            if "reply_markup" in fields:
+                message["reply_markup"] = json.loads(fields["reply_markup"])
+            self.messages.append(message)
+
+        return 200, {"ok": True, "result": message}
+
+    def _throttle(self, chat_id: str) -> Union[int, None]:
+        """Counts a message of a chat, returning the retry_after if the chat
+            is over its limit."""
+        now = time.monotonic()
+        sent = self._sent[chat_id]
+
+        while sent and sent[0] <= now - self.window:
+            sent.popleft()
+
+        if self.limit and len(sent) >= self.limit:
+            return max(1, math.ceil(sent[0] + self.window - now))
+
+        sent.append(now)
+        return None
+
+    def _photo(self, fields: dict, files: dict) -> Union[list[dict], None]:
+        """Returns the sizes of a sent photo, None if its file_id is
+            unknown."""
+        if "photo" in files:
+            data = files["photo"]
+            file_id = "stub-" + hashlib.sha1(data).hexdigest()[:24]
+            self._files.add(file_id)
+            size = len(data)
+        else:
+            file_id = fields.get("photo")
+            if file_id not in self._files:
+                return None
+            size = 0
+
+        return [{"file_id": file_id, "file_unique_id": file_id[-12:],
+                 "width": 500, "height": 500, "file_size": size}]
+
+def to_id(chat_id: str) -> Union[int, str]:
+    """Returns a numeric chat_id as int, a @username as it is."""
+    try:
+        return int(chat_id)
+    except ValueError:
+        return chat_id
+
+def error(
+        code: int,
+        description: str,
+        parameters: Union[dict, None] = None
+    ) -> tuple[int, dict]:
+    """Returns an error answer of the Bot API."""
+    answer = {"ok": False, "error_code": code, "description": description}
+    if parameters is not None:
+        answer["parameters"] = parameters
+    return code, answer
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Handler of the requests of the fake Bot API server."""
+    stub = None
+    protocol_version = "HTTP/1.1"
+    # The headers and the body are written apart: with Nagle each response
+    # would wait for the delayed ACK of the client
+    disable_nagle_algorithm = True
+
+    def do_GET(self) -> None:
+        """Answers a call with the parameters in the query string."""
+        self.handle_call(b"")
+
+    def do_POST(self) -> None:
+        """Answers a call with the parameters in the query string or in the
+            body."""
+        length = int(self.headers.get("Content-Length", 0))
+        self.handle_call(self.rfile.read(length))
+
+    def handle_call(self, body: bytes) -> None:
+        """Parses a call and writes the answer of the stub."""
+        url = urlsplit(self.path)
+        method = url.path.rstrip("/").rsplit("/", 1)[-1]
+        fields = dict(parse_qsl(url.query))
+        form, files = parse_form(self.headers.get("Content-Type", ""), body)
+        fields.update(form)
+
+        if self.stub.latency > 0:
+            time.sleep(self.stub.latency)
+        status, answer = self.stub.call(method, fields, files)
+        self.send_json(status, answer)
+
+    def send_json(self, status: int, answer: Any) -> None:
+        """Writes a JSON answer."""
+        content = json.dumps(answer, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format: str, *args) -> None:
+        """Keeps the output of the benchmarks clean."""
+        pass
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Telegram Bot API "
+                                                 "server.")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="Address to listen on.")
+    parser.add_argument("--port", type=int, default=8002,
+                        help="Port to listen on.")
+    parser.add_argument("--limit", type=int, default=20,
+                        help="Messages per chat in a window (0 disables).")
+    parser.add_argument("--window", type=float, default=60.0,
+                        help="Length of the rate limit window in seconds.")
+    parser.add_argument("--failure-rate", type=float, default=0.0,
+                        help="Share of requests that fail (0-1).")
+    parser.add_argument("--failure-code", type=int, default=500,
+                        help="Error code of the failed requests.")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Delay in seconds before each response.")
+    args = parser.parse_args()
+
+    stub = TelegramStub(args.limit, args.window, args.failure_rate,
+                        args.failure_code, args.latency)
+    url = stub.start(args.host, args.port)
+    print(f"Fake Bot API listening - set "
+          f"telebot.apihelper.API_URL = \"{url}\"")
+
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        stub.stop()
@@ -23,7 +23,9 @@ SUB_PARTNER_TAG = "SUB PARTNER TAG (OPTIONAL)"
 # PAAPI host and region to which you want to send request
 # For more details: 
 # https://webservices.amazon.com/paapi5/documentation/common-request-parameters.html#host-and-region
-# HOST
+# HOST (e.g. "webservices.amazon.it"). With a scheme, like
+# "http://localhost:8001", it points to a local server such as the stub
+# PA-API server of the benchmarks (benchmarks/paapi_stub_server.py)
 HOST = "HOST"
 # REGION
 REGION = "REGION"
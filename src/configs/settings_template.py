@@ -18,7 +18,7 @@ MIN_MINUTE = 00
 MAX_HOUR = 22
 MAX_MINUTE = 30
 
-# Country
+# Country (or list of countries, e.g. ["IT", "DE"], whose holidays are skipped)
 COUNTRY = "IT"
 
 # Number of pages to scrape
@@ -35,6 +35,44 @@ PORT = 8000
 
 HIGH_QUALITY_IMAGE = True
 
+# Max number of messages per minute sent to the same chat
+TELEGRAM_MESSAGES_PER_MINUTE = 20
+
+# Hours after which a post not yet sent (e.g. after a crash) is discarded
+OUTBOX_EXPIRY_HOURS = 6
+
+# Number of processes used to render the offer images (0 = one per CPU core)
+RENDER_WORKERS = 0
+
+# Chats the offers are posted to. Empty = only the CHANNEL_ID in the api keys.
+# Each chat has its own filters and its own history of the sent products,
+# saved in ./database/channels/<name> (letters, digits, "_" and "-"). The
+# empty name is the history in ./database used by the CHANNEL_ID: keep it
+# for the channel you already have, or it will repost every offer.
+# CHANNELS = [
+#     {"chat_id": "@my_channel", "name": ""},
+#     {"chat_id": "@my_tech_channel", "name": "tech", 
+#      "categories": ["Elettronica", "Informatica"], "min_discount": 30},
+# ]
+CHANNELS = []
+
+# Minimum level of the logs and levels of single modules, 
+# e.g. {"amz_paapi_sdk": "INFO", "list_manager": "WARNING"}
+LOG_LEVEL = "DEBUG"
+LOG_LEVELS = {}
+
+# Max number of records per minute logged by each line of the high-volume 
+# functions (ASIN lists of the searches, products without discount)
+LOG_RATE_LIMIT = 20
+
+# Max size in MB of a log file (0 = no limit) and gzip of the closed files
+LOG_MAX_MB = 20
+LOG_COMPRESS = True
+
+# Format of the logs: "text" or "json" (one JSON object per line, with the 
+# timing of each stage of the pipeline)
+LOG_FORMAT = "text"
+
 #################################### DEBUG ####################################
 # 0 = Shoert list, 1 = Full random list
 SUBSET_MODE = 1
\ No newline at end of file
@@ -12,14 +12,18 @@
 # Github website <https://github.com/Piero24>
 
 # Standard library modules
-import time
+import signal
 import logging
+import threading
 
 # External libraries
 import telebot
 
 # Importing internal modules
 from utils import bot_starter
+from utils import http_client
+from utils import job_scheduler
+from utils.health import get_health
 from web import activity_inspector
 from utils.log_manager import setup_logger
 from configs import api_keys
@@ -31,16 +35,57 @@ logger = logging.getLogger(__name__)
 # Initialize the Telegram bot
 bot = telebot.TeleBot(api_keys.TELEGRAM_TOKEN)
 
+# Seconds to wait before retrying after a connection error
+CONNECTION_RETRY_DELAY = 1200
+# Seconds between two runs of the maintenance job
+MAINTENANCE_INTERVAL = 6 * 3600
+
+def iteration() -> int:
+    """Runs an iteration of the bot as the posting job of the scheduler.
+
+    Returns:
+        int: The number of seconds before the next iteration.
+    """
+    try:
+        delay = bot_starter.start(bot)
+        
+    except ConnectionError as e:
+        logging.error('Internet connection error. Retry in 20 minutes.')
+        get_health().mark_iteration(e)
+        return CONNECTION_RETRY_DELAY
+        
+    except Exception as e:
+        logging.critical(f'Error during bot execution: {type(e)} - {e}')
+        get_health().mark_iteration(e)
+        return 0
+    
+    get_health().mark_iteration()
+    return delay
+
+def maintenance() -> None:
+    """Deletes the least recently used files of the download cache."""
+    http_client.get_download_cache().prune()
+
+def stop(signum: int, frame) -> None:
+    """Shuts the scheduler down on SIGINT and SIGTERM."""
+    logging.info(f'Signal {signum} received. Shutting down.')
+    bot_starter.abort_outbox()
+    # Not in the handler: it may interrupt the scheduler holding its lock
+    threading.Thread(target=scheduler.shutdown, args=(60,)).start()
+
 if __name__ == "__main__":
     activity_inspector.run_server_thread()
 
-    while True:
-        try:
-            bot_starter.start(bot)
-            
-        except ConnectionError:
-            logging.error('Internet connection error. Retry in 20 minutes.')
-            time.sleep(1200)
-            
-        except Exception as e:
-            logging.critical(f'Error during bot execution: {type(e)} - {e}')
\ No newline at end of file
+    scheduler = job_scheduler.get_scheduler()
+    scheduler.call_later(0, iteration, name="posting slot")
+    scheduler.call_later(MAINTENANCE_INTERVAL, maintenance, 
+                         name="maintenance", every=MAINTENANCE_INTERVAL, 
+                         background=True)
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    scheduler.run()
+    scheduler.shutdown(60)
+    activity_inspector.stop_server()
+    logging.info('Bot stopped.')
@@ -11,4 +11,6 @@
 # Official website <https://pietrobonandrea.com>
 # Github website <https://github.com/Piero24>
 
-from media import image_generator
\ No newline at end of file
+from media import image_generator
+from media import render_cache
+from media import batch_renderer
\ No newline at end of file
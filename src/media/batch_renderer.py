@@ -0,0 +1,148 @@
+# Copyright (C) by Pietrobon Andrea - All Rights Reserved
+#
+# This file is part of the project: TelegramBot-AmazonOffers
+# It can only be distributed from Andrea Pietrobon's official Github profile
+# The use of the project TelegramBot-AmazonOffers or of this file follow
+# the rules indicated in the LICENSE file.
+# The redistribution or sale of the files without the written consent
+# of the author is not authorized.
+#
+# Written by Pietrobon Andrea, Jan 2024
+# Official website <https://pietrobonandrea.com>
+# Github website <https://github.com/Piero24>
+
+# Standard library modules
+import os
+import sys
+import logging
+from typing import Union
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
+
+# Importing internal modules
+from media import image_generator
+from utils.log_manager import setup_logger
+
+# Setting up logger
+setup_logger()
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class RenderJob:
+    """Everything a worker needs to render the image of one product.
+
+    Attributes:
+        key (str): The render cache key of the image.
+        asin (str): The ASIN of the product.
+        image_data (bytes): The encoded original image of the product.
+        price (str): The formatted current price.
+        currency (str): The currency symbol of the current price.
+        old_price (Union[str, None]): The formatted previous price.
+        old_currency (str): The currency symbol of the previous price.
+        discount (int): The discount percentage.
+        img_number (int): The number of the background template.
+    """
+    key: str
+    asin: str
+    image_data: bytes
+    price: str
+    currency: str
+    old_price: Union[str, None]
+    old_currency: str
+    discount: int
+    img_number: int
+
+def workers_number(workers: int) -> int:
+    """Returns the number of render workers to use.
+
+    Args:
+        workers (int): The configured number of workers. 0 or less means
+            one worker per CPU core.
+
+    Returns:
+        int: The number of workers.
+    """
+    if workers > 0:
+        return workers
+    return os.cpu_count() or 1
+
+def _init_worker() -> None:
+    """Preloads templates and fonts once in each worker process.
+
+    The worker inherits the queue handler of the parent but not the thread 
+        that writes the queue to the log file, so its records would be lost. 
+        The handler is replaced with one writing the warnings and the errors 
+        to stderr; the errors of the renders are logged by the parent.
+    """
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setLevel(logging.WARNING)
+    root.addHandler(handler)
+
+    image_generator.get_render_context()
+
+def _render(job: RenderJob) -> tuple[str, Union[bytes, None], 
+                                     Union[str, None]]:
+    """Renders the image of a job.
+
+    Args:
+        job (RenderJob): The job to render.
+
+    Returns:
+        tuple[str, Union[bytes, None], Union[str, None]]: The key of the 
+            job, the rendered image encoded as JPEG (None if the render 
+            failed) and the error of a failed render.
+    """
+    try:
+        image_data = image_generator.gen_img(job.asin, job.image_data,
+                                             job.price, job.currency,
+                                             job.old_price, job.old_currency,
+                                             job.discount, job.img_number)
+    except Exception as e:
+        return job.key, None, f"{type(e).__name__}: {e}"
+
+    return job.key, image_data, None
+
+def render_batch(jobs: list[RenderJob], workers: int = 0) -> dict[str, bytes]:
+    """Renders the images of many products in parallel on a process pool.
+
+    Image composition is CPU-bound PIL work, so the jobs are spread over
+        worker processes that preload the templates and the fonts when
+        they start. With a single job or a single worker the images are
+        rendered in the current process to avoid the pool start-up cost.
+
+    Args:
+        jobs (list[RenderJob]): The jobs to render.
+        workers (int): The number of worker processes. 0 or less means
+            one worker per CPU core.
+
+    Returns:
+        dict[str, bytes]: The rendered images encoded as JPEG, by job key.
+            Failed jobs are missing.
+    """
+    if not jobs:
+        return {}
+
+    workers = min(workers_number(workers), len(jobs))
+
+    if workers == 1:
+        results = list(map(_render, jobs))
+    else:
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=_init_worker) as executor:
+            results = list(executor.map(_render, jobs))
+
+    rendered = {}
+    for job, (key, data, error) in zip(jobs, results):
+        if data is None:
+            logger.error(f"Error rendering the image for the asin "
+                         f"{job.asin}: {error}")
+            continue
+        rendered[key] = data
+
+    logger.debug(f"Rendered {len(rendered)}/{len(jobs)} images "
+                 f"with {workers} workers.")
+    return rendered
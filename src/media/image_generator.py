@@ -12,67 +12,216 @@
 # Github website <https://github.com/Piero24>
 
 # Standard library modules
+import io
 import os
+import time
 import logging
+import platform
 import requests
+from typing import Union
 
 # External libraries
 from PIL import Image, ImageDraw, ImageFont
 
 # Importing internal modules
+from utils import metrics
+from utils import http_client
 from utils.log_manager import setup_logger
 
 # Setting up logger
 setup_logger()
 logger = logging.getLogger(__name__)
 
-def original_img_download(asin: str, url: str) -> None:
-    """Download an image from a URL and save it as '{asin}.jpg'.
+MEDIA_DIR = os.path.dirname(os.path.abspath(__file__))
+FONT_PATH = os.path.join(MEDIA_DIR, 'font', 'Poppins', 'Poppins-Bold.ttf')
+TEMPLATE_NUMBERS = (2, 3)
+
+# Share of the template (width, height) the product image can fill
+TARGET_BOX_RATIO = (0.6, 0.75)
+# Resampling filter and reducing gap of the product image resize
+RESAMPLE = Image.Resampling.LANCZOS
+REDUCING_GAP = 3.0
+
+#! Windows compatibility Fix as soon as possible
+IS_WINDOWS = platform.system() == "Windows"
+
+class RenderContext:
+    """Holds everything gen_img needs that doesn't depend on the product: 
+        the decoded background templates, the preloaded fonts and the 
+        measured size of the price strings already drawn.
+
+    It is created once per process (see get_render_context) so that each 
+        image only costs a copy of the template, a paste and the text draw.
+
+    Attributes:
+        templates (dict[int, Image.Image]): The decoded background templates 
+            by template number.
+        target_boxes (dict[int, tuple[int, int]]): The maximum size of the 
+            product image on each template, by template number.
+        old_price_font (ImageFont.FreeTypeFont): The font of the old price.
+        price_font (ImageFont.FreeTypeFont): The font of the new price.
+
+    Methods:
+        template: Returns the decoded background template.
+        target_box: Returns the maximum size of the product image.
+        text_size: Returns the size of a text, measuring it only once.
+    """
+    TEXT_SIZE_CACHE_LIMIT = 4096
+
+    def __init__(
+            self, 
+            template_numbers: tuple[int, ...] = TEMPLATE_NUMBERS
+        ) -> None:
+        """Loads the templates and the fonts.
+
+        Args:
+            template_numbers (tuple[int, ...]): The number of the background 
+                templates to decode in advance.
+        """
+        self.templates = {}
+        self.target_boxes = {}
+        for img_number in template_numbers:
+            self.template(img_number)
+
+        # Choose the font and size for the 2 texts
+        self.old_price_font = ImageFont.truetype(FONT_PATH, 70)
+        self.price_font = ImageFont.truetype(FONT_PATH, 180)
+
+        # Scratch surface used only to measure the texts
+        self._measure_draw = ImageDraw.Draw(Image.new('RGB', (1, 1)))
+        self._text_sizes = {}
+
+    def template(self, img_number: int) -> Image.Image:
+        """Returns the decoded background template, loading it the first time.
+
+        Args:
+            img_number (int): The number identifying the background template.
+
+        Returns:
+            Image.Image: The decoded template. It must not be modified, 
+                use a copy of it.
+        """
+        template = self.templates.get(img_number)
+
+        if template is None:
+            template_path = os.path.join(MEDIA_DIR, 'template', 
+                                         f'backg-{img_number}.jpg')
+            template = Image.open(template_path)
+            template.load()
+            self.templates[img_number] = template
+            self.target_boxes[img_number] = (
+                int(template.size[0] * TARGET_BOX_RATIO[0]), 
+                int(template.size[1] * TARGET_BOX_RATIO[1]))
+
+        return template
+
+    def target_box(self, img_number: int) -> tuple[int, int]:
+        """Returns the maximum size of the product image on a template.
+
+        Args:
+            img_number (int): The number identifying the background template.
+
+        Returns:
+            tuple[int, int]: The maximum width and height.
+        """
+        self.template(img_number)
+        return self.target_boxes[img_number]
+
+    def text_size(
+            self, 
+            text: str, 
+            font: ImageFont.FreeTypeFont
+        ) -> tuple[int, int]:
+        """Returns the size of a text written with a font, measuring it 
+            only the first time.
+
+        Args:
+            text (str): The text to measure.
+            font (ImageFont.FreeTypeFont): The font used to write the text.
+
+        Returns:
+            tuple[int, int]: The width and the height of the text.
+        """
+        key = (text, id(font))
+        size = self._text_sizes.get(key)
+
+        if size is None:
+            if len(self._text_sizes) >= self.TEXT_SIZE_CACHE_LIMIT:
+                self._text_sizes.clear()
+
+            size = self._measure_draw.textsize(text, font=font)
+            self._text_sizes[key] = size
+
+        return size
+
+_render_context = None
+
+def get_render_context() -> RenderContext:
+    """Returns the RenderContext of the process, creating it the first time.
 
-    Args:
-        asin (str): The ASIN of the product.
-        url (str): The URL of the image to download.
+    Returns:
+        RenderContext: The shared render context.
     """
-    with open(f'archive/tmp/{asin}.jpg', 'wb') as handle:
-        response = requests.get(url, stream=True)
+    global _render_context
 
-        if not response.ok:
-            logger.warning(f'Error downloading image for ASIN {asin}.')
+    if _render_context is None:
+        _render_context = RenderContext()
+        logger.debug("Render context created.")
 
-        for block in response.iter_content(1024):
-            if not block: break
-            handle.write(block)
+    return _render_context
 
-def gen_img(
-        asin: str, 
-        price: float, 
-        currency: str, 
-        old_price: float, 
-        old_currency: str, 
-        discount: int,
-        img_number: int
-    ) -> None:
-    """Generates an image with product details overlaid 
-        on a background template.
+def original_img_download(asin: str, url: str) -> Union[bytes, None]:
+    """Download the image of a product from a URL and keep it in memory.
+
+    The download goes through the shared HTTP session (keep-alive, bounded 
+        timeouts and retry with backoff) and the conditional GET cache, so 
+        an image that didn't change since the last post is not downloaded 
+        again.
 
     Args:
         asin (str): The ASIN of the product.
-        price (float): The current price of the product.
-        currency (str): The currency of the price.
-        old_price (float): The previous price of the product, if available.
-        old_currency (str): The currency of the previous price.
-        discount (int): The discount percentage, if available.
-        img_number (int): The number identifying the background template image.
+        url (str): The URL of the image to download.
+
+    Returns:
+        Union[bytes, None]: The encoded image as returned by the server, or 
+            None if the download failed.
     """
-    new_price = format(price, '.2f').replace('.', ',')
-    old_price = format(old_price, '.2f').replace('.', ',')
+    try:
+        image_data = http_client.get_download_cache().get(url)
 
-    # Open the product image
-    im1 = Image.open(f'archive/tmp/{asin}.jpg')
+    except requests.RequestException as e:
+        logger.warning(f'Error downloading image for ASIN {asin}: {e}')
+        return None
 
-    # Take the size of the image
-    width, height = im1.size
+    if image_data is None:
+        logger.warning(f'Error downloading image for ASIN {asin}.')
+
+    return image_data
+
+def fit_size(
+        width: int, 
+        height: int, 
+        box: tuple[int, int],
+        template_size: Union[tuple[int, int], None] = None
+    ) -> tuple[int, int]:
+    """Computes the size of the product image on the template.
 
+    Images are enlarged by a scale factor that depends on their shape. If 
+        the result doesn't fit in the template it is reduced to fit in the 
+        target box, keeping the aspect ratio. The images that fit keep the 
+        size they always had.
+
+    Args:
+        width (int): The width of the original image.
+        height (int): The height of the original image.
+        box (tuple[int, int]): The maximum width and height of an image 
+            that doesn't fit in the template.
+        template_size (Union[tuple[int, int], None]): The size of the 
+            template. None reduces every image bigger than the box.
+
+    Returns:
+        tuple[int, int]: The new width and height.
+    """
     # Calculate the scaling factor based on the desired 
     # increase in width or height
     if width < 315 and height > 490:
@@ -94,12 +243,85 @@ def gen_img(
     new_width = width + scale_factor
     new_height = int(new_width / aspect_ratio)
 
+    if (template_size is not None and new_width <= template_size[0] and 
+        new_height <= template_size[1]):
+        return new_width, new_height
+
+    # Huge images would cover the whole template (and the prices)
+    reduce = min(box[0] / new_width, box[1] / new_height)
+    if reduce < 1:
+        new_width = int(new_width * reduce)
+        new_height = int(new_height * reduce)
+
+    return max(new_width, 1), max(new_height, 1)
+
+@metrics.timed("render", "Render of an offer image")
+def gen_img(
+        asin: str, 
+        image_data: bytes,
+        price: str, 
+        currency: str, 
+        old_price: Union[str, None], 
+        old_currency: str, 
+        discount: int,
+        img_number: int,
+        context: Union[RenderContext, None] = None
+    ) -> bytes:
+    """Generates an image with product details overlaid 
+        on a background template.
+
+    Args:
+        asin (str): The ASIN of the product.
+        image_data (bytes): The encoded original image of the product 
+            as returned by original_img_download.
+        price (str): The current price of the product already formatted 
+            for display (see PriceView.price_str).
+        currency (str): The currency symbol of the price.
+        old_price (Union[str, None]): The previous price of the product 
+            already formatted for display, if available.
+        old_currency (str): The currency symbol of the previous price.
+        discount (int): The discount percentage, if available.
+        img_number (int): The number identifying the background template image.
+        context (Union[RenderContext, None]): The templates and fonts to use. 
+            Defaults to the shared context of the process.
+
+    Returns:
+        bytes: The generated image encoded as JPEG.
+    """
+    if context is None:
+        context = get_render_context()
+
+    new_price = price
+
+    timings = {}
+    step_start = time.perf_counter()
+
+    # Open the product image (only the header is read here)
+    im1 = Image.open(io.BytesIO(image_data))
+
+    # Take the size of the image
+    width, height = im1.size
+    new_width, new_height = fit_size(width, height, 
+                                     context.target_box(img_number),
+                                     context.template(img_number).size)
+
+    # For big JPEGs let libjpeg downscale while decoding (by 1/2, 1/4 
+    # or 1/8) to a size still larger than the target one
+    if im1.format == 'JPEG' and (width > new_width or height > new_height):
+        im1.draft('RGB', (new_width, new_height))
+
+    im1.load()
+    timings['decode'] = time.perf_counter() - step_start
+    step_start = time.perf_counter()
+
     # Resize the image maintaining the aspect ratio
-    im1_resized = im1.resize((new_width, new_height), Image.ANTIALIAS)
+    im1_resized = im1.resize((new_width, new_height), RESAMPLE, 
+                             reducing_gap=REDUCING_GAP)
+    timings['resize'] = time.perf_counter() - step_start
+    step_start = time.perf_counter()
 
-    # Apre l'immagine di background
-    im3 = Image.open(f'src/media/template/backg-{img_number}.jpg')
-    # Open the background image
+    # Copy the already decoded background image
+    im3 = context.template(img_number)
     back_im = im3.copy()
 
     # Paste the resized product image over the copy of the background image
@@ -107,29 +329,19 @@ def gen_img(
     back_im.paste(im1_resized, (int((im3.size[0] - new_width) / 2), 
                                 int((im3.size[1] - new_height) / 2) - 20))
     
-    font_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 
-                             'media', 
-                             'font', 
-                             'Poppins', 
-                             'Poppins-Bold.ttf')
-
-    # Choose the font and size for the 2 texts
-    font1 = ImageFont.truetype(font_path, 70)
-    font2 = ImageFont.truetype(font_path, 180)
+    font1 = context.old_price_font
+    font2 = context.price_font
 
     #! Windows compatibility Fix as soon as possible
-    import platform
-    # Check if the platform is Windows
-    if platform.system() == "Windows":
-        font_path = "src/media/font/Poppins/Poppins-Bold.ttf"
+    if IS_WINDOWS:
         currency = "E"
         old_currency = "E"
     
     # For drawings and writing on pictures
     draw = ImageDraw.Draw(back_im)
     # Get the size of the writings to be inserted in the files
-    w1, h1 = draw.textsize(f"{old_price}{old_currency}", font=font1)
-    w2, h2 = draw.textsize(f"{new_price}{currency}", font=font2)
+    w1, h1 = context.text_size(f"{old_price}{old_currency}", font1)
+    w2, h2 = context.text_size(f"{new_price}{currency}", font2)
 
     if old_price is not None:
 
@@ -162,11 +374,26 @@ def gen_img(
                   fill=(50, 50, 50), 
                   font=font2)
 
-    # Save the new image asin-1.jpg
-    back_im.save(f'archive/img/{asin}-1.jpg', quality=95)
-    return f'archive/img/{asin}-1.jpg'
+    timings['compose'] = time.perf_counter() - step_start
+    step_start = time.perf_counter()
 
-def upload_img(asin: str, original_img_url: str, storage_key: str = "") -> list:
+    # Encode the new image in memory
+    buffer = io.BytesIO()
+    back_im.save(buffer, format='JPEG', quality=95)
+    timings['encode'] = time.perf_counter() - step_start
+
+    logger.debug(f"Image for ASIN {asin} ({width}x{height} -> "
+                 f"{new_width}x{new_height}) generated in " + 
+                 " - ".join(f"{step}: {seconds * 1000:.1f} ms" 
+                            for step, seconds in timings.items()))
+    return buffer.getvalue()
+
+def upload_img(
+        asin: str, 
+        original_img_url: str, 
+        storage_key: str = "",
+        image_data: Union[bytes, None] = None
+    ) -> list:
     """Uploads an image to the website for the storage and 
         returns the link for viewing.
 
@@ -174,6 +401,8 @@ def upload_img(asin: str, original_img_url: str, storage_key: str = "") -> list:
         asin (str): The ASIN of the product.
         original_img_url (str): The URL of the original image.
         storage_key (str): The storage key required for image upload.
+        image_data (Union[bytes, None]): The encoded generated image to 
+            upload, ready to be sent as the body of the request.
 
     Returns:
         list: Containing the status code and the URL of the uploaded image.
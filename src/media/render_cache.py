@@ -0,0 +1,359 @@
+# Copyright (C) by Pietrobon Andrea - All Rights Reserved
+#
+# This file is part of the project: TelegramBot-AmazonOffers
+# It can only be distributed from Andrea Pietrobon's official Github profile
+# The use of the project TelegramBot-AmazonOffers or of this file follow
+# the rules indicated in the LICENSE file.
+# The redistribution or sale of the files without the written consent
+# of the author is not authorized.
+#
+# Written by Pietrobon Andrea, Jan 2024
+# Official website <https://pietrobonandrea.com>
+# Github website <https://github.com/Piero24>
+
+# Standard library modules
+import os
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+from typing import Union
+
+# Importing internal modules
+from utils.log_manager import setup_logger
+
+# Setting up logger
+setup_logger()
+logger = logging.getLogger(__name__)
+
+CACHE_DB = "archive/render_cache.db"
+MAX_CACHE_BYTES = 256 * 1024 * 1024
+MAX_FILE_IDS = 20000
+
+class RenderedImage:
+    """A rendered offer image stored in the RenderCache.
+
+    Attributes:
+        key (str): The key of the image (see RenderCache.make_key).
+        asin (str): The ASIN of the product.
+        image_data (bytes): The rendered image encoded as JPEG.
+        upload_url (Union[str, None]): The URL returned by the upload of
+            the image, if it was uploaded.
+    """
+    def __init__(
+            self,
+            key: str,
+            asin: str,
+            image_data: bytes,
+            upload_url: Union[str, None] = None
+        ) -> None:
+        """Initializes a RenderedImage with the provided information.
+
+        Args:
+            key (str): The key of the image.
+            asin (str): The ASIN of the product.
+            image_data (bytes): The rendered image encoded as JPEG.
+            upload_url (Union[str, None]): The URL returned by the upload.
+        """
+        self.key = key
+        self.asin = asin
+        self.image_data = image_data
+        self.upload_url = upload_url
+
+    def __repr__(self) -> str:
+        """Returns a string representation of the RenderedImage object."""
+        return (
+            f"RenderedImage(key={self.key}, "
+            f"asin={self.asin}, "
+            f"size={len(self.image_data)}, "
+            f"upload_url={self.upload_url})"
+        )
+
+class RenderCache:
+    """Bounded cache of the rendered offer images with LRU eviction.
+
+    The images are saved in a SQLite database keyed by everything that
+        changes the rendered pixels: ASIN, hash of the original image URL,
+        prices, currencies and background template. Reposting the same
+        product at the same price reuses the stored JPEG and its upload
+        URL instead of downloading, rendering and uploading it again.
+
+    The same database also maps the hash of the content of an image to the 
+        Telegram file_id returned the first time it was sent as a photo, so 
+        the image is uploaded to Telegram only once.
+
+    Attributes:
+        db_path (str): The path of the SQLite database.
+        max_bytes (int): The maximum total size of the stored images. When
+            exceeded the least recently used images are deleted.
+        max_file_ids (int): The maximum number of Telegram file_id kept.
+
+    Methods:
+        make_key: Builds the key of a rendered image.
+        get: Returns a stored image, marking it as recently used.
+        put: Stores a rendered image.
+        set_upload_url: Records the upload URL of a stored image.
+        content_hash: Returns the hash of the content of an image.
+        get_file_id: Returns the Telegram file_id of an image.
+        set_file_id: Records the Telegram file_id of an image.
+    """
+    def __init__(
+            self,
+            db_path: str = CACHE_DB,
+            max_bytes: int = MAX_CACHE_BYTES,
+            max_file_ids: int = MAX_FILE_IDS
+        ) -> None:
+        """Opens (and if needed creates) the cache database.
+
+        Args:
+            db_path (str): The path of the SQLite database.
+            max_bytes (int): The maximum total size of the stored images.
+            max_file_ids (int): The maximum number of Telegram file_id kept.
+        """
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.max_file_ids = max_file_ids
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            '''CREATE TABLE IF NOT EXISTS rendered_images (
+                KEY TEXT PRIMARY KEY NOT NULL,
+                ASIN TEXT,
+                IMAGE BLOB,
+                SIZE INTEGER,
+                UPLOAD_URL TEXT,
+                LAST_USED REAL
+            );'''
+        )
+        self._conn.execute(
+            '''CREATE TABLE IF NOT EXISTS telegram_files (
+                CONTENT_HASH TEXT PRIMARY KEY NOT NULL,
+                FILE_ID TEXT,
+                LAST_USED REAL
+            );'''
+        )
+        self._conn.execute(
+            '''CREATE INDEX IF NOT EXISTS rendered_images_last_used
+               ON rendered_images (LAST_USED);'''
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(
+            asin: str,
+            image_url: str,
+            price: str,
+            currency: str,
+            old_price: Union[str, None],
+            old_currency: str,
+            img_number: int
+        ) -> str:
+        """Builds the key of a rendered image.
+
+        Args:
+            asin (str): The ASIN of the product.
+            image_url (str): The URL of the original product image.
+            price (str): The formatted current price.
+            currency (str): The currency symbol of the current price.
+            old_price (Union[str, None]): The formatted previous price.
+            old_currency (str): The currency symbol of the previous price.
+            img_number (int): The number of the background template.
+
+        Returns:
+            str: The key of the image.
+
+        Example:
+            key = RenderCache.make_key("B07WDCJ8VH",
+                "https://example.com/image.jpg", "99,99", "€", "129,99",
+                "€", 2)
+        """
+        url_hash = hashlib.sha1(image_url.encode("utf-8")).hexdigest()
+        raw_key = (f"{asin}|{url_hash}|{price}|{currency}|"
+                   f"{old_price}|{old_currency}|{img_number}")
+        return hashlib.sha1(raw_key.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Union[RenderedImage, None]:
+        """Returns a stored image, marking it as recently used.
+
+        Args:
+            key (str): The key of the image.
+
+        Returns:
+            Union[RenderedImage, None]: The stored image, or None if it
+                isn't in the cache.
+        """
+        with self._lock:
+            try:
+                row = self._conn.execute(
+                    '''SELECT ASIN, IMAGE, UPLOAD_URL
+                       FROM rendered_images WHERE KEY = ?''',
+                    (key,)).fetchone()
+
+                if row is None:
+                    return None
+
+                self._conn.execute(
+                    '''UPDATE rendered_images SET LAST_USED = ?
+                       WHERE KEY = ?''', (time.time(), key))
+                self._conn.commit()
+
+            except sqlite3.Error as e:
+                logger.error(f"Render cache error reading {key}: {e}")
+                return None
+
+        asin, image_data, upload_url = row
+        return RenderedImage(key, asin, image_data, upload_url)
+
+    def put(self, image: RenderedImage) -> None:
+        """Stores a rendered image, evicting the least recently used
+            images over max_bytes.
+
+        Args:
+            image (RenderedImage): The image to store.
+        """
+        with self._lock:
+            try:
+                self._conn.execute(
+                    '''INSERT OR REPLACE INTO rendered_images
+                       (KEY, ASIN, IMAGE, SIZE, UPLOAD_URL, LAST_USED)
+                       VALUES (?, ?, ?, ?, ?, ?)''',
+                    (image.key, image.asin, sqlite3.Binary(image.image_data),
+                     len(image.image_data), image.upload_url, time.time()))
+                self._evict()
+                self._conn.commit()
+
+            except sqlite3.Error as e:
+                logger.error(f"Render cache error storing {image.key}: {e}")
+
+    def set_upload_url(self, key: str, upload_url: str) -> None:
+        """Records the upload URL of a stored image.
+
+        Args:
+            key (str): The key of the image.
+            upload_url (str): The URL returned by the upload.
+        """
+        self._update(key, "UPLOAD_URL", upload_url)
+
+    @staticmethod
+    def content_hash(image_data: bytes) -> str:
+        """Returns the hash of the content of an image.
+
+        Args:
+            image_data (bytes): The encoded image.
+
+        Returns:
+            str: The SHA-256 of the image as an hexadecimal string.
+        """
+        return hashlib.sha256(image_data).hexdigest()
+
+    def get_file_id(self, content_hash: str) -> Union[str, None]:
+        """Returns the Telegram file_id of an image already sent as a photo.
+
+        Args:
+            content_hash (str): The hash of the content of the image 
+                (see content_hash).
+
+        Returns:
+            Union[str, None]: The file_id, or None if the image was 
+                never sent.
+        """
+        with self._lock:
+            try:
+                row = self._conn.execute(
+                    '''SELECT FILE_ID FROM telegram_files
+                       WHERE CONTENT_HASH = ?''', (content_hash,)).fetchone()
+
+                if row is None:
+                    return None
+
+                self._conn.execute(
+                    '''UPDATE telegram_files SET LAST_USED = ?
+                       WHERE CONTENT_HASH = ?''', (time.time(), content_hash))
+                self._conn.commit()
+
+            except sqlite3.Error as e:
+                logger.error(f"Render cache error reading the file_id of "
+                             f"{content_hash}: {e}")
+                return None
+
+        return row[0]
+
+    def set_file_id(self, content_hash: str, file_id: str) -> None:
+        """Records the Telegram file_id of an image sent as a photo.
+
+        Args:
+            content_hash (str): The hash of the content of the image.
+            file_id (str): The file_id returned by Telegram.
+        """
+        with self._lock:
+            try:
+                self._conn.execute(
+                    '''INSERT OR REPLACE INTO telegram_files
+                       (CONTENT_HASH, FILE_ID, LAST_USED) VALUES (?, ?, ?)''',
+                    (content_hash, file_id, time.time()))
+                self._conn.execute(
+                    '''DELETE FROM telegram_files WHERE CONTENT_HASH IN (
+                           SELECT CONTENT_HASH FROM telegram_files
+                           ORDER BY LAST_USED DESC LIMIT -1 OFFSET ?)''',
+                    (self.max_file_ids,))
+                self._conn.commit()
+
+            except sqlite3.Error as e:
+                logger.error(f"Render cache error storing the file_id of "
+                             f"{content_hash}: {e}")
+
+    def _update(self, key: str, column: str, value: str) -> None:
+        """Updates a column of a stored image."""
+        with self._lock:
+            try:
+                self._conn.execute(
+                    f'''UPDATE rendered_images SET {column} = ?
+                        WHERE KEY = ?''', (value, key))
+                self._conn.commit()
+
+            except sqlite3.Error as e:
+                logger.error(f"Render cache error updating {key}: {e}")
+
+    def _evict(self) -> None:
+        """Deletes the least recently used images until the total size is
+            under max_bytes. Must be called holding the lock."""
+        total = self._conn.execute(
+            "SELECT COALESCE(SUM(SIZE), 0) FROM rendered_images").fetchone()[0]
+
+        if total <= self.max_bytes:
+            return
+
+        evicted = 0
+        rows = self._conn.execute(
+            '''SELECT KEY, SIZE FROM rendered_images
+               ORDER BY LAST_USED ASC''').fetchall()
+
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM rendered_images WHERE KEY = ?",
+                               (key,))
+            total -= size
+            evicted += 1
+
+        logger.debug(f"Render cache: evicted {evicted} images.")
+
+_render_cache = None
+_render_cache_lock = threading.Lock()
+
+def get_render_cache() -> RenderCache:
+    """Returns the render cache of the process, creating it the first time.
+
+    Returns:
+        RenderCache: The shared render cache.
+    """
+    global _render_cache
+
+    with _render_cache_lock:
+        if _render_cache is None:
+            _render_cache = RenderCache()
+
+    return _render_cache
@@ -12,6 +12,8 @@
 # Github website <https://github.com/Piero24>
 
 from messages import message
+from messages import outbox
+from messages import channels
 from messages import communication_handler
 from messages.phrase_library import mix_phrase_list
 from messages.phrase_library import discount_65_more
@@ -0,0 +1,145 @@
+# Copyright (C) by Pietrobon Andrea - All Rights Reserved
+#
+# This file is part of the project: TelegramBot-AmazonOffers
+# It can only be distributed from Andrea Pietrobon's official Github profile
+# The use of the project TelegramBot-AmazonOffers or of this file follow
+# the rules indicated in the LICENSE file.
+# The redistribution or sale of the files without the written consent
+# of the author is not authorized.
+#
+# Written by Pietrobon Andrea, Jan 2024
+# Official website <https://pietrobonandrea.com>
+# Github website <https://github.com/Piero24>
+
+# Standard library modules
+import logging
+from typing import Union
+
+# Importing internal modules
+from utils.product import Product
+from utils.database_builder import CHANNEL_NAME
+from configs import api_keys, settings
+from utils.log_manager import setup_logger
+
+# Setting up logger
+setup_logger()
+logger = logging.getLogger(__name__)
+
+class Channel:
+    """A chat the offers are posted to, with its own filters and its own
+        history of the sent products.
+
+    Attributes:
+        chat_id (Union[int, str]): The id of the chat.
+        name (str): The name of the history of the sent products of the
+            chat ('' for the history of the main channel).
+        categories (list[str]): The categories accepted by the chat. Empty
+            means every category.
+        min_discount (int): The minimum discount percentage accepted.
+
+    Methods:
+        accepts: Checks if a product passes the filters of the chat.
+    """
+    def __init__(
+            self,
+            chat_id: Union[int, str],
+            name: str = '',
+            categories: Union[list[str], None] = None,
+            min_discount: int = 0
+        ) -> None:
+        """Initializes a Channel with the provided information.
+
+        Args:
+            chat_id (Union[int, str]): The id of the chat.
+            name (str): The name of the history of the chat.
+            categories (Union[list[str], None]): The accepted categories.
+            min_discount (int): The minimum discount percentage accepted.
+        """
+        self.chat_id = chat_id
+        self.name = name
+        self.categories = [category.lower() for category in categories or []]
+        self.min_discount = min_discount
+
+    def __repr__(self) -> str:
+        """Returns a string representation of the Channel object."""
+        return (
+            f"Channel(chat_id={self.chat_id}, "
+            f"name={self.name}, "
+            f"categories={self.categories}, "
+            f"min_discount={self.min_discount})"
+        )
+
+    def accepts(self, product: Product) -> bool:
+        """Checks if a product passes the filters of the chat.
+
+        A product matches a category if the category is its main category
+            or one of its sub categories (case insensitive).
+
+        Args:
+            product (Product): The product to check.
+
+        Returns:
+            bool: True if the product can be posted to the chat.
+        """
+        if (product.discount or 0) < self.min_discount:
+            return False
+
+        if not self.categories:
+            return True
+
+        product_categories = (product.main, product.first_sub,
+                              product.second_sub, product.third_sub,
+                              product.fourth_sub)
+
+        return any(category and category.lower() in self.categories
+                   for category in product_categories)
+
+def load_channels() -> list[Channel]:
+    """Returns the chats the offers are posted to.
+
+    The chats are read from CHANNELS in the settings. When it is missing or
+        empty the offers are posted only to the channel in the api keys,
+        without filters and with the original history.
+
+    A chat without a name uses the original history if it is the channel 
+        in the api keys. Chats with an invalid name (it becomes a directory) 
+        or with the name of a previous chat are skipped.
+
+    Returns:
+        list[Channel]: The chats.
+    """
+    configured = getattr(settings, "CHANNELS", None)
+
+    if not configured:
+        return [Channel(api_keys.CHANNEL_ID)]
+
+    channels = []
+    names = set()
+    for index, entry in enumerate(configured):
+        try:
+            main = str(entry["chat_id"]) == str(api_keys.CHANNEL_ID)
+            channel = Channel(entry["chat_id"],
+                              entry.get("name", 
+                                        '' if main else f"channel_{index}"),
+                              entry.get("categories"),
+                              entry.get("min_discount", 0))
+
+        except (KeyError, TypeError, AttributeError) as e:
+            logger.error(f"Invalid channel configuration {entry}: {e}")
+            continue
+
+        if (not isinstance(channel.name, str) or 
+            not CHANNEL_NAME.fullmatch(channel.name)):
+            logger.error(f"Invalid channel name {channel.name!r} of "
+                         f"{entry}: only letters, digits, '_' and '-'.")
+            continue
+
+        if channel.name in names:
+            logger.error(f"Duplicate channel name {channel.name!r} of "
+                         f"{entry}: the channel is skipped.")
+            continue
+
+        names.add(channel.name)
+        channels.append(channel)
+
+    return channels
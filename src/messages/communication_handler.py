@@ -14,29 +14,64 @@
 # Imported modules
 import telebot
 import logging
+from typing import Callable, Union
 
 # Imported modules
 from utils.product import Product
 from configs import api_keys, settings
 from messages.message import Message
+from messages.outbox import Outbox, OutboxStore, Post
+from media.render_cache import get_render_cache
+from utils import metrics
 from utils.log_manager import setup_logger
 
 # Setting up logger
 setup_logger()
 logger = logging.getLogger(__name__)
 
-def single_message(bot: telebot.TeleBot, product: Product) -> bool:
-    """Sends a single message about a product to a channel.
+# Maximum length of the caption of a photo accepted by Telegram
+CAPTION_LIMIT = 1024
+
+_outbox_store = None
+
+def build_post(
+        product: Product, 
+        chat_id: Union[int, str, None] = None
+    ) -> Union[Post, None]:
+    """Creates the post of a product: message, html text and markup.
 
     Args:
-        bot (telebot.TeleBot): The Telegram bot instance.
-        product (Product): The product to send a message about.
+        product (Product): The product to create the post for.
+        chat_id (Union[int, str, None]): The chat the post is sent to. 
+            Defaults to the channel in the api keys.
 
     Returns:
-        bool: True if the message was sent successfully, False otherwise.
+        Union[Post, None]: The post ready to be sent, or None if an error 
+            occurred.
+    """
+    if chat_id is None:
+        chat_id = api_keys.CHANNEL_ID
+
+    posts = build_posts(product, [chat_id])
+    return posts[0] if posts else None
+
+def build_posts(
+        product: Product, 
+        chat_ids: list[Union[int, str]]
+    ) -> list[Post]:
+    """Creates the posts of a product for many chats. The message, the 
+        image, the html text and the markup are built only once and shared 
+        by all the posts.
+
+    Args:
+        product (Product): The product to create the posts for.
+        chat_ids (list[Union[int, str]]): The chats the posts are sent to.
+
+    Returns:
+        list[Post]: One post for each chat, or an empty list if an error 
+            occurred.
     """
     PARTNER_TAG = api_keys.PARTNER_TAG
-    CHANNEL_ID = api_keys.CHANNEL_ID
     HIGH_QUALITY_IMAGE = settings.HIGH_QUALITY_IMAGE
 
     try:
@@ -46,15 +81,22 @@ def single_message(bot: telebot.TeleBot, product: Product) -> bool:
             logging.error(f"An error occurred while extracting the message "
                           f"information from the product for the "
                           f"asin {product.asin}: {e}")
-            return False
+            return []
     
+    photo_mode = HIGH_QUALITY_IMAGE and mess.image_data is not None
+
     try:
-        html = Message.html_message(mess)
+        # In photo mode the image is the post itself, no link preview needed
+        html = Message.html_message(mess, with_image_link=not photo_mode)
+
+        if photo_mode and len(html) > CAPTION_LIMIT:
+            photo_mode = False
+            html = Message.html_message(mess)
 
     except Exception as e:
             logging.error(f"An error occurred while creating the html message "
                           f"for the asin {product.asin}: {e}")
-            return False
+            return []
     
     try:
         markup = Message.markup_generator(mess, PARTNER_TAG)
@@ -62,20 +104,51 @@ def single_message(bot: telebot.TeleBot, product: Product) -> bool:
     except Exception as e:
             logging.error(f"An error occurred while creating the markup "
                           f"object for the asin {product.asin}: {e}")
-            return False
+            return []
+
+    image_data = mess.image_data if photo_mode else None
+    return [Post(product.asin, chat_id, html, markup, image_data, product)
+            for chat_id in chat_ids]
+
+@metrics.timed("telegram_send", "Send of a post to Telegram")
+def send_post(bot: telebot.TeleBot, post: Post) -> telebot.types.Message:
+    """Sends a post to its chat, as a photo if it has an image.
+
+    Args:
+        bot (telebot.TeleBot): The Telegram bot instance.
+        post (Post): The post to send.
+
+    Returns:
+        telebot.types.Message: The message sent.
+
+    Raises:
+        telebot.apihelper.ApiTelegramException: If Telegram refuses the post.
+    """
+    if post.image_data is not None:
+        return send_photo_post(bot, post.chat_id, post.image_data, 
+                               post.html, post.markup)
+    
+    return bot.send_message(post.chat_id, post.html, parse_mode = 'html',
+                            reply_markup=post.markup)
+
+@metrics.timed("single_message", "Build and send of a single message")
+def single_message(bot: telebot.TeleBot, product: Product) -> bool:
+    """Sends a single message about a product to a channel.
+
+    Args:
+        bot (telebot.TeleBot): The Telegram bot instance.
+        product (Product): The product to send a message about.
+
+    Returns:
+        bool: True if the message was sent successfully, False otherwise.
+    """
+    post = build_post(product)
+
+    if post is None:
+        return False
 
     try:
-        # if HIGH_QUALITY_IMAGE:
-        #     img = open('/tmp/photo.png', 'rb')
-        #     bot.send_photo(CHANNEL_ID, img)
-        #     bot.send_photo(CHANNEL_ID, html, parse_mode = 'html',
-        #                  reply_markup=markup)
-        
-        # else:
-        #     bot.send_message(CHANNEL_ID, html, parse_mode = 'html',
-        #                  reply_markup=markup)
-        bot.send_message(CHANNEL_ID, html, parse_mode = 'html',
-                         reply_markup=markup)
+        send_post(bot, post)
         
     except Exception as e:
             logging.error(f"Error when sending the message for "
@@ -84,3 +157,87 @@ def single_message(bot: telebot.TeleBot, product: Product) -> bool:
     
     logging.info(f"Message send successfully for the asin {product.asin}")
     return True
+
+def create_outbox(
+        bot: telebot.TeleBot, 
+        on_result: Callable[[Post, bool], None]
+    ) -> Outbox:
+    """Creates an outbox that sends the posts with the bot in the 
+        background, within the rate limits of Telegram. The posts are saved 
+        in the durable outbox store until they are delivered.
+
+    Args:
+        bot (telebot.TeleBot): The Telegram bot instance.
+        on_result (Callable[[Post, bool], None]): Called with each post and 
+            True if it was delivered, False otherwise.
+
+    Returns:
+        Outbox: The outbox.
+    """
+    return Outbox(lambda post: send_post(bot, post), 
+                  on_result, 
+                  per_minute=getattr(settings, "TELEGRAM_MESSAGES_PER_MINUTE", 
+                                     20),
+                  store=get_outbox_store())
+
+def get_outbox_store() -> OutboxStore:
+    """Returns the durable outbox of the process, creating it the first time.
+
+    Returns:
+        OutboxStore: The shared outbox store.
+    """
+    global _outbox_store
+
+    if _outbox_store is None:
+        _outbox_store = OutboxStore(
+            expiry=getattr(settings, "OUTBOX_EXPIRY_HOURS", 6) * 3600)
+    
+    return _outbox_store
+
+def send_photo_post(
+        bot: telebot.TeleBot, 
+        chat_id: Union[int, str], 
+        image_data: bytes, 
+        caption: str, 
+        markup: telebot.types.InlineKeyboardMarkup
+    ) -> telebot.types.Message:
+    """Sends an image with its caption as a photo post, uploading the image 
+        to Telegram only the first time.
+
+    The file_id returned by the first upload is saved in the render cache 
+        keyed by the hash of the content of the image. When the same image 
+        is sent again (to another channel or as a repost) the file_id is 
+        sent instead of the image.
+
+    Args:
+        bot (telebot.TeleBot): The Telegram bot instance.
+        chat_id (Union[int, str]): The chat to send the photo to.
+        image_data (bytes): The image encoded as JPEG.
+        caption (str): The HTML caption of the photo.
+        markup (telebot.types.InlineKeyboardMarkup): The buttons of the post.
+
+    Returns:
+        telebot.types.Message: The message sent.
+    """
+    render_cache = get_render_cache()
+    content_hash = render_cache.content_hash(image_data)
+    file_id = render_cache.get_file_id(content_hash)
+
+    if file_id is not None:
+        try:
+            return bot.send_photo(chat_id, file_id, caption=caption, 
+                                  parse_mode='html', reply_markup=markup)
+        
+        except telebot.apihelper.ApiTelegramException as e:
+            # The file_id is no longer valid, upload the image again
+            if e.error_code != 400:
+                raise
+            logging.warning(f"Telegram file_id {file_id} rejected: {e}")
+
+    sent = bot.send_photo(chat_id, image_data, caption=caption, 
+                          parse_mode='html', reply_markup=markup)
+    
+    if sent.photo:
+        # The last size is the biggest one, the one uploaded
+        render_cache.set_file_id(content_hash, sent.photo[-1].file_id)
+    return sent
@@ -13,16 +13,20 @@
 
 # Imported modules
 import re
-import os
 import random
 import logging
-from typing import Union
+from typing import Optional, Union
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
 
 # External libraries
 import flag 
 
 # Imported modules
 from media import image_generator as image_gen
+from media.render_cache import RenderedImage, get_render_cache
+from media.batch_renderer import RenderJob, render_batch
+from utils import http_client
 from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
 from utils.product import Product
 from messages.phrase_library import mix_phrase_list
@@ -34,6 +38,89 @@ from utils.log_manager import setup_logger
 setup_logger()
 logger = logging.getLogger(__name__)
 
+@dataclass(frozen=True)
+class PriceView:
+    """Immutable view of the prices of a product, computed once when the 
+        message is created and shared by the html message, the markup and 
+        the image generator.
+
+    Attributes:
+        price (Union[int, float]): The current price of the product.
+        old_price (Union[int, float]): The previous price of the product.
+        discount (Union[int, float]): The amount saved (old_price - price).
+        discount_percentage (Union[int, float]): The discount percentage 
+            of the product.
+        currency (tuple[Union[str, None], Union[str, None]]): The currency 
+            code and symbol for the current price. Example: ("USD", "$").
+        old_currency (tuple[Union[str, None], Union[str, None]]): The currency 
+            code and symbol for the previous price.
+        price_str (str): The current price formatted for display. 
+            Example: "99,99".
+        old_price_str (str): The previous price formatted for display.
+        discount_str (str): The amount saved formatted for display.
+    """
+    price: Union[int, float]
+    old_price: Union[int, float]
+    discount: Union[int, float]
+    discount_percentage: Union[int, float]
+    currency: tuple[Union[str, None], Union[str, None]]
+    old_currency: tuple[Union[str, None], Union[str, None]]
+    price_str: str
+    old_price_str: str
+    discount_str: str
+
+    @property
+    def symbol(self) -> Union[str, None]:
+        """Returns the currency symbol of the current price."""
+        return self.currency[1]
+
+    @property
+    def old_symbol(self) -> Union[str, None]:
+        """Returns the currency symbol of the previous price."""
+        return self.old_currency[1]
+
+    @classmethod
+    def from_values(
+        cls,
+        asin: str,
+        price: Union[int, float],
+        currency: tuple[Union[str, None], Union[str, None]],
+        old_price: Union[int, float],
+        old_currency: tuple[Union[str, None], Union[str, None]],
+        discount_percentage: Union[int, float]
+    ) -> "PriceView":
+        """Creates a PriceView from already processed prices and currencies.
+
+        Args:
+            asin (str): The ASIN of the product.
+            price (Union[int, float]): The processed current price.
+            currency (tuple[Union[str, None], Union[str, None]]): The 
+                processed currency of the current price.
+            old_price (Union[int, float]): The processed previous price.
+            old_currency (tuple[Union[str, None], Union[str, None]]): The 
+                processed currency of the previous price.
+            discount_percentage (Union[int, float]): The discount percentage.
+
+        Returns:
+            PriceView: The view with numeric values and formatted strings.
+
+        Example:
+            view = PriceView.from_values("example_asin", 99.99, ("EUR", "€"), 
+                                         129.99, ("EUR", "€"), 23)
+            # Output: view.price_str == "99,99", view.discount_str == "30,00"
+        """
+        discount = Message.process_discount(asin, price, old_price)
+
+        return cls(price=price, 
+                   old_price=old_price, 
+                   discount=discount, 
+                   discount_percentage=discount_percentage, 
+                   currency=currency, 
+                   old_currency=old_currency, 
+                   price_str=format_price(price), 
+                   old_price_str=format_price(old_price), 
+                   discount_str=format_price(discount))
+
 class Message:
     """Represents a message containing information about a product.
 
@@ -55,6 +142,9 @@ class Message:
         discount_percentage (Union[int, float]): The discount percentage 
             of the product.
         image_url (str): The URL of the product image.
+        price_view (PriceView): The precomputed prices, currencies and 
+            formatted strings of the product.
+        image_data (Union[bytes, None]): The generated image encoded as JPEG.
 
     Methods:
         __init__: Initializes a Message object with provided information.
@@ -73,10 +163,13 @@ class Message:
         process_discount_percentage: Processes the discount percentage 
             for a given ASIN.
         process_discount: Processes the discount amount for a given ASIN.
+        price_view_generator: Builds the PriceView of a Product.
         title_generator: Generates bullet points from a product title.
         bp_generator: Generates bullet points for a Message from the 
             title and description list.
         image_url_generator: Generates a more visually appealing product image.
+        template_number: Chooses the background template of the image.
+        prerender_images: Renders in parallel the images of many products.
         marketplace_emoji: Generates an emoji representation for a marketplace.
         marketplace_location: Extracts the country flag for a given marketplace.
         coupon_generator: Placeholder method for future coupon generation.
@@ -95,6 +188,8 @@ class Message:
             old_currency: tuple[Union[str, None], Union[str, None]],
             discount_percentage: Union[int, float],
             image_url: str,
+            price_view: Optional[PriceView] = None,
+            image_data: Optional[bytes] = None,
         ) -> None:
         """Initializes a Message object with the provided information.
 
@@ -118,6 +213,10 @@ class Message:
             discount_percentage (Union[int, float]): The discount percentage 
                 of the product.
             image_url (str): The URL of the product image.
+            price_view (PriceView, optional): The precomputed prices of the 
+                product. If not provided it is built from the other values.
+            image_data (bytes, optional): The generated image encoded as 
+                JPEG, kept in memory to be sent directly to Telegram.
 
         Returns:
             None: This method does not return anything.
@@ -153,6 +252,13 @@ class Message:
         self.old_currency = old_currency
         self.discount_percentage = discount_percentage
         self.image_url = image_url
+
+        if price_view is None:
+            price_view = PriceView.from_values(asin, price, currency, 
+                                               old_price, old_currency, 
+                                               discount_percentage)
+        self.price_view = price_view
+        self.image_data = image_data
     
     def __repr__(self) -> str:
         """Returns a string representation of the Message object that can 
@@ -277,7 +383,7 @@ class Message:
                                 url=self.url),)
         return markup
     
-    def html_message(self) -> str:
+    def html_message(self, with_image_link: bool = True) -> str:
         """Generate an HTML-formatted message for displaying product information
 
         The HTML message includes the product title, an optional emoji title 
@@ -285,6 +391,10 @@ class Message:
             bullet points of product features, marketplace emoji, price 
             information, and a link to open the product page on Amazon.
 
+        Args:
+            with_image_link (bool): If False the invisible image URL is left 
+                out, as when the message is the caption of the image itself.
+
         Returns:
             str: HTML-formatted message.
         """
@@ -297,8 +407,10 @@ class Message:
         else:
             emj_title = random.choice(["🆘", "🔥"])
 
-        html = f"{emj_title} <b>{self.title}</b> {emj_title}\n\n" \
-                f"{self.invisible_image_url}"
+        html = f"{emj_title} <b>{self.title}</b> {emj_title}\n\n"
+
+        if with_image_link:
+            html += self.invisible_image_url
         
         for index in self.bullet_points:
             if index is not None:
@@ -307,23 +419,18 @@ class Message:
         
         html += Message.marketplace_emoji(self.marketplace[1])
 
+        view = self.price_view
+
         if self.discount_percentage != 0:
-            discount_price = Message.process_discount(self.asin, self.price, 
-                                                      self.old_price)
-            
-            discount_price_str = format(discount_price,'.2f').replace('.', ',')
-            price_str = format(self.price,'.2f').replace('.', ',')
-            old_price_str = format(self.old_price,'.2f').replace('.', ',')
-            
-            html += f"💶 <b>{price_str}" \
-            f"{self.currency[1]}</b> invece di " \
-            f"{old_price_str}{self.currency[1]}\n" \
-            f"📈 <b>Risparmi {discount_price_str}" \
-            f"{self.old_currency[1]} ({self.discount_percentage}%) </b>"
+            html += f"💶 <b>{view.price_str}" \
+            f"{view.symbol}</b> invece di " \
+            f"{view.old_price_str}{view.symbol}\n" \
+            f"📈 <b>Risparmi {view.discount_str}" \
+            f"{view.old_symbol} ({self.discount_percentage}%) </b>"
 
         else:
-            html += f"💶 Il prezzo è di: <b>{price_str}" \
-            f"{self.currency[1]}</b>"
+            html += f"💶 Il prezzo è di: <b>{view.price_str}" \
+            f"{view.symbol}</b>"
 
         html += f"\n\n\n➡️ <a href='{self.url}'>" \
         "<b>Apri su Amazon</b></a>\n\n"
@@ -359,17 +466,8 @@ class Message:
         marketplace = Message.marketplace_location(product.asin, 
                                                    product.marketplace)
         
-        price = Message.process_price(product.asin, product.price)
-        currency = Message.process_currency(product.asin, 
-                                            product.currency, 
-                                            product.old_currency)
-
-        old_price = Message.process_price(product.asin, product.old_price)
-        old_currency = Message.process_currency(product.asin, 
-                                                product.old_currency, 
-                                                product.currency)
-        
-        discount_percentage = product.discount
+        price_view = Message.price_view_generator(product)
+        discount_percentage = price_view.discount_percentage
 
         bullet_points = Message.bp_generator(
             product.bullet_points, 
@@ -378,19 +476,16 @@ class Message:
             product.brand, 
             discount_percentage)
         
-        image_url = Message.image_url_generator(
+        image_url, image_data = Message.image_url_generator(
             product.asin,
             product.image_link,
             product.brand,
-            price,
-            currency[1],
-            old_price,
-            old_currency[1],
-            discount_percentage)
+            price_view)
         
-        return cls(asin, brand, title, bullet_points, url, marketplace, price, 
-                   currency, old_price, old_currency, discount_percentage, 
-                   image_url)
+        return cls(asin, brand, title, bullet_points, url, marketplace, 
+                   price_view.price, price_view.currency, 
+                   price_view.old_price, price_view.old_currency, 
+                   discount_percentage, image_url, price_view, image_data)
     
     @staticmethod
     def process_price(
@@ -512,6 +607,42 @@ class Message:
             return -1
         return discount
 
+    @staticmethod
+    def price_view_generator(product: Product) -> PriceView:
+        """Builds the PriceView of a Product processing each price and 
+            currency only once.
+
+        The currency of the previous price falls back to the currency of the 
+            current price (and vice versa), so when the two match the 
+            processed value is reused instead of being computed again.
+
+        Args:
+            product (Product): The product to extract the prices from.
+
+        Returns:
+            PriceView: The precomputed prices of the product.
+
+        Example:
+            price_view = Message.price_view_generator(example_product)
+        """
+        asin = product.asin
+        price = Message.process_price(asin, product.price)
+        old_price = Message.process_price(asin, product.old_price)
+
+        currency = Message.process_currency(asin, product.currency, 
+                                            product.old_currency)
+        
+        if ((currency is not None) and 
+            (product.old_currency in (None, "", currency[0]))):
+            old_currency = currency
+        else:
+            old_currency = Message.process_currency(asin, 
+                                                    product.old_currency, 
+                                                    product.currency)
+
+        return PriceView.from_values(asin, price, currency, old_price, 
+                                     old_currency, product.discount)
+
     @staticmethod
     def title_generator(
         title: str, 
@@ -655,55 +786,178 @@ class Message:
         asin: str, 
         url: str, 
         brand: str,
-        new_price: float, 
-        new_currency: str, 
-        old_price: float, 
-        old_currency: str, 
-        discount_percentage: int
-    ) -> str:
+        price_view: PriceView
+    ) -> tuple[str, Union[bytes, None]]:
         """Generates an a more pretty image of the product for a better 
             background and some price information. When the image it's 
             generated it upload the image on a cloud website and return
             the link of the image.
 
+        The whole pipeline works on in-memory buffers: the downloaded bytes 
+            go straight to PIL and the encoded result goes straight to the 
+            upload, so no temporary file is written on disk. The result is 
+            saved in the render cache, so reposting the same product at the 
+            same price reuses the image and its upload URL.
+
         Args:
             asin (str): The ASIN of the product.
             url (str): The URL of the product image.
             brand (str): The brand of the product.
-            new_price (float): The current price of the product.
-            new_currency (str): The currency of the current price.
-            old_price (float): The previous price of the product.
-            old_currency (str): The currency of the previous price.
-            discount_percentage (int): The discount percentage of the product.
+            price_view (PriceView): The precomputed prices of the product.
 
         Returns:
-            str: The URL of the generated image.
+            tuple[str, Union[bytes, None]]: The URL of the generated image and 
+                the generated image encoded as JPEG. If the original image 
+                can't be downloaded the original URL and None are returned.
 
         Example:
-            image_url = Message.image_url_generator("AW21ZX34QD", 
-                "https://example.com/image.jpg", "Example Brand", 
-                20.00, "USD", 25.00, "USD", 20)
-            # Output: "https://example.com/generated_image.jpg"
+            image_url, image_data = Message.image_url_generator("AW21ZX34QD", 
+                "https://example.com/image.jpg", "Example Brand", price_view)
+            # Output: ("https://example.com/generated_image.jpg", b"...")
         Note:
             # TODO: Add exception
         """
-        image_gen.original_img_download(asin, url)
+        discount_percentage = price_view.discount_percentage
+        backg_img = Message.template_number(discount_percentage)
+
+        render_cache = get_render_cache()
+        key = render_cache.make_key(asin, url, 
+                                    price_view.price_str, 
+                                    price_view.symbol, 
+                                    price_view.old_price_str, 
+                                    price_view.old_symbol, 
+                                    backg_img)
+        cached = render_cache.get(key)
+
+        if (cached is not None) and (cached.upload_url is not None):
+            logging.debug(f"Image for the asin {asin} served from "
+                          f"the render cache.")
+            return cached.upload_url, cached.image_data
+
+        if cached is not None:
+            image_data = cached.image_data
 
-        if (discount_percentage != 0) and (discount_percentage > 55):
-            backg_img = 3
         else:
-            backg_img = 2
+            original_data = image_gen.original_img_download(asin, url)
 
-        image_gen.gen_img(asin, new_price, new_currency, old_price, 
-                          old_currency, discount_percentage, backg_img)  
+            if original_data is None:
+                return url, None
 
-        new_img_upload_response = image_gen.upload_img(asin, url)
+            image_data = image_gen.gen_img(asin, original_data, 
+                                           price_view.price_str, 
+                                           price_view.symbol, 
+                                           price_view.old_price_str, 
+                                           price_view.old_symbol, 
+                                           discount_percentage, backg_img)  
+            render_cache.put(RenderedImage(key, asin, image_data))
+
+        new_img_upload_response = image_gen.upload_img(
+            asin, url, image_data=image_data)
         if new_img_upload_response[0] != 200:
-            new_img_upload_response = image_gen.upload_img(asin, url)
+            new_img_upload_response = image_gen.upload_img(
+                asin, url, image_data=image_data)
+        
+        if new_img_upload_response[0] == 200:
+            render_cache.set_upload_url(key, new_img_upload_response[1])
+            
+        return new_img_upload_response[1], image_data
+
+    @staticmethod
+    def template_number(discount_percentage: int) -> int:
+        """Chooses the background template of the image of a product.
+
+        Args:
+            discount_percentage (int): The discount percentage of the product.
+
+        Returns:
+            int: The number identifying the background template image.
+
+        Example:
+            img_number = Message.template_number(60)
+            # Output: 3
+        """
+        if (discount_percentage != 0) and (discount_percentage > 55):
+            return 3
+        return 2
+
+    @staticmethod
+    def prerender_images(products: list[Product], workers: int = 0) -> int:
+        """Renders in parallel the images of many products and saves them in 
+            the render cache.
+
+        The original images are downloaded concurrently and then composed 
+            on a process pool (see batch_renderer.render_batch). When the 
+            messages are created afterwards image_url_generator finds the 
+            images ready in the render cache, so posting becomes a quick 
+            loop over ready assets.
+
+        Args:
+            products (list[Product]): The products to render.
+            workers (int): The number of render processes. 0 or less means 
+                one worker per CPU core.
+
+        Returns:
+            int: The number of images rendered.
+
+        Example:
+            rendered = Message.prerender_images(selected_products, 4)
+        """
+        render_cache = get_render_cache()
+        pending = []
+
+        for product in products:
+            try:
+                price_view = Message.price_view_generator(product)
+                backg_img = Message.template_number(
+                    price_view.discount_percentage)
+                key = render_cache.make_key(product.asin, 
+                                            product.image_link, 
+                                            price_view.price_str, 
+                                            price_view.symbol, 
+                                            price_view.old_price_str, 
+                                            price_view.old_symbol, 
+                                            backg_img)
             
-        os.remove(f"archive/tmp/{asin}.jpg")
-        os.remove(f"archive/img/{asin}-1.jpg")
-        return new_img_upload_response[1]
+            except Exception as e:
+                logging.error(f"An error occurred while preparing the image "
+                              f"of the asin {product.asin}: {e}")
+                continue
+
+            if render_cache.get(key) is None:
+                pending.append((key, product, price_view, backg_img))
+
+        if not pending:
+            return 0
+
+        with ThreadPoolExecutor(max_workers=http_client.POOL_SIZE) as pool:
+            originals = list(pool.map(
+                lambda item: image_gen.original_img_download(
+                    item[1].asin, item[1].image_link), 
+                pending))
+
+        jobs = []
+        for (key, product, price_view, backg_img), data in zip(pending, 
+                                                                originals):
+            if data is None:
+                continue
+
+            jobs.append(RenderJob(key, product.asin, data, 
+                                  price_view.price_str, 
+                                  price_view.symbol, 
+                                  price_view.old_price_str, 
+                                  price_view.old_symbol, 
+                                  price_view.discount_percentage, 
+                                  backg_img))
+
+        rendered = render_batch(jobs, workers)
+
+        for job in jobs:
+            if job.key in rendered:
+                render_cache.put(RenderedImage(job.key, job.asin, 
+                                               rendered[job.key]))
+        
+        logging.info(f"Prerendered {len(rendered)}/{len(products)} images.")
+        return len(rendered)
 
     @staticmethod
     def marketplace_emoji(marketplace_flag: str) -> str:
@@ -780,6 +1034,21 @@ def remove_start_end_space(phrase: str) -> str:
     if phrase[-1] == ' ': phrase = phrase[:-1]
     return phrase
 
+def format_price(price: Union[int, float]) -> str:
+    """Formats a price with two decimals and a comma as decimal separator.
+
+    Args:
+        price (Union[int, float]): The price to format.
+
+    Returns:
+        str: The formatted price.
+
+    Example:
+        formatted_price = format_price(99.9)
+        # Output: "99,90"
+    """
+    return format(price, '.2f').replace('.', ',')
+
 def extract_capitalized_letters(text: str) -> Union[str, None]:
     """Extracts capitalized letters from a string.
 
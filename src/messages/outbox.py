@@ -0,0 +1,579 @@
+# Copyright (C) by Pietrobon Andrea - All Rights Reserved
+#
+# This file is part of the project: TelegramBot-AmazonOffers
+# It can only be distributed from Andrea Pietrobon's official Github profile
+# The use of the project TelegramBot-AmazonOffers or of this file follow
+# the rules indicated in the LICENSE file.
+# The redistribution or sale of the files without the written consent
+# of the author is not authorized.
+#
+# Written by Pietrobon Andrea, Jan 2024
+# Official website <https://pietrobonandrea.com>
+# Github website <https://github.com/Piero24>
+
+# Standard library modules
+import os
+import time
+import json
+import queue
+import logging
+import sqlite3
+import threading
+from typing import Any, Callable, Union
+
+# External libraries
+import telebot
+import requests
+
+# Importing internal modules
+from utils import metrics
+from utils.log_manager import setup_logger
+
+# Setting up logger
+setup_logger()
+logger = logging.getLogger(__name__)
+
+queue_depth = metrics.gauge("outbox_queue_depth", 
+                            "Posts waiting in the outbox")
+posts_delivered = metrics.counter("outbox_delivered_total", 
+                                  "Posts delivered by the outbox")
+posts_failed = metrics.counter("outbox_failed_total", 
+                               "Posts the outbox failed to deliver")
+
+class Post:
+    """A message ready to be sent to a chat.
+
+    Attributes:
+        asin (str): The ASIN of the product of the post.
+        chat_id (Union[int, str]): The chat the post is sent to.
+        html (str): The HTML text (or caption) of the post.
+        markup (Union[telebot.types.InlineKeyboardMarkup, None]): The
+            buttons of the post.
+        image_data (Union[bytes, None]): The image of the post. If present
+            the post is sent as a photo with the html as caption.
+        product (Any): The product of the post, handed back with the
+            delivery result.
+        post_id (Union[int, None]): The id of the post in the OutboxStore,
+            None if it isn't stored.
+        attempts (int): The number of send attempts made so far.
+        channel (Union[str, None]): The name of the history of the sent 
+            products of the chat, None if unknown.
+        error (Union[Exception, None]): The error of the last failed 
+            attempt, None if there was none.
+    """
+    def __init__(
+            self,
+            asin: str,
+            chat_id: Union[int, str],
+            html: str,
+            markup: Union[telebot.types.InlineKeyboardMarkup, None] = None,
+            image_data: Union[bytes, None] = None,
+            product: Any = None,
+            post_id: Union[int, None] = None,
+            attempts: int = 0,
+            channel: Union[str, None] = None
+        ) -> None:
+        """Initializes a Post with the provided information.
+
+        Args:
+            asin (str): The ASIN of the product of the post.
+            chat_id (Union[int, str]): The chat the post is sent to.
+            html (str): The HTML text (or caption) of the post.
+            markup (Union[telebot.types.InlineKeyboardMarkup, None]): The
+                buttons of the post.
+            image_data (Union[bytes, None]): The image of the post.
+            product (Any): The product of the post.
+            post_id (Union[int, None]): The id of the post in the 
+                OutboxStore.
+            attempts (int): The number of send attempts made so far.
+            channel (Union[str, None]): The name of the history of the 
+                sent products of the chat.
+        """
+        self.asin = asin
+        self.chat_id = chat_id
+        self.html = html
+        self.markup = markup
+        self.image_data = image_data
+        self.product = product
+        self.post_id = post_id
+        self.attempts = attempts
+        self.channel = channel
+        self.error = None
+
+    def __repr__(self) -> str:
+        """Returns a string representation of the Post object."""
+        return (
+            f"Post(asin={self.asin}, "
+            f"chat_id={self.chat_id}, "
+            f"photo={self.image_data is not None})"
+        )
+
+class TokenBucket:
+    """Thread-safe token bucket rate limiter.
+
+    Tokens are added continuously at `rate` per second up to `capacity`.
+        Each send takes one token, waiting if none is available.
+
+    Attributes:
+        rate (float): The number of tokens added per second.
+        capacity (float): The maximum number of tokens (the allowed burst).
+
+    Methods:
+        acquire: Takes a token, waiting until one is available.
+        pause: Blocks the bucket for a number of seconds.
+    """
+    def __init__(self, rate: float, capacity: float) -> None:
+        """Initializes a full bucket.
+
+        Args:
+            rate (float): The number of tokens added per second.
+            capacity (float): The maximum number of tokens.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Takes a token (possibly going in debt) and returns how many
+            seconds the caller must wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens +
+                               (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+
+            wait = 0.0
+            if self._tokens < 0:
+                wait = -self._tokens / self.rate
+            return max(wait, self._paused_until - now)
+
+    def acquire(self, stop: Union[threading.Event, None] = None) -> bool:
+        """Takes a token, waiting until one is available.
+
+        Args:
+            stop (Union[threading.Event, None]): If set while waiting the
+                wait is interrupted.
+
+        Returns:
+            bool: True if the token was taken, False if interrupted.
+        """
+        wait = self._reserve()
+
+        if wait > 0:
+            if stop is not None:
+                return not stop.wait(wait)
+            time.sleep(wait)
+        return True
+
+    def pause(self, seconds: float) -> None:
+        """Blocks the bucket for a number of seconds, as requested by the
+            retry_after of a 429 response.
+
+        Args:
+            seconds (float): The number of seconds to wait.
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until,
+                                     time.monotonic() + seconds)
+            self._tokens = min(self._tokens, 0)
+
+def retry_after(exception: Exception) -> Union[float, None]:
+    """Returns the retry_after of a 429 Too Many Requests error of the
+        Telegram Bot API.
+
+    Args:
+        exception (Exception): The exception raised by the send.
+
+    Returns:
+        Union[float, None]: The seconds to wait, or None if the exception
+            isn't a 429.
+    """
+    if not isinstance(exception, telebot.apihelper.ApiTelegramException):
+        return None
+
+    if exception.error_code != 429:
+        return None
+
+    parameters = (exception.result_json or {}).get("parameters") or {}
+    return float(parameters.get("retry_after", 1))
+
+def is_retryable(exception: Union[Exception, None]) -> bool:
+    """Checks if a failed send is worth retrying later: Telegram answered 
+        429 or a 5xx error, or the connection failed. Any other error (e.g. 
+        400 chat not found) fails again at every attempt.
+
+    Args:
+        exception (Union[Exception, None]): The error of the send. None if 
+            the send was interrupted (e.g. at shutdown) without an error.
+
+    Returns:
+        bool: True if the send can be retried.
+    """
+    if exception is None:
+        return True
+
+    if isinstance(exception, (requests.ConnectionError, requests.Timeout)):
+        return True
+
+    if isinstance(exception, telebot.apihelper.ApiTelegramException):
+        code = exception.error_code
+    elif isinstance(exception, telebot.apihelper.ApiHTTPException):
+        code = exception.result.status_code
+    else:
+        return False
+
+    return code == 429 or code >= 500
+
+class OutboxStore:
+    """Durable copy of the outbox in a SQLite database.
+
+    Every post is saved when it is queued and marked when its delivery 
+        ends, so if the process dies the posts already rendered but not yet 
+        sent can be sent at the next start without a new PA-API sweep and 
+        render. Posts older than their expiry are discarded since their 
+        prices may no longer be valid.
+
+    Attributes:
+        db_path (str): The path of the SQLite database.
+        expiry (float): The number of seconds a post stays valid.
+        max_attempts (int): The number of attempts after which a post is 
+            marked as failed.
+
+    Methods:
+        add: Saves a post as pending.
+        mark: Records the result of the delivery of a post.
+        pending: Returns the pending posts that are not expired.
+    """
+    PENDING = "pending"
+    SENT = "sent"
+    FAILED = "failed"
+    EXPIRED = "expired"
+
+    # Days the sent, failed and expired posts are kept
+    HISTORY_DAYS = 7
+
+    def __init__(
+            self, 
+            db_path: str = "./database/outbox.db",
+            expiry: float = 6 * 3600,
+            max_attempts: int = 5
+        ) -> None:
+        """Opens (and if needed creates) the outbox database.
+
+        Args:
+            db_path (str): The path of the SQLite database.
+            expiry (float): The number of seconds a post stays valid.
+            max_attempts (int): The number of attempts after which a post 
+                is marked as failed.
+        """
+        self.db_path = db_path
+        self.expiry = expiry
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            '''CREATE TABLE IF NOT EXISTS outbox (
+                ID INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+                ASIN TEXT,
+                CHAT_ID TEXT,
+                HTML TEXT,
+                MARKUP TEXT,
+                IMAGE BLOB,
+                STATUS TEXT,
+                ATTEMPTS INTEGER,
+                CREATED REAL,
+                EXPIRES REAL,
+                CHANNEL TEXT
+            );'''
+        )
+        # Databases created before the channel was stored with the posts
+        columns = [row[1] for row in 
+                   self._conn.execute("PRAGMA table_info(outbox)")]
+        if "CHANNEL" not in columns:
+            self._conn.execute("ALTER TABLE outbox ADD COLUMN CHANNEL TEXT")
+        self._conn.execute(
+            '''CREATE INDEX IF NOT EXISTS outbox_status 
+               ON outbox (STATUS, EXPIRES);'''
+        )
+        self._conn.commit()
+
+    def add(self, post: Post) -> int:
+        """Saves a post as pending and sets its post_id.
+
+        Args:
+            post (Post): The post to save.
+
+        Returns:
+            int: The id of the post.
+        """
+        now = time.time()
+        markup = post.markup.to_json() if post.markup is not None else None
+        image = (sqlite3.Binary(post.image_data) 
+                 if post.image_data is not None else None)
+
+        with self._lock:
+            cursor = self._conn.execute(
+                '''INSERT INTO outbox (ASIN, CHAT_ID, HTML, MARKUP, IMAGE, 
+                   STATUS, ATTEMPTS, CREATED, EXPIRES, CHANNEL) 
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                (post.asin, json.dumps(post.chat_id), post.html, markup, 
+                 image, self.PENDING, post.attempts, now, now + self.expiry,
+                 post.channel))
+            self._conn.commit()
+
+        post.post_id = cursor.lastrowid
+        return post.post_id
+
+    def mark(self, post: Post, delivered: bool) -> None:
+        """Records the result of the delivery of a post. A post not 
+            delivered because of a temporary error stays pending until it 
+            reaches max_attempts, any other error marks it as failed.
+
+        Args:
+            post (Post): The post.
+            delivered (bool): True if the post was delivered.
+        """
+        if post.post_id is None:
+            return
+
+        if delivered:
+            status = self.SENT
+        elif (post.attempts >= self.max_attempts or 
+              not is_retryable(post.error)):
+            status = self.FAILED
+        else:
+            status = self.PENDING
+
+        with self._lock:
+            self._conn.execute(
+                '''UPDATE outbox SET STATUS = ?, ATTEMPTS = ?, IMAGE = 
+                   CASE WHEN ? = 'pending' THEN IMAGE ELSE NULL END 
+                   WHERE ID = ?''', 
+                (status, post.attempts, status, post.post_id))
+            self._conn.commit()
+
+    def pending(self) -> list[Post]:
+        """Returns the pending posts that are not expired, oldest first. 
+            Expired posts are marked and old history is deleted.
+
+        Returns:
+            list[Post]: The posts to send.
+        """
+        now = time.time()
+
+        with self._lock:
+            self._conn.execute(
+                '''UPDATE outbox SET STATUS = ?, IMAGE = NULL 
+                   WHERE STATUS = ? AND EXPIRES <= ?''', 
+                (self.EXPIRED, self.PENDING, now))
+            self._conn.execute(
+                '''DELETE FROM outbox WHERE STATUS != ? AND CREATED < ?''',
+                (self.PENDING, now - self.HISTORY_DAYS * 86400))
+            rows = self._conn.execute(
+                '''SELECT ID, ASIN, CHAT_ID, HTML, MARKUP, IMAGE, ATTEMPTS, 
+                   CHANNEL FROM outbox WHERE STATUS = ? ORDER BY ID''', 
+                (self.PENDING,)).fetchall()
+            self._conn.commit()
+
+        posts = []
+        for (post_id, asin, chat_id, html, markup, image, attempts, 
+             channel) in rows:
+            if markup is not None:
+                markup = telebot.types.InlineKeyboardMarkup.de_json(markup)
+            posts.append(Post(asin, json.loads(chat_id), html, markup, 
+                              image, None, post_id, attempts, channel))
+        return posts
+
+class Outbox:
+    """Sends posts in the background respecting the rate limits of Telegram.
+
+    Each chat has its own queue, worker thread and token bucket, so a
+        throttled chat doesn't delay the others. A global bucket keeps the
+        bot under the overall limit. When Telegram answers 429 the chat is
+        paused for retry_after seconds and the post is retried. The result
+        of each delivery is reported to the on_result callback and, if the 
+        outbox has a store, saved in it.
+
+    Attributes:
+        sender (Callable[[Post], Any]): Sends a post, raising on failure.
+        on_result (Callable[[Post, bool], None]): Called with each post and
+            True if it was delivered, False otherwise.
+        per_minute (float): The maximum number of posts per minute per chat.
+        burst (int): The maximum number of posts sent back to back per chat.
+        max_attempts (int): The maximum number of attempts for each post.
+        store (Union[OutboxStore, None]): The durable copy of the outbox.
+
+    Methods:
+        put: Adds a post to the queue of its chat.
+        join: Waits until all the queued posts are processed.
+        close: Stops the workers after the queued posts are processed.
+        abort: Stops the sends at shutdown.
+    """
+    GLOBAL_PER_SECOND = 30
+
+    def __init__(
+            self,
+            sender: Callable[[Post], Any],
+            on_result: Union[Callable[[Post, bool], None], None] = None,
+            per_minute: float = 20,
+            burst: int = 3,
+            max_attempts: int = 3,
+            store: Union[OutboxStore, None] = None
+        ) -> None:
+        """Initializes the outbox. Workers are started lazily, one per chat.
+
+        Args:
+            sender (Callable[[Post], Any]): Sends a post, raising on failure.
+            on_result (Union[Callable[[Post, bool], None], None]): Called
+                with each post and the result of its delivery.
+            per_minute (float): The maximum number of posts per minute
+                per chat.
+            burst (int): The maximum number of posts sent back to back
+                per chat.
+            max_attempts (int): The maximum number of attempts for each post.
+            store (Union[OutboxStore, None]): The durable copy of the outbox. 
+                Posts are saved in it when queued.
+        """
+        self.sender = sender
+        self.on_result = on_result
+        self.per_minute = per_minute
+        self.burst = burst
+        self.max_attempts = max_attempts
+        self.store = store
+
+        self._global_bucket = TokenBucket(self.GLOBAL_PER_SECOND,
+                                          self.GLOBAL_PER_SECOND)
+        self._lanes = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def _lane(self, chat_id: Union[int, str]) -> tuple:
+        """Returns the queue and bucket of a chat, starting its worker the
+            first time."""
+        with self._lock:
+            lane = self._lanes.get(chat_id)
+
+            if lane is None:
+                lane_queue = queue.Queue()
+                bucket = TokenBucket(self.per_minute / 60, self.burst)
+                worker = threading.Thread(target=self._worker,
+                                          args=(lane_queue, bucket),
+                                          name=f"outbox-{chat_id}",
+                                          daemon=True)
+                lane = (lane_queue, bucket, worker)
+                self._lanes[chat_id] = lane
+                worker.start()
+
+        return lane
+
+    def put(self, post: Post) -> None:
+        """Adds a post to the queue of its chat, saving it in the store 
+            if it isn't already there.
+
+        Args:
+            post (Post): The post to send.
+        """
+        if self.store is not None and post.post_id is None:
+            self.store.add(post)
+
+        lane_queue, _, _ = self._lane(post.chat_id)
+        queue_depth.inc()
+        lane_queue.put(post)
+
+    def join(self) -> None:
+        """Waits until all the queued posts are processed."""
+        with self._lock:
+            lanes = list(self._lanes.values())
+
+        for lane_queue, _, _ in lanes:
+            lane_queue.join()
+
+    def close(self, timeout: Union[float, None] = None) -> None:
+        """Stops the workers after the queued posts are processed.
+
+        Args:
+            timeout (Union[float, None]): The maximum number of seconds to
+                wait for each worker.
+        """
+        with self._lock:
+            lanes = list(self._lanes.values())
+
+        for lane_queue, _, _ in lanes:
+            lane_queue.put(None)
+        for _, _, worker in lanes:
+            worker.join(timeout)
+
+    def abort(self) -> None:
+        """Stops the sends at shutdown. The queued posts are reported as 
+            not delivered and stay pending in the store for the next run."""
+        self._stop.set()
+
+    def _worker(self, lane_queue: queue.Queue, bucket: TokenBucket) -> None:
+        """Sends the posts of a chat one by one."""
+        while True:
+            post = lane_queue.get()
+
+            try:
+                if post is None:
+                    return
+                delivered = self._deliver(post, bucket)
+                queue_depth.dec()
+                (posts_delivered if delivered else posts_failed).inc()
+
+                if self.store is not None:
+                    self.store.mark(post, delivered)
+
+                if self.on_result is not None:
+                    self.on_result(post, delivered)
+
+            except Exception as e:
+                logger.error(f"Outbox error for {post}: {e}")
+
+            finally:
+                lane_queue.task_done()
+
+    def _deliver(self, post: Post, bucket: TokenBucket) -> bool:
+        """Sends a post, retrying after 429 errors.
+
+        Args:
+            post (Post): The post to send.
+            bucket (TokenBucket): The bucket of the chat of the post.
+
+        Returns:
+            bool: True if the post was delivered, False otherwise.
+        """
+        for attempt in range(1, self.max_attempts + 1):
+            if (self._stop.is_set() or 
+                    not (bucket.acquire(self._stop) and
+                         self._global_bucket.acquire(self._stop))):
+                return False
+
+            post.attempts += 1
+
+            try:
+                self.sender(post)
+                post.error = None
+                return True
+
+            except Exception as e:
+                post.error = e
+                wait = retry_after(e)
+
+                if wait is None:
+                    logger.error(f"Error when sending the message for the "
+                                 f"asin {post.asin} to the chat "
+                                 f"{post.chat_id}: {e}")
+                    return False
+
+                logger.warning(f"Telegram rate limit for the chat "
+                               f"{post.chat_id}: retry after {wait} s "
+                               f"(attempt {attempt}/{self.max_attempts}).")
+                bucket.pause(wait)
+
+        return False
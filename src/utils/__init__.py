@@ -19,6 +19,14 @@ from utils import amz_paapi_sdk
 from utils import log_manager
 from utils import list_manager
 from utils import functions_toolbox
+from utils import http_client
+from utils import metrics
+from utils import health
+from utils import pipeline_state
+from utils import pipeline_stage
+from utils import job_scheduler
+from utils import holiday_calendar
+from utils import sweep_prefetcher
 
 ## Consider to leave these message you use or share this project
 print("\nDeveloped By: Pietrobon Andrea \n"
@@ -13,6 +13,7 @@
 
 # Standard library modules
 import logging
+import functools
 from typing import Union
 
 from paapi5_python_sdk.rest import ApiException
@@ -25,12 +26,78 @@ from paapi5_python_sdk.search_items_request import SearchItemsRequest
 from paapi5_python_sdk.search_items_resource import SearchItemsResource
 
 # Imported modules
+from utils import metrics
 from utils.log_manager import setup_logger
 
 # Setting up logger
 setup_logger()
 logger = logging.getLogger(__name__)
 
+api_requests = metrics.counter("paapi_requests_total", 
+                               "Requests sent to the PA-API")
+api_errors = metrics.counter("paapi_errors_total", 
+                             "Requests to the PA-API that failed")
+api_throttled = metrics.counter("paapi_throttled_total", 
+                                "Requests to the PA-API refused with "
+                                "Status Code: 429")
+
+def api_call_stats() -> tuple[int, int]:
+    """Returns the number of requests sent to the PA-API since the start 
+        and how many of them failed.
+
+    Returns:
+        tuple[int, int]: The number of requests and of failed requests.
+    """
+    return api_requests.value, api_errors.value
+
+@functools.lru_cache(maxsize=8)
+def get_api(
+        access_key: str, 
+        secret_key: str, 
+        host: str, 
+        region: str
+    ) -> DefaultApi:
+    """Returns the PA-API client of a host, creating it the first time.
+
+    The client (with its connection pool and thread pool) is reused by all
+        the requests instead of being built for each one.
+
+    The host can start with a scheme: "http://localhost:8001" points the 
+        client to a local server without TLS, like the stub PA-API server 
+        of the benchmarks (benchmarks/paapi_stub_server.py). Without a 
+        scheme the requests are sent in https, as the SDK does.
+
+    Args:
+        access_key (str): Access key for Amazon PA-API.
+        secret_key (str): Secret key for Amazon PA-API.
+        host (str): Host for the Amazon PA-API endpoint, optionally with 
+            the scheme.
+        region (str): Region for the Amazon PA-API endpoint.
+
+    Returns:
+        DefaultApi: The client.
+    """
+    scheme, _, bare_host = host.rpartition("://")
+    default_api = DefaultApi(access_key=access_key, 
+                             secret_key=secret_key, 
+                             host=bare_host, 
+                             region=region)
+
+    if scheme and scheme != "https":
+        # The SDK always builds https URLs
+        api_client = default_api.api_client
+        send = api_client.request
+
+        def request(method, url, *args, **kwargs):
+            if url.startswith("https://"):
+                url = f"{scheme}://{url[len('https://'):]}"
+            return send(method, url, *args, **kwargs)
+
+        api_client.request = request
+
+    return default_api
+
+@metrics.timed("paapi_search", "Duration of the SearchItems requests")
 def search_items_by_kw(
         access_key: str, 
         secret_key: str, 
@@ -94,10 +161,7 @@ def search_items_by_kw(
     # For more details, refer: https://webservices.amazon.com/paapi5/documentation/use-cases/organization-of-items-on-amazon/search-index.html
 
     # API declaration
-    default_api = DefaultApi(access_key=access_key, 
-                             secret_key=secret_key, 
-                             host=host, 
-                             region=region)
+    default_api = get_api(access_key, secret_key, host, region)
 
     # Choose resources you want from SearchItemsResource enum
     # For more details, refer: https://webservices.amazon.com/paapi5/documentation/search-items.html#resources-parameter
@@ -185,6 +249,7 @@ def search_items_by_kw(
 
     try:
         # Sending request
+        api_requests.inc()
         response = default_api.search_items(search_items_request)
         # logging.debug("API called Successfully")
 
@@ -219,13 +284,19 @@ def search_items_by_kw(
                       f"{exception.status} - Request ID: "
                       f"{exception.headers['x-amzn-RequestId']}")
         logging.error(f"Errors : {exception.body}")
+        api_errors.inc()
+        if exception.status == 429:
+            api_throttled.inc()
         return exception.status
 
     except TypeError as exception:
         logging.error(f"TypeError : {exception}")
+        api_errors.inc()
 
     except ValueError as exception:
         logging.error(f"ValueError : {exception}")
+        api_errors.inc()
 
     except Exception as exception:
-        logging.error(f"Exception : {exception}")
\ No newline at end of file
+        logging.error(f"Exception : {exception}")
+        api_errors.inc()
\ No newline at end of file
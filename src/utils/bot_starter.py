@@ -13,8 +13,10 @@
 
 # Standard library modules
 import time
-import random
 import logging
+import threading
+from typing import Callable, Optional
+from datetime import datetime, timedelta
 
 # External libraries
 import telebot
@@ -24,8 +26,16 @@ from utils import time_scheduler
 from utils import list_manager
 from utils.product import Product
 from utils import database_builder
+from utils import amz_paapi_sdk
+from utils.sweep_prefetcher import SweepPrefetcher
+from utils.health import get_health
+from utils.pipeline_state import get_state
 from messages import communication_handler
+from messages.message import Message
+from messages.outbox import Outbox, Post
+from messages.channels import Channel, load_channels
 from configs import settings
+from utils.pipeline_stage import Stage
 from utils.log_manager import setup_logger
 from utils import functions_toolbox
 
@@ -33,50 +43,334 @@ from utils import functions_toolbox
 setup_logger()
 logger = logging.getLogger(__name__)
 
-def start(bot: telebot.TeleBot) -> None:
+def start(bot: telebot.TeleBot) -> int:
     """Initiates the process of sending product offers to users.
 
     This function checks if it's an appropriate time to send offers, 
-    then extracts valid offers from a list, checks their validity, 
-    shuffles them, selects a number of offers to send, sends each offer 
-    individually to users, updates the database with sent offers, and logs 
-    the completion of the iteration.
+    then extracts valid offers from a list once, routes them to every 
+    channel whose filters and history accept them, queues each offer 
+    in the outbox that sends them to users, updates the history of each 
+    channel with the delivered offers, and logs the completion of the 
+    iteration.
+
+    The function doesn't wait for the next iteration: it returns the delay 
+    chosen by the waiting policies and the scheduler runs it again after it.
 
     Args:
         bot (telebot.TeleBot): The Telegram bot object.
+
+    Returns:
+        int: The number of seconds to wait before the next iteration.
     """
+    delay = 0
+
     if ((time_scheduler.is_active()) and (time_scheduler.is_not_sunday()) and 
         (not time_scheduler.is_during_holidays(settings.COUNTRY))):
-        valid_offers_list = list_manager.extraction_raw_products()
-        products_list = []
-
-        if valid_offers_list:
-            
-            products_list_raw = Product.list_to_products(valid_offers_list)
-            products_list = database_builder.check_products_in_list(
-                products_list_raw, 
-                settings.MAX_DAYS_TO_CHECK)
-
-        # Take from the db the products and discard if already in the list.
-        # If not check if the offer is still valid. If so add it to the list.
-        random.shuffle(products_list)
-
-        if products_list:
-            MAX_OFFERS = functions_toolbox.choose_max_offers_number()
-            selected_products = list_manager.offers_extractor(products_list, 
-                                                              MAX_OFFERS)  
+
+        # Posts rendered by a previous run but never sent are sent first, 
+        # then the iteration goes on with its own sweep
+        resume_outbox(bot)
+
+        # Harvest and convert only once, whatever the number of channels. 
+        # The sweep normally ran in the background during the wait and 
+        # finished just before this slot.
+        products_list_raw = _prefetcher.take()
+
+        if products_list_raw is None:
+            started = time.monotonic()
+            products_list_raw = harvest_products()
+            _prefetcher.record(time.monotonic() - started)
+
+        channels = load_channels()
+        selected_products, routes = route_products(products_list_raw, 
+                                                   channels)
+
+        if selected_products:
+            # Render all the images up front using every core, so the 
+            # sending loop only has to post ready assets. A product routed 
+            # to many channels is rendered once.
+            with Stage("render", len(selected_products)) as stage:
+                try:
+                    stage.items_out = Message.prerender_images(
+                        selected_products, 
+                        getattr(settings, "RENDER_WORKERS", 0))
+                
+                except Exception as e:
+                    # The images missing from the render cache are 
+                    # rendered in this process when the posts are built
+                    stage.errors += 1
+                    logging.error(f"Error while prerendering the images, "
+                                  f"rendering them while sending: {e}")
+
             asin_sended_list = []
-            for product in selected_products:
-                result = communication_handler.single_message(bot, product)
+            persist = Stage("persist")
 
-                if result:
-                    asin = database_builder.add_to_database(product)
-                    asin_sended_list.append(asin)
-            
+            results_lock = threading.Lock()
+
+            with Stage("send", len(selected_products)) as send:
+                def on_result(post, delivered: bool) -> None:
+                    # Called by the threads of the outbox
+                    with results_lock:
+                        send.api_calls += post.attempts
+                        send.items_out += int(delivered)
+                        send.errors += int(not delivered)
+                        record_delivery(post, delivered, asin_sended_list, 
+                                        channels, persist)
+
+                # The outbox sends in the background within the Telegram 
+                # rate limits while the next posts are being prepared.
+                outbox = open_outbox(bot, on_result)
+                for product in selected_products:
+                    chat_ids = [channel.chat_id 
+                                for channel in routes[product.asin]]
+                    posts = communication_handler.build_posts(product, 
+                                                              chat_ids)
+
+                    # The history is saved with the post, so a resumed 
+                    # post updates it even if the channels changed
+                    for channel, post in zip(routes[product.asin], posts):
+                        post.channel = channel.name
+                        outbox.put(post)
+                
+                outbox.join()
+                outbox.close()
+
+            persist.items_in = send.items_out
+            persist.emit()
             database_builder.correctly_added(asin_sended_list)
-            time_scheduler.waiting_next_iteration()
+            delay = next_slot_delay()
 
         logging.info("Iteration completed.")
     
     else:
-        time_scheduler.static_waiting_time()
+        # Sleep until the next active window opens instead of polling
+        delay = time_scheduler.seconds_to_active_time()
+        logging.info(f"Not the right time to iterate the bot. Waiting for "
+                     f"{delay // 60} minutes, until the next active window.")
+    
+    return delay
+
+def harvest_products() -> list[Product]:
+    """Runs a sweep: extracts the offers from the PA-API and converts them 
+        to products.
+
+    Returns:
+        list[Product]: The harvested products.
+    """
+    calls, errors = amz_paapi_sdk.api_call_stats()
+
+    with Stage("harvest") as stage:
+        valid_offers_list = list_manager.extraction_raw_products()
+        stage.items_out = len(valid_offers_list)
+        stage.api_calls, stage.errors = (
+            value - before for value, before in 
+            zip(amz_paapi_sdk.api_call_stats(), (calls, errors)))
+
+    # A sweep without offers still succeeded if the PA-API answered
+    if valid_offers_list or not stage.errors:
+        get_health().mark_sweep()
+
+    if not valid_offers_list:
+        return []
+    
+    with Stage("convert", len(valid_offers_list)) as stage:
+        products = Product.list_to_products(valid_offers_list)
+        stage.items_out = len(products)
+
+    return products
+
+_prefetcher = SweepPrefetcher(harvest_products)
+
+def next_slot_delay() -> int:
+    """Chooses the next posting slot and, if it is inside the active hours, 
+        schedules the sweep for that slot in the background so that it 
+        finishes just before it.
+
+    Returns:
+        int: The number of seconds to wait before the next posting slot.
+    """
+    # A slot that falls outside the active hours is moved to the start of 
+    # the next active window
+    slot = datetime.now() + timedelta(
+        seconds=time_scheduler.next_iteration_delay())
+    delay = time_scheduler.seconds_to_active_time(slot)
+
+    # The sweep is prefetched only for a slot inside the active hours: a 
+    # moved slot is hours away and the prefetched offers would be too old
+    if time_scheduler.next_active_time(slot) == slot:
+        _prefetcher.schedule(time.time() + delay)
+    else:
+        _prefetcher.cancel()
+    logging.info(f"Waiting {delay // 60} minutes before next iteration.")
+    return delay
+
+def route_products(
+        products: list[Product], 
+        channels: list[Channel]
+    ) -> tuple[list[Product], dict[str, list[Channel]]]:
+    """Selects the offers to send to each channel.
+
+    Each channel keeps only the products that pass its filters and that 
+        aren't in its history of the last days, then picks its offers. 
+        A product picked by many channels is selected only once.
+
+    Args:
+        products (list[Product]): The harvested products.
+        channels (list[Channel]): The channels.
+
+    Returns:
+        tuple[list[Product], dict[str, list[Channel]]]: The selected 
+            products and, for each ASIN, the channels it is sent to.
+    """
+    max_offers = functions_toolbox.choose_max_offers_number()
+    selected_products = []
+    routes = {}
+    candidates_of = {}
+
+    with Stage("dedup", len(products)) as stage:
+        for channel in channels:
+            candidates = [product for product in products 
+                          if channel.accepts(product)]
+            candidates_of[channel] = (
+                database_builder.check_products_in_list(
+                    candidates, 
+                    settings.MAX_DAYS_TO_CHECK,
+                    channel.name))
+
+        # A product that is a candidate of many channels is counted once, 
+        # as the products of the items_in
+        stage.items_out = len({product.asin 
+                               for candidates in candidates_of.values() 
+                               for product in candidates})
+        get_state().record_candidates(stage.items_out)
+
+    with Stage("select", stage.items_out) as stage:
+        for channel in channels:
+            candidates = candidates_of[channel]
+
+            if not candidates:
+                continue
+
+            for product in list_manager.offers_extractor(candidates, 
+                                                         max_offers):
+                if product.asin not in routes:
+                    routes[product.asin] = []
+                    selected_products.append(product)
+                routes[product.asin].append(channel)
+
+        stage.items_out = len(selected_products)
+
+    return selected_products, routes
+
+def record_delivery(
+        post: Post, 
+        delivered: bool, 
+        asin_sended_list: list, 
+        channels: list[Channel],
+        persist: Optional[Stage] = None
+    ) -> None:
+    """Adds a delivered post to the history of the sent products of the 
+        channel it was sent to.
+
+    Args:
+        post (Post): The post.
+        delivered (bool): True if the post was delivered.
+        asin_sended_list (list): The list the ASIN is appended to.
+        channels (list[Channel]): The channels, to find the history of 
+            the chat of posts stored without it.
+        persist (Stage, optional): The stage the time spent writing the 
+            history is added to.
+    """
+    if not delivered:
+        return
+
+    logging.info(f"Message send successfully for the asin {post.asin} "
+                 f"to the chat {post.chat_id}")
+    get_health().mark_send()
+
+    history = post.channel
+    if history is None:
+        history = ''
+        for channel in channels:
+            if str(channel.chat_id) == str(post.chat_id):
+                history = channel.name
+                break
+
+    # Posts resumed from the outbox store only have the ASIN
+    product = post.product if post.product is not None else Product(post.asin)
+
+    if persist is None:
+        asin = database_builder.add_to_database(product, channel=history)
+    else:
+        with persist.measure():
+            asin = database_builder.add_to_database(product, channel=history)
+        persist.items_out += 1
+
+    get_state().record_sent(product, post.chat_id)
+    asin_sended_list.append(asin)
+
+_running_outbox = None
+_stopping = threading.Event()
+
+def open_outbox(
+        bot: telebot.TeleBot, 
+        on_result: Callable[[Post, bool], None]
+    ) -> Outbox:
+    """Creates the outbox of a send and keeps it reachable by 
+        abort_outbox. At shutdown the outbox is aborted right away.
+
+    Args:
+        bot (telebot.TeleBot): The Telegram bot object.
+        on_result (Callable[[Post, bool], None]): Called with each post 
+            and the result of its delivery.
+
+    Returns:
+        Outbox: The outbox.
+    """
+    global _running_outbox
+    outbox = communication_handler.create_outbox(bot, on_result)
+    _running_outbox = outbox
+
+    if _stopping.is_set():
+        outbox.abort()
+    return outbox
+
+def abort_outbox() -> None:
+    """Stops the sends of the running outbox at shutdown. Its posts stay 
+        pending in the outbox store and are resumed by the next run."""
+    _stopping.set()
+    outbox = _running_outbox
+
+    if outbox is not None:
+        outbox.abort()
+
+def resume_outbox(bot: telebot.TeleBot) -> int:
+    """Sends the posts left in the durable outbox by a previous run 
+        (e.g. after a crash or a restart).
+
+    Args:
+        bot (telebot.TeleBot): The Telegram bot object.
+
+    Returns:
+        int: The number of posts resumed.
+    """
+    posts = communication_handler.get_outbox_store().pending()
+
+    if not posts:
+        return 0
+
+    logging.info(f"Resuming {len(posts)} posts from the outbox.")
+
+    asin_sended_list = []
+    channels = load_channels()
+    outbox = open_outbox(
+        bot, lambda post, delivered: record_delivery(post, delivered, 
+                                                     asin_sended_list, 
+                                                     channels))
+    for post in posts:
+        outbox.put(post)
+
+    outbox.join()
+    outbox.close()
+    database_builder.correctly_added(asin_sended_list)
+    return len(posts)
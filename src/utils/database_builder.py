@@ -13,6 +13,7 @@
 
 # Standard library modules
 import os
+import re
 import ast
 import logging
 import sqlite3
@@ -21,6 +22,7 @@ from datetime import datetime, timedelta
 
 # Importing internal modules
 from utils.product import Product
+from utils import metrics
 from utils.log_manager import setup_logger
 from utils import functions_toolbox
 
@@ -28,12 +30,39 @@ from utils import functions_toolbox
 setup_logger()
 logger = logging.getLogger(__name__)
 
-def add_to_database(product: Product, name: Optional[str] = '') -> str:
+# Names of the histories of the channels, used as directory names. The empty
+# name is the history of the main channel.
+CHANNEL_NAME = re.compile(r"[A-Za-z0-9_-]*")
+
+def history_root(channel: Optional[str] = '') -> str:
+    """Returns the root directory of the history of the sent products.
+
+    Args:
+        channel (str, optional): The name of the history of a channel. 
+            Defaults to '' that is the history of the main channel.
+
+    Returns:
+        str: The root directory of the history.
+    """
+    if not channel:
+        return "./database"
+
+    if not CHANNEL_NAME.fullmatch(channel):
+        raise ValueError(f"Invalid channel name {channel!r}.")
+    return f"./database/channels/{channel}"
+
+def add_to_database(
+        product: Product, 
+        name: Optional[str] = '', 
+        channel: Optional[str] = ''
+    ) -> str:
     """Adds a product to the database.
 
     Args:
         product (Product): The product to add to the database.
         name (str, optional): The name of the database. Defaults to ''.
+        channel (str, optional): The name of the history of the channel 
+            the product was sent to. Defaults to '' (the main channel).
 
     Returns:
         str: The ASIN of the added product.
@@ -43,7 +72,7 @@ def add_to_database(product: Product, name: Optional[str] = '') -> str:
     if not name :
 
         name = f"{now.strftime('%m')}"
-        db_path = f"./database/{now.strftime('%Y')}/"
+        db_path = f"{history_root(channel)}/{now.strftime('%Y')}/"
         db_name = f"{db_path}/{name}.db"
 
         table_name = f"day_{now.strftime('%d')}"
@@ -107,7 +136,15 @@ def correctly_added(asin_list: list[str]) -> None:
     logging.debug(f"Products with ASINs: {asin_list} "
                   f"correctly added to the database.")
 
-def is_valid_for_resend(product: Product, max_days: int) -> bool:
+dedup_hits = metrics.counter("dedup_hits_total", 
+                             "Products discarded because already sent")
+
+@metrics.timed("dedup_check", "Check of a product in the resend history")
+def is_valid_for_resend(
+        product: Product, 
+        max_days: int, 
+        channel: Optional[str] = ''
+    ) -> bool:
     """Check if this product has already been sent in the latest messages.
 
     If not enough products have already been shipped on the same day,
@@ -116,6 +153,8 @@ def is_valid_for_resend(product: Product, max_days: int) -> bool:
     Args:
         product (Product): Product object with all its characteristics.
         number_msg_to_check (int): Number of products you want to check.
+        channel (str, optional): The name of the history of the channel 
+            to check. Defaults to '' (the main channel).
 
     Returns:
         Return 1 if this product has already been sent. 0 otherwise.
@@ -125,7 +164,7 @@ def is_valid_for_resend(product: Product, max_days: int) -> bool:
         new_date = now - timedelta(days=day_index)
 
         try:
-            db_path = f"./database/{new_date.strftime('%Y')}/"
+            db_path = f"{history_root(channel)}/{new_date.strftime('%Y')}/"
             db_name = f"{db_path}/{new_date.strftime('%m')}.db"
             os.makedirs(db_path, exist_ok=True)
 
@@ -163,6 +202,7 @@ def is_valid_for_resend(product: Product, max_days: int) -> bool:
                 conn.close()
                 logging.debug(f"Asin: {product.asin} already sent on "
                               f"{new_date.strftime('%d-%m-%Y')}.")
+                dedup_hits.inc()
                 return False
 
         except Exception as e:
@@ -172,7 +212,8 @@ def is_valid_for_resend(product: Product, max_days: int) -> bool:
 
 def check_products_in_list(
         product_list: list[Product], 
-        max_days: int
+        max_days: int,
+        channel: Optional[str] = ''
     ) -> list[Product]:
     """Check products in a list for validity based on the maximum number of days
 
@@ -183,6 +224,8 @@ def check_products_in_list(
     Args:
         product_list (List[Product]): A list of Product objects to be checked.
         max_days (int): Maximum number of days considered for product validity.
+        channel (str, optional): The name of the history of the channel 
+            to check. Defaults to '' (the main channel).
 
     Returns:
         List[Product]: List of valid products based on the max number of days.
@@ -193,7 +236,7 @@ def check_products_in_list(
     products_valid_to_send = []
 
     for product in product_list:
-        if is_valid_for_resend(product, max_days):
+        if is_valid_for_resend(product, max_days, channel):
             products_valid_to_send.append(product)
     
     return products_valid_to_send
\ No newline at end of file
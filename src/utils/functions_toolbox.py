@@ -150,8 +150,6 @@ def build_archive() -> None:
 
     folders_path = [
         "archive", 
-        "archive/img", 
-        "archive/tmp", 
         ]
 
     for folder in folders_path:
@@ -0,0 +1,151 @@
+# Copyright (C) by Pietrobon Andrea - All Rights Reserved
+#
+# This file is part of the project: TelegramBot-AmazonOffers
+# It can only be distributed from Andrea Pietrobon's official Github profile
+# The use of the project TelegramBot-AmazonOffers or of this file follow
+# the rules indicated in the LICENSE file.
+# The redistribution or sale of the files without the written consent
+# of the author is not authorized.
+#
+# Written by Pietrobon Andrea, Jan 2024
+# Official website <https://pietrobonandrea.com>
+# Github website <https://github.com/Piero24>
+
+# Standard library modules
+import time
+from typing import Union
+from datetime import datetime
+
+# Importing internal modules
+from utils.job_scheduler import get_scheduler
+from utils.time_scheduler import next_active_time
+
+# The bot isn't alive after this number of failed iterations in a row
+MAX_FAILED_ITERATIONS = 3
+# The bot isn't alive if a job of the scheduler loop runs longer than this
+MAX_JOB_SECONDS = 3 * 3600
+# The bot isn't ready if the last successful sweep is older than this. It
+# covers the nights, Sundays and holidays without sweeps.
+MAX_SWEEP_AGE = 4 * 24 * 3600
+
+class HealthState:
+    """State of the pipeline kept in memory for the health checks.
+
+    The pipeline updates it with plain assignments, the web server reads
+        it: answering a health check never touches the disk.
+
+    Attributes:
+        started (float): The time the process started.
+        last_sweep (Union[float, None]): The time of the last successful
+            sweep.
+        last_send (Union[float, None]): The time of the last delivered post.
+        last_iteration (Union[float, None]): The time of the last iteration.
+        failed_iterations (int): The number of failed iterations in a row.
+        last_error (Union[str, None]): The error of the last failed
+            iteration.
+
+    Methods:
+        mark_sweep: Records a successful sweep.
+        mark_send: Records a delivered post.
+        mark_iteration: Records the end of an iteration.
+        liveness: Checks if the bot is alive.
+        readiness: Checks if the bot is ready.
+    """
+    def __init__(self) -> None:
+        """Initializes the state at the start of the process."""
+        self.started = time.time()
+        self.last_sweep = None
+        self.last_send = None
+        self.last_iteration = None
+        self.failed_iterations = 0
+        self.last_error = None
+
+    def mark_sweep(self) -> None:
+        """Records a successful sweep."""
+        self.last_sweep = time.time()
+
+    def mark_send(self) -> None:
+        """Records a delivered post."""
+        self.last_send = time.time()
+
+    def mark_iteration(self, error: Union[Exception, None] = None) -> None:
+        """Records the end of an iteration.
+
+        Args:
+            error (Union[Exception, None]): The error that made the
+                iteration fail, None if it succeeded.
+        """
+        self.last_iteration = time.time()
+
+        if error is None:
+            self.failed_iterations = 0
+        else:
+            self.failed_iterations += 1
+            self.last_error = f"{type(error).__name__}: {error}"
+
+    def _report(self) -> dict:
+        """Returns the state with the state of the scheduler."""
+        return {
+            "started": self.started,
+            "last_sweep": self.last_sweep,
+            "last_send": self.last_send,
+            "last_iteration": self.last_iteration,
+            "failed_iterations": self.failed_iterations,
+            "last_error": self.last_error,
+            "scheduler": get_scheduler().state(),
+        }
+
+    def liveness(self) -> tuple[bool, dict]:
+        """Checks if the bot is alive: the scheduler loop is running, it
+            isn't stuck in a job and the iterations aren't all failing.
+
+        Returns:
+            tuple[bool, dict]: True if alive, and the report of the state
+                with the reasons of the failure in "problems".
+        """
+        report = self._report()
+        scheduler = report["scheduler"]
+        problems = []
+
+        if scheduler["state"] != "running":
+            problems.append(f"scheduler {scheduler['state']}")
+
+        if (scheduler["current_since"] is not None and
+            time.time() - scheduler["current_since"] > MAX_JOB_SECONDS):
+            problems.append(f"job {scheduler['current_job']} stuck")
+
+        if self.failed_iterations >= MAX_FAILED_ITERATIONS:
+            problems.append(f"{self.failed_iterations} failed iterations")
+
+        report["problems"] = problems
+        return not problems, report
+
+    def readiness(self) -> tuple[bool, dict]:
+        """Checks if the bot is ready: it is alive and a sweep succeeded
+            recently. Before the first sweep the bot is ready while it is
+            outside the active hours, since no sweep can run until they
+            start.
+
+        Returns:
+            tuple[bool, dict]: True if ready, and the report of the state
+                with the reasons of the failure in "problems".
+        """
+        alive, report = self.liveness()
+
+        if self.last_sweep is None:
+            if next_active_time() <= datetime.now():
+                report["problems"].append("no successful sweep yet")
+        elif time.time() - self.last_sweep > MAX_SWEEP_AGE:
+            report["problems"].append("last successful sweep too old")
+
+        return not report["problems"], report
+
+_health = HealthState()
+
+def get_health() -> HealthState:
+    """Returns the health state of the process.
+
+    Returns:
+        HealthState: The shared health state.
+    """
+    return _health
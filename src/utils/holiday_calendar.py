@@ -0,0 +1,186 @@
+# Copyright (C) by Pietrobon Andrea - All Rights Reserved
+#
+# This file is part of the project: TelegramBot-AmazonOffers
+# It can only be distributed from Andrea Pietrobon's official Github profile
+# The use of the project TelegramBot-AmazonOffers or of this file follow
+# the rules indicated in the LICENSE file.
+# The redistribution or sale of the files without the written consent
+# of the author is not authorized.
+#
+# Written by Pietrobon Andrea, Jan 2024
+# Official website <https://pietrobonandrea.com>
+# Github website <https://github.com/Piero24>
+
+# Standard library modules
+import os
+import json
+import logging
+import threading
+from datetime import date
+from importlib import metadata
+from typing import Iterable, Union
+
+# Importing internal modules
+from utils.log_manager import setup_logger
+
+# Setting up logger
+setup_logger()
+logger = logging.getLogger(__name__)
+
+CACHE_FILE = "archive/cache/holidays.json"
+
+class HolidayCalendar:
+    """Precomputed holidays of one or more countries.
+
+    The holidays of a country are computed once per year and kept as a
+        frozen set of dates, so checking a day is a set lookup. A new year
+        is computed lazily the first time one of its days is checked.
+
+    The computed years are also saved in a small JSON file: the holidays
+        library, slow to import, is imported only when a year is missing
+        from it (i.e. about once per year and country). The file records 
+        the version of the library and is discarded when it changes, so 
+        the fixes of a new release are not hidden by the old years.
+
+    Attributes:
+        cache_file (Union[str, None]): The JSON file where the computed years
+            are saved. None keeps them only in memory.
+
+    Methods:
+        holidays_of: Returns the holidays of a country in a year.
+        is_holiday: Checks if a day is a holiday in one of the countries.
+    """
+    def __init__(self, cache_file: Union[str, None] = CACHE_FILE) -> None:
+        """Initializes the calendar, loading the years saved in the cache.
+
+        Args:
+            cache_file (Union[str, None]): The JSON file of the computed
+                years. None keeps them only in memory.
+        """
+        self.cache_file = cache_file
+        self._lock = threading.Lock()
+        self._years = {}
+        self._load()
+
+    def holidays_of(self, country: str, year: int) -> frozenset[date]:
+        """Returns the holidays of a country in a year.
+
+        Args:
+            country (str): The ISO code of the country (e.g. "IT").
+            year (int): The year.
+
+        Returns:
+            frozenset[date]: The days of the holidays.
+        """
+        key = (country.upper(), year)
+
+        with self._lock:
+            days = self._years.get(key)
+
+            if days is None:
+                days = self._compute(*key)
+                self._years[key] = days
+                self._save()
+
+        return days
+
+    def is_holiday(self, day: date, countries: Union[str, Iterable[str]]) -> bool:
+        """Checks if a day is a holiday in at least one of the countries.
+
+        Args:
+            day (date): The day to check.
+            countries (Union[str, Iterable[str]]): The ISO code of a country
+                or a list of codes for multi-marketplace setups.
+
+        Returns:
+            bool: True if the day is a holiday in one of the countries.
+        """
+        if isinstance(countries, str):
+            countries = [countries]
+
+        return any(day in self.holidays_of(country, day.year)
+                   for country in countries)
+
+    @staticmethod
+    def _compute(country: str, year: int) -> frozenset[date]:
+        """Computes the holidays of a country in a year with the holidays
+            library."""
+        # Imported here so the startup doesn't pay for it when the
+        # years are already in the cache file
+        import holidays
+
+        logger.debug(f"Computing the holidays of {country} in {year}.")
+        return frozenset(holidays.country_holidays(country, years=year))
+
+    @staticmethod
+    def _library_version() -> Union[str, None]:
+        """Returns the installed version of the holidays library, read 
+            from its metadata without importing it."""
+        try:
+            return metadata.version("holidays")
+        except metadata.PackageNotFoundError:
+            return None
+
+    def _load(self) -> None:
+        """Loads the years saved in the cache file."""
+        if self.cache_file is None:
+            return
+
+        try:
+            with open(self.cache_file, "r") as handle:
+                saved = json.load(handle)
+
+            if saved.get("version") != self._library_version():
+                logger.info("The holidays library changed, the holiday "
+                            "cache is recomputed.")
+                return
+
+            for key, days in saved["years"].items():
+                country, year = key.split("-")
+                self._years[(country, int(year))] = frozenset(
+                    date.fromisoformat(day) for day in days)
+
+        except FileNotFoundError:
+            return
+
+        except (OSError, ValueError, AttributeError, KeyError) as e:
+            logger.warning(f"Can't read the holiday cache "
+                           f"{self.cache_file}: {e}")
+
+    def _save(self) -> None:
+        """Saves the computed years in the cache file. Must be called
+            holding the lock."""
+        if self.cache_file is None:
+            return
+
+        years = {f"{country}-{year}": sorted(day.isoformat() for day in days)
+                 for (country, year), days in self._years.items()}
+        saved = {"version": self._library_version(), "years": years}
+        temp_file = f"{self.cache_file}.{os.getpid()}.tmp"
+
+        try:
+            os.makedirs(os.path.dirname(self.cache_file) or ".", exist_ok=True)
+            with open(temp_file, "w") as handle:
+                json.dump(saved, handle)
+            os.replace(temp_file, self.cache_file)
+
+        except OSError as e:
+            logger.warning(f"Can't save the holiday cache "
+                           f"{self.cache_file}: {e}")
+
+_calendar = None
+_calendar_lock = threading.Lock()
+
+def get_calendar() -> HolidayCalendar:
+    """Returns the holiday calendar of the process, creating it the first time.
+
+    Returns:
+        HolidayCalendar: The shared calendar.
+    """
+    global _calendar
+
+    with _calendar_lock:
+        if _calendar is None:
+            _calendar = HolidayCalendar()
+
+    return _calendar
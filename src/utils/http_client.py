@@ -0,0 +1,251 @@
+# Copyright (C) by Pietrobon Andrea - All Rights Reserved
+#
+# This file is part of the project: TelegramBot-AmazonOffers
+# It can only be distributed from Andrea Pietrobon's official Github profile
+# The use of the project TelegramBot-AmazonOffers or of this file follow
+# the rules indicated in the LICENSE file.
+# The redistribution or sale of the files without the written consent
+# of the author is not authorized.
+#
+# Written by Pietrobon Andrea, Jan 2024
+# Official website <https://pietrobonandrea.com>
+# Github website <https://github.com/Piero24>
+
+# Standard library modules
+import os
+import json
+import hashlib
+import logging
+import threading
+from typing import Union
+
+# External libraries
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Importing internal modules
+from utils.log_manager import setup_logger
+
+# Setting up logger
+setup_logger()
+logger = logging.getLogger(__name__)
+
+# (connect, read) timeouts in seconds
+TIMEOUT = (5, 15)
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 0.5
+POOL_SIZE = 10
+
+CACHE_DIR = "archive/cache/download"
+MAX_CACHED_FILES = 2000
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session() -> requests.Session:
+    """Returns the HTTP session shared by the process, creating it the
+        first time.
+
+    The session keeps the connections alive between requests (so the
+        TLS handshake with the Amazon image CDN is paid only once) and
+        retries with exponential backoff on connection errors, 429 and
+        5xx responses.
+
+    Returns:
+        requests.Session: The shared session.
+    """
+    global _session
+
+    with _session_lock:
+        if _session is None:
+            retry = Retry(total=MAX_RETRIES,
+                          backoff_factor=BACKOFF_FACTOR,
+                          status_forcelist=(429, 500, 502, 503, 504),
+                          allowed_methods=frozenset(["GET", "HEAD"]),
+                          raise_on_status=False)
+
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE,
+                                  pool_maxsize=POOL_SIZE,
+                                  max_retries=retry)
+
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+
+    return _session
+
+class ConditionalGetCache:
+    """Local copy of downloaded files revalidated with conditional GET
+        requests.
+
+    For each URL the body of the response is saved with its ETag and
+        Last-Modified headers. The next request for the same URL sends
+        If-None-Match and If-Modified-Since and, when the server answers
+        304 Not Modified, the local copy is returned without downloading
+        the body again.
+
+    Attributes:
+        cache_dir (str): The directory where the files are saved.
+        max_files (int): The maximum number of files kept. When exceeded the
+            least recently used files are deleted.
+
+    Methods:
+        get: Returns the body of a URL, using the local copy if still valid.
+        prune: Deletes the least recently used files over the limit.
+    """
+    def __init__(
+            self,
+            cache_dir: str = CACHE_DIR,
+            max_files: int = MAX_CACHED_FILES
+        ) -> None:
+        """Initializes the cache and creates its directory.
+
+        Args:
+            cache_dir (str): The directory where the files are saved.
+            max_files (int): The maximum number of files kept.
+        """
+        self.cache_dir = cache_dir
+        self.max_files = max_files
+        self._writes = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _paths(self, url: str) -> tuple[str, str]:
+        """Returns the path of the body and of the metadata of a URL."""
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        base = os.path.join(self.cache_dir, key)
+        return f"{base}.bin", f"{base}.json"
+
+    def _read(self, url: str) -> tuple[Union[bytes, None], dict]:
+        """Returns the cached body and metadata of a URL, if any."""
+        body_path, meta_path = self._paths(url)
+
+        try:
+            with open(meta_path, "r") as handle:
+                meta = json.load(handle)
+            with open(body_path, "rb") as handle:
+                body = handle.read()
+
+        except (OSError, ValueError):
+            return None, {}
+
+        # Touch the file so the pruning keeps the recently used ones
+        os.utime(body_path)
+        return body, meta
+
+    def _write(self, url: str, body: bytes, meta: dict) -> None:
+        """Saves the body and metadata of a URL. Files are written under a
+            temporary name and then renamed so readers never see a
+            partial file."""
+        body_path, meta_path = self._paths(url)
+        suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+
+        try:
+            with open(body_path + suffix, "wb") as handle:
+                handle.write(body)
+            with open(meta_path + suffix, "w") as handle:
+                json.dump(meta, handle)
+
+            os.replace(body_path + suffix, body_path)
+            os.replace(meta_path + suffix, meta_path)
+
+        except OSError as e:
+            logger.warning(f"Can't save {url} in the download cache: {e}")
+            return
+
+        self._writes += 1
+        if self._writes % 100 == 0:
+            self.prune()
+
+    def get(self, url: str) -> Union[bytes, None]:
+        """Returns the body of a URL, using the local copy if the server
+            confirms it is still valid.
+
+        Args:
+            url (str): The URL to download.
+
+        Returns:
+            Union[bytes, None]: The body of the response, or None if the
+                download failed and there is no local copy.
+
+        Raises:
+            requests.RequestException: If the request fails and there is
+                no local copy to fall back to.
+        """
+        cached_body, meta = self._read(url)
+
+        headers = {}
+        if cached_body is not None:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        try:
+            response = get_session().get(url, headers=headers,
+                                         timeout=TIMEOUT)
+
+        except requests.RequestException as e:
+            if cached_body is None:
+                raise
+            logger.warning(f"Serving {url} from the download cache "
+                           f"after a request error: {e}")
+            return cached_body
+
+        if response.status_code == 304 and cached_body is not None:
+            logger.debug(f"Not modified, served from the download "
+                         f"cache: {url}")
+            return cached_body
+
+        if not response.ok:
+            logger.warning(f"Error downloading {url}. "
+                           f"Status code: {response.status_code}")
+            return cached_body
+
+        body = response.content
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+
+        if etag or last_modified:
+            self._write(url, body, {"etag": etag,
+                                    "last_modified": last_modified})
+        return body
+
+    def prune(self) -> None:
+        """Deletes the least recently used files when there are more
+            than max_files."""
+        try:
+            entries = [entry for entry in os.scandir(self.cache_dir)
+                       if entry.name.endswith(".bin")]
+        except OSError:
+            return
+
+        if len(entries) <= self.max_files:
+            return
+
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:len(entries) - self.max_files]:
+            for path in (entry.path, entry.path[:-4] + ".json"):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+        logger.debug(f"Download cache pruned to {self.max_files} files.")
+
+_download_cache = None
+
+def get_download_cache() -> ConditionalGetCache:
+    """Returns the download cache of the process, creating it the first time.
+
+    Returns:
+        ConditionalGetCache: The shared download cache.
+    """
+    global _download_cache
+
+    with _session_lock:
+        if _download_cache is None:
+            _download_cache = ConditionalGetCache()
+
+    return _download_cache
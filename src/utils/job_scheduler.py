@@ -0,0 +1,368 @@
+# Copyright (C) by Pietrobon Andrea - All Rights Reserved
+#
+# This file is part of the project: TelegramBot-AmazonOffers
+# It can only be distributed from Andrea Pietrobon's official Github profile
+# The use of the project TelegramBot-AmazonOffers or of this file follow
+# the rules indicated in the LICENSE file.
+# The redistribution or sale of the files without the written consent
+# of the author is not authorized.
+#
+# Written by Pietrobon Andrea, Jan 2024
+# Official website <https://pietrobonandrea.com>
+# Github website <https://github.com/Piero24>
+
+# Standard library modules
+import time
+import heapq
+import logging
+import itertools
+import threading
+from typing import Any, Callable, Union
+
+# Importing internal modules
+from utils.log_manager import setup_logger
+
+# Setting up logger
+setup_logger()
+logger = logging.getLogger(__name__)
+
+class Job:
+    """A timed job held by the Scheduler.
+
+    Attributes:
+        name (str): The name of the job, used in the logs.
+        action (Callable[[], Any]): The function run by the job.
+        when (float): The time (as returned by time.time) the job runs at.
+        every (Union[Callable[[], float], float, None]): The policy of a
+            repeating job: the delay in seconds before the next run, or a
+            function returning it. None for a job that runs once.
+        background (bool): If True the job runs on its own thread so it
+            doesn't hold the other jobs back.
+        cancelled (bool): True if the job was cancelled.
+    """
+    def __init__(
+            self,
+            name: str,
+            action: Callable[[], Any],
+            when: float,
+            every: Union[Callable[[], float], float, None] = None,
+            background: bool = False
+        ) -> None:
+        """Initializes a Job with the provided information.
+
+        Args:
+            name (str): The name of the job.
+            action (Callable[[], Any]): The function run by the job.
+            when (float): The time the job runs at.
+            every (Union[Callable[[], float], float, None]): The policy of
+                a repeating job.
+            background (bool): If True the job runs on its own thread.
+        """
+        self.name = name
+        self.action = action
+        self.when = when
+        self.every = every
+        self.background = background
+        self.cancelled = False
+
+    def __repr__(self) -> str:
+        """Returns a string representation of the Job object."""
+        return (
+            f"Job(name={self.name}, "
+            f"when={time.strftime('%d-%m-%Y %H:%M:%S', time.localtime(self.when))}, "
+            f"background={self.background}, "
+            f"cancelled={self.cancelled})"
+        )
+
+    def next_delay(self) -> Union[float, None]:
+        """Returns the delay before the next run of a repeating job.
+
+        Returns:
+            Union[float, None]: The delay in seconds, or None if the job
+                runs once.
+        """
+        if self.every is None:
+            return None
+        if callable(self.every):
+            return self.every()
+        return self.every
+
+class Scheduler:
+    """Heap-based scheduler of timed jobs.
+
+    The jobs (posting slots, sweeps, maintenance, out-of-hours wake-ups)
+        are kept in a heap ordered by time. The thread calling run sleeps on
+        a condition until the first job is due, so a new job, a cancellation
+        or a shutdown wakes it immediately instead of waiting for the end
+        of a blocking time.sleep.
+
+    A job can return a number of seconds to choose when it runs again;
+        otherwise a repeating job runs again after the delay given by its
+        policy.
+
+    Attributes:
+        stopping (threading.Event): Set when the scheduler is shutting down.
+        running (bool): True while the loop of run is running.
+        current_job (Union[Job, None]): The job running in the loop.
+        current_since (Union[float, None]): The time the current job started.
+
+    Methods:
+        call_at: Schedules a job at a given time.
+        call_later: Schedules a job after a delay.
+        cancel: Cancels a job.
+        run: Runs the jobs until shutdown.
+        shutdown: Stops the scheduler.
+        sleep: Waits for a delay unless the scheduler is shutting down.
+        next_wakeup: Returns the time of the next job.
+        jobs: Returns the pending jobs.
+        state: Returns the state of the scheduler.
+    """
+    def __init__(self) -> None:
+        """Initializes an empty scheduler."""
+        self.stopping = threading.Event()
+        self.running = False
+        self.current_job = None
+        self.current_since = None
+        self._heap = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._threads = set()
+
+    def call_at(
+            self,
+            when: float,
+            action: Callable[[], Any],
+            name: str = "",
+            every: Union[Callable[[], float], float, None] = None,
+            background: bool = False
+        ) -> Job:
+        """Schedules a job at a given time.
+
+        Args:
+            when (float): The time (as returned by time.time) of the job.
+            action (Callable[[], Any]): The function run by the job.
+            name (str): The name of the job.
+            every (Union[Callable[[], float], float, None]): The policy of a
+                repeating job: the delay before the next run or a function
+                returning it.
+            background (bool): If True the job runs on its own thread.
+
+        Returns:
+            Job: The scheduled job, that can be cancelled.
+        """
+        job = Job(name or getattr(action, "__name__", "job"), action, when,
+                  every, background)
+        self._push(job)
+        return job
+
+    def call_later(
+            self,
+            delay: float,
+            action: Callable[[], Any],
+            name: str = "",
+            every: Union[Callable[[], float], float, None] = None,
+            background: bool = False
+        ) -> Job:
+        """Schedules a job after a delay.
+
+        Args:
+            delay (float): The delay in seconds.
+            action (Callable[[], Any]): The function run by the job.
+            name (str): The name of the job.
+            every (Union[Callable[[], float], float, None]): The policy of a
+                repeating job.
+            background (bool): If True the job runs on its own thread.
+
+        Returns:
+            Job: The scheduled job, that can be cancelled.
+        """
+        return self.call_at(time.time() + max(0, delay), action, name,
+                            every, background)
+
+    def cancel(self, job: Job) -> None:
+        """Cancels a job. Cancelled jobs are skipped when they are due.
+
+        Args:
+            job (Job): The job to cancel.
+        """
+        with self._condition:
+            job.cancelled = True
+            self._condition.notify_all()
+
+    def next_wakeup(self) -> Union[Job, None]:
+        """Returns the next job that will run.
+
+        Returns:
+            Union[Job, None]: The next job, or None if there are no jobs.
+        """
+        with self._condition:
+            pending = [entry for entry in self._heap if not entry[2].cancelled]
+            return min(pending)[2] if pending else None
+
+    def jobs(self) -> list[Job]:
+        """Returns the pending jobs ordered by time.
+
+        Returns:
+            list[Job]: The pending jobs.
+        """
+        with self._condition:
+            return [job for _, _, job in sorted(self._heap)
+                    if not job.cancelled]
+
+    def state(self) -> dict:
+        """Returns the state of the scheduler.
+
+        Returns:
+            dict: The state ("running", "stopping" or "stopped"), the job 
+                running in the loop and since when, and the next job with 
+                its time.
+        """
+        if self.stopping.is_set():
+            status = "stopping" if self.running else "stopped"
+        else:
+            status = "running" if self.running else "stopped"
+
+        current, since = self.current_job, self.current_since
+        next_job = self.next_wakeup()
+
+        return {
+            "state": status,
+            "current_job": current.name if current is not None else None,
+            "current_since": since,
+            "next_job": next_job.name if next_job is not None else None,
+            "next_wakeup": next_job.when if next_job is not None else None,
+        }
+
+    def run(self) -> None:
+        """Runs the jobs when they are due until shutdown is called."""
+        logger.info("Scheduler started.")
+        self.running = True
+
+        try:
+            while not self.stopping.is_set():
+                job = self._next_due()
+                if job is None:
+                    break
+
+                if job.background:
+                    thread = threading.Thread(target=self._execute, 
+                                              args=(job,),
+                                              name=f"job-{job.name}",
+                                              daemon=True)
+                    self._threads.add(thread)
+                    thread.start()
+                else:
+                    self.current_job, self.current_since = job, time.time()
+                    try:
+                        self._execute(job)
+                    finally:
+                        self.current_job, self.current_since = None, None
+
+        finally:
+            self.running = False
+            logger.info("Scheduler stopped.")
+
+    def shutdown(self, timeout: Union[float, None] = None) -> None:
+        """Stops the scheduler: the pending jobs are cancelled, the loop
+            returns after the running job and the background jobs are
+            waited for.
+
+        Args:
+            timeout (Union[float, None]): The maximum time to wait for each
+                background job. None waits without limit.
+        """
+        with self._condition:
+            self.stopping.set()
+            for _, _, job in self._heap:
+                job.cancelled = True
+            self._heap.clear()
+            self._condition.notify_all()
+
+        for thread in list(self._threads):
+            if thread is not threading.current_thread():
+                thread.join(timeout)
+
+    def sleep(self, delay: float) -> bool:
+        """Waits for a delay, returning early if the scheduler is shutting
+            down. Meant for the waits inside the jobs.
+
+        Args:
+            delay (float): The delay in seconds.
+
+        Returns:
+            bool: True if the delay elapsed, False on shutdown.
+        """
+        return not self.stopping.wait(max(0, delay))
+
+    def _push(self, job: Job) -> None:
+        """Adds a job to the heap and wakes up the loop."""
+        with self._condition:
+            if self.stopping.is_set():
+                job.cancelled = True
+                return
+            heapq.heappush(self._heap, (job.when, next(self._counter), job))
+            self._condition.notify_all()
+
+    def _next_due(self) -> Union[Job, None]:
+        """Waits until the first job is due and pops it. Returns None on
+            shutdown."""
+        with self._condition:
+            while not self.stopping.is_set():
+                while self._heap and self._heap[0][2].cancelled:
+                    heapq.heappop(self._heap)
+
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+
+                delay = self._heap[0][0] - time.time()
+                if delay <= 0:
+                    return heapq.heappop(self._heap)[2]
+
+                self._condition.wait(delay)
+
+        return None
+
+    def _execute(self, job: Job) -> None:
+        """Runs a job and schedules its next run."""
+        delay = None
+
+        try:
+            result = job.action()
+            if isinstance(result, (int, float)) and not isinstance(result,
+                                                                   bool):
+                delay = result
+
+        except Exception as e:
+            logger.critical(f"Error during the job {job.name}: "
+                            f"{type(e)} - {e}")
+
+        finally:
+            self._threads.discard(threading.current_thread())
+
+        if job.cancelled or self.stopping.is_set():
+            return
+
+        if delay is None:
+            delay = job.next_delay()
+
+        if delay is not None:
+            job.when = time.time() + max(0, delay)
+            self._push(job)
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler() -> Scheduler:
+    """Returns the scheduler of the process, creating it the first time.
+
+    Returns:
+        Scheduler: The shared scheduler.
+    """
+    global _scheduler
+
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = Scheduler()
+
+    return _scheduler
@@ -13,21 +13,296 @@
 
 # Standard library modules
 import os
+import time
+import gzip
+import json
+import queue
+import atexit
+import shutil
 import logging
+import threading
+import logging.handlers
 from datetime import datetime
+from typing import Union
+
+# Importing internal modules
+from configs import settings
+
+# Functions whose messages (ASIN lists, products without discount) are
+# rate limited by the RateLimitFilter
+RATE_LIMITED_FUNCTIONS = ("search_items_by_kw", "print_no_discount")
+# Length in seconds of the window of the RateLimitFilter
+RATE_LIMIT_WINDOW = 60
+
+_listener = None
+_queue_handler = None
+_setup_lock = threading.Lock()
+
+class ModuleLevelFilter(logging.Filter):
+    """Drops the records under the level configured for their module.
+
+    Most modules log through the root logger, so the level is looked up
+        by the name of the logger and then by the name of the module that
+        emitted the record.
+
+    Attributes:
+        levels (dict[str, int]): The minimum level of each module.
+        default (int): The minimum level of the other modules.
+    """
+    def __init__(self, levels: dict[str, int], default: int) -> None:
+        """Initializes the filter.
+
+        Args:
+            levels (dict[str, int]): The minimum level of each module.
+            default (int): The minimum level of the other modules.
+        """
+        super().__init__()
+        self.levels = levels
+        self.default = default
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        """Returns True if the record must be logged."""
+        level = self.levels.get(record.name,
+                                self.levels.get(record.module, self.default))
+        return record.levelno >= level
+
+class RateLimitFilter(logging.Filter):
+    """Limits the number of records logged by each line of the high-volume
+        functions in a time window.
+
+    Errors are never dropped. The first record logged after a window with
+        dropped records reports how many were dropped.
+
+    Attributes:
+        functions (tuple[str]): The names of the rate limited functions.
+        limit (int): The maximum number of records of a line in a window.
+        window (float): The length of the window in seconds.
+    """
+    def __init__(
+            self,
+            functions: tuple[str],
+            limit: int,
+            window: float = RATE_LIMIT_WINDOW
+        ) -> None:
+        """Initializes the filter.
+
+        Args:
+            functions (tuple[str]): The names of the rate limited functions.
+            limit (int): The maximum number of records of a line in a window.
+            window (float): The length of the window in seconds.
+        """
+        super().__init__()
+        self.functions = functions
+        self.limit = limit
+        self.window = window
+        self._lock = threading.Lock()
+        # (pathname, lineno) -> [window start, logged, dropped]
+        self._sites = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        """Returns True if the record must be logged."""
+        if (record.funcName not in self.functions or
+            record.levelno >= logging.ERROR):
+            return True
+
+        now = time.monotonic()
+        site = (record.pathname, record.lineno)
+
+        with self._lock:
+            state = self._sites.get(site)
+
+            if state is None or now - state[0] >= self.window:
+                dropped = state[2] if state is not None else 0
+                self._sites[site] = [now, 1, 0]
+
+                if dropped:
+                    record.msg = (f"{record.getMessage()} ({dropped} similar "
+                                  f"messages dropped)")
+                    record.args = None
+                return True
+
+            if state[1] < self.limit:
+                state[1] += 1
+                return True
+
+            state[2] += 1
+            return False
+
+class MonthlyRotatingFileHandler(logging.handlers.BaseRotatingHandler):
+    """Writes the records in log/YYYY/MM.log, switching file when the 
+        month changes and when the file gets over a maximum size.
+
+    When the size is exceeded the file is renamed MM.1.log (MM.2.log, ...) 
+        and a new MM.log is started. The closed files can be compressed with 
+        gzip: the compression runs on its own thread so the logging thread 
+        never waits for it.
+
+    Attributes:
+        directory (str): The root directory of the logs.
+        max_bytes (int): The maximum size of a file. 0 means no limit.
+        compress (bool): If True the closed files are compressed with gzip.
+    """
+    def __init__(
+            self, 
+            directory: str = "./log", 
+            max_bytes: int = 0, 
+            compress: bool = False
+        ) -> None:
+        """Opens the file of the current month.
+
+        Args:
+            directory (str): The root directory of the logs.
+            max_bytes (int): The maximum size of a file. 0 means no limit.
+            compress (bool): If True the closed files are compressed.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self._next_month = 0
+        super().__init__(self._month_file(), 'a', encoding='utf-8')
+
+    def _month_file(self) -> str:
+        """Returns the file of the current month, creating its directory 
+            and computing when the next month starts."""
+        now = datetime.now()
+        os.makedirs(os.path.join(self.directory, now.strftime('%Y')), 
+                    exist_ok=True)
+
+        if now.month == 12:
+            next_month = datetime(now.year + 1, 1, 1)
+        else:
+            next_month = datetime(now.year, now.month + 1, 1)
+        self._next_month = next_month.timestamp()
+
+        return os.path.join(self.directory, now.strftime('%Y'), 
+                            f"{now.strftime('%m')}.log")
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        """Returns True if the month changed or the file is too big.
+
+        The size is the position in the file, so a file can exceed 
+            max_bytes by one record instead of formatting every record 
+            twice to measure it.
+        """
+        if record.created >= self._next_month:
+            return True
+
+        if self.max_bytes > 0 and self.stream is not None:
+            return self.stream.tell() >= self.max_bytes
+
+        return False
+
+    def doRollover(self) -> None:
+        """Closes the current file and opens the next one."""
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+        closed = self.baseFilename
+
+        if time.time() >= self._next_month:
+            self.baseFilename = os.path.abspath(self._month_file())
+        else:
+            base = self.baseFilename[:-len(".log")]
+            index = 1
+            while (os.path.exists(f"{base}.{index}.log") or 
+                   os.path.exists(f"{base}.{index}.log.gz")):
+                index += 1
+            closed = f"{base}.{index}.log"
+            os.replace(self.baseFilename, closed)
+
+        if (self.compress and closed != self.baseFilename and 
+            os.path.exists(closed)):
+            threading.Thread(target=compress_file, args=(closed,), 
+                             name="log-compressor", daemon=True).start()
+
+        self.stream = self._open()
+
+def compress_file(path: str) -> None:
+    """Compresses a file with gzip into path.gz and deletes it.
+
+    Args:
+        path (str): The path of the file.
+    """
+    temp_path = f"{path}.gz.tmp"
+
+    try:
+        with open(path, 'rb') as source, gzip.open(temp_path, 'wb') as target:
+            shutil.copyfileobj(source, target)
+        os.replace(temp_path, f"{path}.gz")
+        os.remove(path)
+
+    except OSError as e:
+        # The compressor runs on its own thread, the record is only queued
+        logging.getLogger(__name__).error(f"Can't compress the log file "
+                                          f"{path}: {e}")
+
+class JsonFormatter(logging.Formatter):
+    """Formats each record as a JSON object on a single line.
+
+    The fields of a record emitted by a pipeline_stage.Stage (stage, 
+        duration_ms, items_in, items_out, api_calls, errors) are added to 
+        the object so the latency of each stage of the pipeline can be 
+        charted.
+    """
+    def format(self, record: logging.LogRecord) -> str:
+        """Returns the record as a JSON line."""
+        entry = {
+            "time": self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            "level": record.levelname,
+            "module": record.module,
+            "function": record.funcName,
+            "message": record.getMessage(),
+        }
+
+        stage = getattr(record, "stage_fields", None)
+        if stage is not None:
+            entry.update(stage)
+
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+def level_of(name: str, unknown: Union[list, None] = None) -> int:
+    """Returns the number of a level from its name (e.g. "INFO").
+
+    Args:
+        name (str): The name of the level.
+        unknown (Union[list, None]): The list the name is appended to if 
+            it isn't a level.
+
+    Returns:
+        int: The level, DEBUG if the name isn't a level.
+    """
+    level = logging.getLevelName(str(name).upper())
+
+    if not isinstance(level, int):
+        if unknown is not None:
+            unknown.append(name)
+        return logging.DEBUG
+    return level
 
 def setup_logger() -> logging.Logger:
     """
     Set up and configure a logger for logging messages.
 
-    The function creates a logger that outputs messages to a file in the 'log' 
-    directory. The log file is named based on the current year and month.
+    The function creates a logger that outputs messages to a file in the 'log'
+    directory. The log file is named based on the current year and month and
+    changes when the month changes (see MonthlyRotatingFileHandler).
+
+    The configuration is done only once per process, the next calls just
+    return the logger. The records are put in a queue and written to the
+    file by a QueueListener thread, so the threads that log never wait for
+    the disk. The records are filtered before being queued by the levels
+    of LOG_LEVEL and LOG_LEVELS in the settings and by the rate limit of
+    the high-volume messages (LOG_RATE_LIMIT records per minute).
 
     Returns:
         logging.Logger: The configured logger.
 
     Example:
-        Add the following code to the top of a file to configure a 
+        Add the following code to the top of a file to configure a
             logger for that file.
         setup_logger()
         logger = logging.getLogger(__name__)
@@ -39,22 +314,71 @@ def setup_logger() -> logging.Logger:
         logger.debug("This is a debug message.")
         logging.critical("This is a critical message.")
     """
-    now = datetime.now()
-    log_directory = f"./log/{now.strftime('%Y')}"
-    log_file = f"{log_directory}/{now.strftime('%m')}.log"
+    global _listener, _queue_handler
 
-    # Create directories if they don't exist
-    os.makedirs(log_directory, exist_ok=True)
+    logger = logging.getLogger()
 
-    pre_format = '%(asctime)s :: [%(filename)-25s] - [%(funcName)-23s]'
-    post_format = '[%(levelname)-8s] - %(message)s'
+    with _setup_lock:
+        if _listener is not None:
+            return logger
 
-    format = pre_format + ' - ' + post_format
-    # Configure logging to output messages to a file
-    logging.basicConfig(filename=log_file,
-                        level=logging.DEBUG,
-                        format=format,
-                        datefmt='%Y-%m-%d %H:%M:%S')
+        pre_format = '%(asctime)s :: [%(filename)-25s] - [%(funcName)-23s]'
+        post_format = '[%(levelname)-8s] - %(message)s'
 
-    logger = logging.getLogger()
-    return logger
\ No newline at end of file
+        format = pre_format + ' - ' + post_format
+        file_handler = MonthlyRotatingFileHandler(
+            "./log", 
+            getattr(settings, "LOG_MAX_MB", 0) * 1024 * 1024,
+            getattr(settings, "LOG_COMPRESS", False))
+
+        if getattr(settings, "LOG_FORMAT", "text") == "json":
+            file_handler.setFormatter(JsonFormatter())
+        else:
+            file_handler.setFormatter(logging.Formatter(
+                format, datefmt='%Y-%m-%d %H:%M:%S'))
+
+        unknown = []
+        default_level = level_of(getattr(settings, "LOG_LEVEL", "DEBUG"),
+                                 unknown)
+        module_levels = {module: level_of(level, unknown) for module, level
+                         in getattr(settings, "LOG_LEVELS", {}).items()}
+
+        queue_handler = logging.handlers.QueueHandler(queue.SimpleQueue())
+        queue_handler.addFilter(ModuleLevelFilter(module_levels,
+                                                  default_level))
+        queue_handler.addFilter(RateLimitFilter(
+            RATE_LIMITED_FUNCTIONS, getattr(settings, "LOG_RATE_LIMIT", 20)))
+
+        # The root logger lets everything through, the filters decide
+        logger.setLevel(min([default_level, *module_levels.values()]))
+        logger.addHandler(queue_handler)
+
+        _queue_handler = queue_handler
+        _listener = logging.handlers.QueueListener(queue_handler.queue,
+                                                   file_handler)
+        _listener.start()
+        atexit.unregister(stop_logger)
+        atexit.register(stop_logger)
+
+    for name in unknown:
+        logger.warning(f"Unknown log level {name!r} in the settings, "
+                       f"DEBUG is used instead.")
+
+    return logger
+
+def stop_logger() -> None:
+    """Writes the records still in the queue and stops the logging thread. 
+        A later setup_logger configures the logging again."""
+    global _listener, _queue_handler
+
+    with _setup_lock:
+        if _listener is None:
+            return
+
+        logging.getLogger().removeHandler(_queue_handler)
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+
+        _listener = None
+        _queue_handler = None
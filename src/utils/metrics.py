@@ -0,0 +1,342 @@
+# Copyright (C) by Pietrobon Andrea - All Rights Reserved
+#
+# This file is part of the project: TelegramBot-AmazonOffers
+# It can only be distributed from Andrea Pietrobon's official Github profile
+# The use of the project TelegramBot-AmazonOffers or of this file follow
+# the rules indicated in the LICENSE file.
+# The redistribution or sale of the files without the written consent
+# of the author is not authorized.
+#
+# Written by Pietrobon Andrea, Jan 2024
+# Official website <https://pietrobonandrea.com>
+# Github website <https://github.com/Piero24>
+
+# Standard library modules
+import time
+import bisect
+import functools
+import threading
+import contextlib
+from typing import Any, Callable, Iterator, Union
+
+# Upper bounds in seconds of the buckets of the histograms
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                   2.5, 5.0, 10.0, 30.0, 60.0)
+
+class Counter:
+    """A value that only goes up (e.g. the number of PA-API requests).
+
+    Attributes:
+        name (str): The name of the metric.
+        help (str): The description of the metric.
+        value (float): The current value.
+    """
+    kind = "counter"
+
+    def __init__(self, name: str, help: str = "") -> None:
+        """Initializes the counter at 0.
+
+        Args:
+            name (str): The name of the metric.
+            help (str): The description of the metric.
+        """
+        self.name = name
+        self.help = help
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        """Increments the counter.
+
+        Args:
+            amount (float): The increment. Defaults to 1.
+        """
+        with self._lock:
+            self.value += amount
+
+    def snapshot(self) -> dict:
+        """Returns the current value."""
+        return {"type": self.kind, "value": self.value}
+
+class Gauge(Counter):
+    """A value that goes up and down (e.g. the depth of a queue)."""
+    kind = "gauge"
+
+    def set(self, value: float) -> None:
+        """Sets the gauge to a value.
+
+        Args:
+            value (float): The new value.
+        """
+        with self._lock:
+            self.value = value
+
+    def dec(self, amount: float = 1) -> None:
+        """Decrements the gauge.
+
+        Args:
+            amount (float): The decrement. Defaults to 1.
+        """
+        self.inc(-amount)
+
+class Histogram:
+    """Distribution of durations in seconds, counted in buckets.
+
+    Attributes:
+        name (str): The name of the metric.
+        help (str): The description of the metric.
+        buckets (tuple[float]): The upper bounds of the buckets.
+        counts (list[int]): The number of observations of each bucket,
+            plus a last one for the observations over every bound.
+        count (int): The number of observations.
+        sum (float): The sum of the observations.
+    """
+    kind = "histogram"
+
+    def __init__(
+            self,
+            name: str,
+            help: str = "",
+            buckets: tuple[float] = DEFAULT_BUCKETS
+        ) -> None:
+        """Initializes an empty histogram.
+
+        Args:
+            name (str): The name of the metric.
+            help (str): The description of the metric.
+            buckets (tuple[float]): The upper bounds of the buckets.
+        """
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        """Adds an observation.
+
+        Args:
+            seconds (float): The observed duration in seconds.
+        """
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += seconds
+
+    @contextlib.contextmanager
+    def time(self) -> Iterator[None]:
+        """Observes the duration of a block."""
+        started = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.observe((time.perf_counter_ns() - started) / 1e9)
+
+    def snapshot(self) -> dict:
+        """Returns the buckets (cumulative, as in the Prometheus format),
+            the count and the sum."""
+        with self._lock:
+            counts = list(self.counts)
+            count, total = self.count, self.sum
+
+        cumulative = []
+        running = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            running += bucket_count
+            cumulative.append((bound, running))
+
+        return {"type": self.kind, "buckets": cumulative,
+                "count": count, "sum": total}
+
+class Registry:
+    """Collection of the metrics of the process, by name.
+
+    Methods:
+        counter: Returns a counter, creating it the first time.
+        gauge: Returns a gauge, creating it the first time.
+        histogram: Returns a histogram, creating it the first time.
+        metrics: Returns all the metrics.
+        snapshot: Returns the current values of all the metrics.
+    """
+    def __init__(self) -> None:
+        """Initializes an empty registry."""
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls: type, name: str, *args) -> Any:
+        """Returns a metric, creating it the first time."""
+        with self._lock:
+            metric = self._metrics.get(name)
+
+            if metric is None:
+                metric = cls(name, *args)
+                self._metrics[name] = metric
+
+            elif not isinstance(metric, cls):
+                raise ValueError(f"The metric {name} is a {metric.kind}.")
+
+        return metric
+
+    def counter(self, name: str, help: str = "") -> Counter:
+        """Returns a counter, creating it the first time.
+
+        Args:
+            name (str): The name of the metric.
+            help (str): The description of the metric.
+
+        Returns:
+            Counter: The counter.
+        """
+        return self._get(Counter, name, help)
+
+    def gauge(self, name: str, help: str = "") -> Gauge:
+        """Returns a gauge, creating it the first time.
+
+        Args:
+            name (str): The name of the metric.
+            help (str): The description of the metric.
+
+        Returns:
+            Gauge: The gauge.
+        """
+        return self._get(Gauge, name, help)
+
+    def histogram(
+            self,
+            name: str,
+            help: str = "",
+            buckets: tuple[float] = DEFAULT_BUCKETS
+        ) -> Histogram:
+        """Returns a histogram, creating it the first time.
+
+        Args:
+            name (str): The name of the metric.
+            help (str): The description of the metric.
+            buckets (tuple[float]): The upper bounds of the buckets.
+
+        Returns:
+            Histogram: The histogram.
+        """
+        return self._get(Histogram, name, help, buckets)
+
+    def metrics(self) -> list[Union[Counter, Gauge, Histogram]]:
+        """Returns all the metrics ordered by name."""
+        with self._lock:
+            return [self._metrics[name] for name in sorted(self._metrics)]
+
+    def snapshot(self) -> dict[str, dict]:
+        """Returns the current values of all the metrics.
+
+        Returns:
+            dict[str, dict]: The snapshot of each metric by name.
+
+        Example:
+            get_registry().snapshot()["paapi_requests_total"]["value"]
+        """
+        return {metric.name: metric.snapshot() for metric in self.metrics()}
+
+_registry = Registry()
+
+def get_registry() -> Registry:
+    """Returns the registry of the process.
+
+    Returns:
+        Registry: The shared registry.
+    """
+    return _registry
+
+def counter(name: str, help: str = "") -> Counter:
+    """Returns a counter of the registry of the process."""
+    return _registry.counter(name, help)
+
+def gauge(name: str, help: str = "") -> Gauge:
+    """Returns a gauge of the registry of the process."""
+    return _registry.gauge(name, help)
+
+def histogram(
+        name: str,
+        help: str = "",
+        buckets: tuple[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+    """Returns a histogram of the registry of the process."""
+    return _registry.histogram(name, help, buckets)
+
+def format_value(value: float) -> str:
+    """Formats a value for the text exposition format."""
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+def exposition(registry: Union[Registry, None] = None) -> str:
+    """Returns the metrics in the Prometheus text exposition format.
+
+    Args:
+        registry (Union[Registry, None]): The registry. Defaults to the 
+            registry of the process.
+
+    Returns:
+        str: The metrics, one sample per line.
+    """
+    registry = registry or _registry
+    lines = []
+
+    for metric in registry.metrics():
+        if metric.help:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        snapshot = metric.snapshot()
+
+        if metric.kind != "histogram":
+            lines.append(f"{metric.name} {format_value(snapshot['value'])}")
+            continue
+
+        for bound, count in snapshot["buckets"]:
+            lines.append(f'{metric.name}_bucket{{le="{format_value(bound)}"}}'
+                         f' {count}')
+        lines.append(f'{metric.name}_bucket{{le="+Inf"}} {snapshot["count"]}')
+        lines.append(f"{metric.name}_sum {format_value(snapshot['sum'])}")
+        lines.append(f"{metric.name}_count {snapshot['count']}")
+
+    return "\n".join(lines) + "\n"
+
+def timed(name: str, help: str = "") -> Callable[[Callable], Callable]:
+    """Decorator that observes the duration of each call of a function in
+        the histogram <name>_seconds and counts the calls that raised an
+        exception in <name>_errors_total.
+
+    The metrics are looked up once, when the function is decorated, so a
+        call costs two perf_counter_ns and one observation.
+
+    Args:
+        name (str): The base name of the metrics.
+        help (str): The description of the metrics.
+
+    Returns:
+        Callable[[Callable], Callable]: The decorator.
+
+    Example:
+        @timed("gen_img", "Render of an offer image")
+        def gen_img(...):
+    """
+    durations = histogram(f"{name}_seconds", help)
+    errors = counter(f"{name}_errors_total", f"{help} (errors)")
+
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter_ns()
+            try:
+                return function(*args, **kwargs)
+            except Exception:
+                errors.inc()
+                raise
+            finally:
+                durations.observe((time.perf_counter_ns() - started) / 1e9)
+        return wrapper
+
+    return decorator
@@ -0,0 +1,106 @@
+# Copyright (C) by Pietrobon Andrea - All Rights Reserved
+#
+# This file is part of the project: TelegramBot-AmazonOffers
+# It can only be distributed from Andrea Pietrobon's official Github profile
+# The use of the project TelegramBot-AmazonOffers or of this file follow
+# the rules indicated in the LICENSE file.
+# The redistribution or sale of the files without the written consent
+# of the author is not authorized.
+#
+# Written by Pietrobon Andrea, Jan 2024
+# Official website <https://pietrobonandrea.com>
+# Github website <https://github.com/Piero24>
+
+# Standard library modules
+import time
+import logging
+import contextlib
+from typing import Iterator
+
+# Importing internal modules
+from utils import metrics
+from utils import pipeline_state
+
+class Stage:
+    """Measures a stage of the pipeline and logs it with one record.
+
+    Used as a context manager the stage is timed and logged at the end of 
+        the block. The measure method instead only adds the time of a 
+        block, for a stage spread over many calls that is logged with emit.
+
+    Attributes:
+        name (str): The name of the stage (e.g. "harvest").
+        items_in (int): The number of items received by the stage.
+        items_out (int): The number of items produced by the stage.
+        api_calls (int): The number of calls to external APIs.
+        errors (int): The number of errors.
+        duration_ns (int): The measured time in nanoseconds.
+
+    Example:
+        with Stage("dedup", items_in=len(products)) as stage:
+            products = check_products_in_list(products, 3)
+            stage.items_out = len(products)
+    """
+    def __init__(self, name: str, items_in: int = 0) -> None:
+        """Initializes the stage.
+
+        Args:
+            name (str): The name of the stage.
+            items_in (int): The number of items received by the stage.
+        """
+        self.name = name
+        self.items_in = items_in
+        self.items_out = 0
+        self.api_calls = 0
+        self.errors = 0
+        self.duration_ns = 0
+        self._started = 0
+
+    def __enter__(self) -> 'Stage':
+        """Starts the timer."""
+        self._started = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        """Stops the timer and logs the stage."""
+        self.duration_ns += time.perf_counter_ns() - self._started
+        if exc_type is not None:
+            self.errors += 1
+        self.emit()
+
+    @contextlib.contextmanager
+    def measure(self) -> Iterator['Stage']:
+        """Adds the time of a block to the stage without logging it."""
+        started = time.perf_counter_ns()
+        try:
+            yield self
+        finally:
+            self.duration_ns += time.perf_counter_ns() - started
+
+    def emit(self) -> None:
+        """Logs the stage with one record, observes its duration in the 
+            histogram pipeline_<name>_seconds and shows it in the dashboard."""
+        metrics.histogram(f"pipeline_{self.name}_seconds", 
+                          f"Duration of the {self.name} stage").observe(
+                              self.duration_ns / 1e9)
+        metrics.counter(f"pipeline_{self.name}_items_total", 
+                        f"Items produced by the {self.name} stage").inc(
+                            self.items_out)
+        metrics.counter(f"pipeline_{self.name}_dropped_total", 
+                        f"Items filtered out by the {self.name} stage").inc(
+                            max(0, self.items_in - self.items_out))
+
+        fields = {
+            "stage": self.name,
+            "duration_ms": round(self.duration_ns / 1e6, 3),
+            "items_in": self.items_in,
+            "items_out": self.items_out,
+            "api_calls": self.api_calls,
+            "errors": self.errors,
+        }
+        pipeline_state.get_state().record_stage(fields)
+        logging.getLogger("pipeline").info(
+            f"Stage {self.name}: {fields['duration_ms']} ms - items "
+            f"{self.items_in} -> {self.items_out} - api calls "
+            f"{self.api_calls} - errors {self.errors}",
+            extra={"stage_fields": fields})
@@ -0,0 +1,138 @@
+# Copyright (C) by Pietrobon Andrea - All Rights Reserved
+#
+# This file is part of the project: TelegramBot-AmazonOffers
+# It can only be distributed from Andrea Pietrobon's official Github profile
+# The use of the project TelegramBot-AmazonOffers or of this file follow
+# the rules indicated in the LICENSE file.
+# The redistribution or sale of the files without the written consent
+# of the author is not authorized.
+#
+# Written by Pietrobon Andrea, Jan 2024
+# Official website <https://pietrobonandrea.com>
+# Github website <https://github.com/Piero24>
+
+# Standard library modules
+import time
+import threading
+from typing import Any, Union
+from collections import deque
+
+# Number of sent offers kept for the dashboard
+RECENT_SIZE = 50
+
+class PipelineState:
+    """Live state of the pipeline shown by the dashboard of the inspector.
+
+    The pipeline updates it while it runs and the web server only reads
+        it, so the dashboard never queries the databases.
+
+    Attributes:
+        recent (deque): The last sent offers, the newest last.
+        candidate_pool (int): The number of products left after the dedup
+            of the last iteration.
+        candidate_pool_at (Union[float, None]): When candidate_pool was
+            updated.
+        stages (dict[str, dict]): The last record of each stage.
+        sent_total (int): The number of offers sent since the start.
+
+    Methods:
+        record_sent: Adds a sent offer.
+        record_candidates: Records the size of the candidate pool.
+        record_stage: Records the timing of a stage.
+        recent_offers: Returns the last sent offers.
+        snapshot: Returns the state.
+    """
+    def __init__(self, size: int = RECENT_SIZE) -> None:
+        """Initializes an empty state.
+
+        Args:
+            size (int): The number of sent offers kept.
+        """
+        self.recent = deque(maxlen=size)
+        self.candidate_pool = 0
+        self.candidate_pool_at = None
+        self.stages = {}
+        self.sent_total = 0
+        self._lock = threading.Lock()
+
+    def record_sent(self, product: Any, chat_id: Union[int, str]) -> None:
+        """Adds a sent offer.
+
+        Args:
+            product (Product): The product of the offer.
+            chat_id (Union[int, str]): The chat it was sent to.
+        """
+        offer = {
+            "asin": product.asin,
+            "title": getattr(product, "title", None),
+            "price": getattr(product, "price", None),
+            "currency": getattr(product, "currency", None),
+            "discount": getattr(product, "discount", None),
+            "chat_id": chat_id,
+            "sent_at": time.time(),
+        }
+
+        with self._lock:
+            self.recent.append(offer)
+            self.sent_total += 1
+
+    def record_candidates(self, size: int) -> None:
+        """Records the size of the candidate pool.
+
+        Args:
+            size (int): The number of products left after the dedup.
+        """
+        self.candidate_pool = size
+        self.candidate_pool_at = time.time()
+
+    def record_stage(self, fields: dict) -> None:
+        """Records the timing of a stage.
+
+        Args:
+            fields (dict): The fields of the stage record (see pipeline_stage.Stage).
+        """
+        record = dict(fields, at=time.time())
+        with self._lock:
+            self.stages[fields["stage"]] = record
+
+    def recent_offers(self, limit: int = RECENT_SIZE) -> list[dict]:
+        """Returns the last sent offers, the newest first.
+
+        Args:
+            limit (int): The maximum number of offers.
+
+        Returns:
+            list[dict]: The offers.
+        """
+        with self._lock:
+            offers = list(self.recent)
+        return offers[::-1][:max(0, limit)]
+
+    def snapshot(self) -> dict:
+        """Returns the state of the pipeline.
+
+        Returns:
+            dict: The candidate pool, the number of sent offers and the
+                last record of each stage.
+        """
+        with self._lock:
+            stages = {name: dict(record)
+                      for name, record in self.stages.items()}
+            sent_total = self.sent_total
+
+        return {
+            "candidate_pool": self.candidate_pool,
+            "candidate_pool_at": self.candidate_pool_at,
+            "sent_total": sent_total,
+            "stages": stages,
+        }
+
+_state = PipelineState()
+
+def get_state() -> PipelineState:
+    """Returns the pipeline state of the process.
+
+    Returns:
+        PipelineState: The shared pipeline state.
+    """
+    return _state
@@ -20,6 +20,7 @@ from typing import Union
 from paapi5_python_sdk.item import Item
 
 # Importing internal modules
+from utils import metrics
 from utils.log_manager import setup_logger
 
 # Setting up logger
@@ -412,6 +413,8 @@ class Product:
         return list_of_products
     
     @classmethod
+    @metrics.timed("product_from_item", "Conversion of a PA-API item to a "
+                   "Product")
     def from_item(cls, item: Item) -> Union['Product', str, None]:
         """Create a Product instance from an item string.
 
@@ -0,0 +1,212 @@
+# Copyright (C) by Pietrobon Andrea - All Rights Reserved
+#
+# This file is part of the project: TelegramBot-AmazonOffers
+# It can only be distributed from Andrea Pietrobon's official Github profile
+# The use of the project TelegramBot-AmazonOffers or of this file follow
+# the rules indicated in the LICENSE file.
+# The redistribution or sale of the files without the written consent
+# of the author is not authorized.
+#
+# Written by Pietrobon Andrea, Jan 2024
+# Official website <https://pietrobonandrea.com>
+# Github website <https://github.com/Piero24>
+
+# Standard library modules
+import time
+import logging
+import threading
+from typing import Any, Callable, Union
+
+# Importing internal modules
+from utils.job_scheduler import Scheduler, get_scheduler
+from utils.log_manager import setup_logger
+
+# Setting up logger
+setup_logger()
+logger = logging.getLogger(__name__)
+
+# Estimate of the duration of a sweep before the first one is measured
+DEFAULT_SWEEP_SECONDS = 600
+# Weight of the last measured duration in the learned duration
+SMOOTHING = 0.3
+# The sweep is started this much earlier than the learned duration requires
+SAFETY_FACTOR = 1.2
+SAFETY_MARGIN = 60
+# A prefetched sweep older than this is too stale to be posted
+MAX_AGE = 30 * 60
+# Seconds between two checks for a shutdown while waiting for a sweep
+TAKE_POLL_SECONDS = 1
+
+class SweepPrefetcher:
+    """Runs the sweep of the next iteration in the background so that it
+        finishes just before the next posting slot.
+
+    The duration of the sweeps is learned with an exponential moving
+        average. When the next posting slot is known a background job of
+        the scheduler is set to start the sweep at slot - (learned duration
+        * SAFETY_FACTOR + SAFETY_MARGIN), so the posts go out on time with
+        prices fetched minutes earlier instead of prices as old as the wait
+        between two iterations.
+
+    Attributes:
+        sweep (Callable[[], Any]): The function that runs a sweep.
+        duration (float): The learned duration of a sweep in seconds.
+        scheduler (Scheduler): The scheduler running the sweep job.
+
+    Methods:
+        schedule: Schedules the sweep for a posting slot.
+        take: Returns the result of the prefetched sweep.
+        cancel: Cancels the sweep if it hasn't started yet.
+        record: Updates the learned duration with a foreground sweep.
+    """
+    def __init__(
+            self,
+            sweep: Callable[[], Any],
+            duration: float = DEFAULT_SWEEP_SECONDS,
+            scheduler: Union[Scheduler, None] = None
+        ) -> None:
+        """Initializes the prefetcher.
+
+        Args:
+            sweep (Callable[[], Any]): The function that runs a sweep.
+            duration (float): The initial estimate of the duration of
+                a sweep in seconds.
+            scheduler (Union[Scheduler, None]): The scheduler running the
+                sweep job. Defaults to the scheduler of the process.
+        """
+        self.sweep = sweep
+        self.duration = duration
+        self.scheduler = scheduler or get_scheduler()
+        self._lock = threading.Lock()
+        self._job = None
+        self._started = False
+        self._done = threading.Event()
+        self._result = None
+        self._finished_at = None
+
+    def schedule(self, slot: float) -> None:
+        """Schedules the sweep so that it finishes just before a posting 
+            slot.
+
+        Args:
+            slot (float): The time (as returned by time.time) of the next
+                posting slot.
+        """
+        self.cancel()
+
+        lead = self.duration * SAFETY_FACTOR + SAFETY_MARGIN
+        start_at = slot - lead
+
+        with self._lock:
+            self._started = False
+            self._done = threading.Event()
+            self._result = None
+            self._finished_at = None
+            self._job = self.scheduler.call_at(start_at, self._run, 
+                                               name="sweep", background=True)
+
+        logger.info(f"Next sweep starts in "
+                    f"{max(0, int(start_at - time.time())) // 60} minutes, "
+                    f"{int(lead) // 60} minutes before the posting slot.")
+
+    def take(self, timeout: Union[float, None] = None) -> Union[Any, None]:
+        """Returns the result of the prefetched sweep, waiting for it if it
+            is still running.
+
+        Args:
+            timeout (Union[float, None]): The maximum number of seconds to
+                wait for the sweep. Defaults to the lead of the sweep 
+                (learned duration * SAFETY_FACTOR + SAFETY_MARGIN).
+
+        Returns:
+            Union[Any, None]: The result of the sweep, or None if no sweep
+                was scheduled, it failed, it hasn't started yet, it didn't
+                finish in time, the scheduler is shutting down or its 
+                result is too old. In these cases the caller runs the 
+                sweep itself.
+        """
+        if timeout is None:
+            timeout = self.duration * SAFETY_FACTOR + SAFETY_MARGIN
+
+        with self._lock:
+            job, started, done = self._job, self._started, self._done
+            self._job = None
+
+        if job is None:
+            return None
+
+        if not started:
+            # The slot came before the start time of the sweep
+            self.scheduler.cancel(job)
+            return None
+
+        if not done.is_set():
+            logger.info("Waiting for the prefetched sweep to finish.")
+            deadline = time.monotonic() + timeout
+
+            while not done.wait(TAKE_POLL_SECONDS):
+                if self.scheduler.stopping.is_set():
+                    return None
+
+                if time.monotonic() >= deadline:
+                    logger.warning(f"The prefetched sweep didn't finish in "
+                                   f"{int(timeout)} seconds, sweeping in "
+                                   f"the foreground.")
+                    return None
+
+        result, finished_at = self._result, self._finished_at
+        self._result = None
+
+        if finished_at is None:
+            return None
+
+        if time.time() - finished_at > MAX_AGE:
+            logger.info("Prefetched sweep discarded, it is too old.")
+            return None
+
+        return result
+
+    def cancel(self) -> None:
+        """Cancels the scheduled sweep if it hasn't started yet."""
+        with self._lock:
+            if self._job is not None:
+                self.scheduler.cancel(self._job)
+                self._job = None
+
+    def record(self, elapsed: float) -> None:
+        """Updates the learned duration with a sweep run in the foreground.
+
+        Args:
+            elapsed (float): The duration of the sweep in seconds.
+        """
+        self.duration = (SMOOTHING * elapsed +
+                         (1 - SMOOTHING) * self.duration)
+
+    def _run(self) -> None:
+        """Runs the sweep as a job of the scheduler."""
+        with self._lock:
+            if self._job is None or self._job.cancelled:
+                return
+            self._started = True
+            done = self._done
+
+        started = time.monotonic()
+        try:
+            result = self.sweep()
+
+        except Exception as e:
+            logger.error(f"Error during the prefetched sweep: {e}")
+            done.set()
+            return
+
+        elapsed = time.monotonic() - started
+        self.record(elapsed)
+
+        with self._lock:
+            # Ignore the result if a new sweep was scheduled meanwhile
+            if self._done is done:
+                self._result = result
+                self._finished_at = time.time()
+        done.set()
+        logger.info(f"Prefetched sweep completed in {int(elapsed)} seconds "
+                    f"(learned duration {int(self.duration)} seconds).")
@@ -12,16 +12,15 @@
 # Github website <https://github.com/Piero24>
 
 # Standard library modules
-import time
 import random
 import logging
-
-# External libraries
-import holidays
-from datetime import date, datetime
+from typing import Optional, Union
+from datetime import datetime, time, timedelta
 
 # Importing internal modules
 from configs import settings
+from utils.job_scheduler import get_scheduler
+from utils.holiday_calendar import get_calendar
 from utils.log_manager import setup_logger
 
 # Setting up logger
@@ -63,26 +62,90 @@ def is_not_sunday() -> bool:
     now = datetime.now()
     return not now.weekday() == 6
 
-def is_during_holidays(country: str) -> bool:
+def is_during_holidays(country: Union[str, list[str]]) -> bool:
     """Checks if the current date is a holiday in the specified country.
 
     Args:
-        country (str): The name of the country for which holidays 
-            are being checked.
+        country (Union[str, list[str]]): The name of the country for which 
+            holidays are being checked, or a list of countries for 
+            multi-marketplace setups.
 
     Returns:
         bool: True if the current date is a holiday in the specified country, 
             otherwise False.
     """
     now = datetime.now()
-    holiday_day = holidays.CountryHoliday(country)
-    return date(now.year, now.month, now.day) in holiday_day
+    return get_calendar().is_holiday(now.date(), country)
+
+def next_active_time(after: Optional[datetime] = None) -> datetime:
+    """Computes the first instant the bot is allowed to post.
+
+    An instant is active if it is between MIN_HOUR:MIN_MINUTE and the end 
+    of the minute MAX_HOUR:MAX_MINUTE (see is_active) of a day that isn't 
+    a Sunday nor a holiday in settings.COUNTRY. The days are walked forward 
+    from the given instant, so the scheduler can sleep until the exact 
+    instant instead of polling.
+
+    Args:
+        after (datetime, optional): The instant to start from. 
+            Defaults to now.
 
-def waiting_next_iteration() -> None:
-    """Waits for a random amount of time before starting the next iteration.
+    Returns:
+        datetime: The given instant if it is active, otherwise the start of 
+            the next active window.
+
+    Example:
+        delay = (next_active_time() - datetime.now()).total_seconds()
+    """
+    if after is None:
+        after = datetime.now()
+
+    calendar = get_calendar()
+    day = after.date()
+
+    # A year of holidays and Sundays can't close every window
+    for _ in range(366):
+        if (day.weekday() != 6 and 
+            not calendar.is_holiday(day, settings.COUNTRY)):
+            window_start = datetime.combine(day, time(settings.MIN_HOUR, 
+                                                      settings.MIN_MINUTE))
+            window_end = datetime.combine(day, time(settings.MAX_HOUR, 
+                                                    settings.MAX_MINUTE, 59, 
+                                                    999999))
+            if after <= window_start:
+                return window_start
+            if after <= window_end:
+                return after
+
+        day += timedelta(days=1)
+
+    logging.error("No active window found in the next year. Check MIN_HOUR "
+                  "and MAX_HOUR in the settings.")
+    return after + timedelta(days=1)
+
+def seconds_to_active_time(after: Optional[datetime] = None) -> int:
+    """Computes the seconds to wait before the first active instant.
+
+    Args:
+        after (datetime, optional): The instant to start from. 
+            Defaults to now.
+
+    Returns:
+        int: The number of seconds from now to the first active instant at 
+            or after the given one (0 if it is now).
+    """
+    now = datetime.now()
+    active = next_active_time(after or now)
+    return max(0, int((active - now).total_seconds() + 0.999))
+
+def next_iteration_delay() -> int:
+    """Chooses the random amount of time to wait before the next iteration.
 
     The function selects a random waiting time from a list of predefined options 
-    with corresponding probabilities and then sleeps for that duration.
+    with corresponding probabilities.
+
+    Returns:
+        int: The waiting time in seconds.
     """
     waiting_time_list = [20, 40, 60, 80, 100, 120, 140, 160]
     weights = [0.12, 0.13, 0.125, 0.125, 0.12, 0.13, 0.12, 0.13]
@@ -92,28 +155,24 @@ def waiting_next_iteration() -> None:
 
     random_range = random.choices(random_split, weights=[0.3, 0.7], k=1)[0]
     random_time = random.randint(random_range, (random_range + 10))
+    return random_time * 60
 
-    logging.info(f"Waiting {random_time} minutes before next iteration.")
-    time.sleep(random_time * 60)
+def amz_retry_delay() -> int:
+    """Chooses the random amount of time to wait after a Status Code: 429 
+        of the PA-API.
 
-def static_waiting_time() -> None:
-    """Waits for a static amount of time before retrying the bot iteration.
-
-    The function waits for a randomly chosen duration between 1500 and 2100 
-    seconds before retrying the bot iteration.
+    Returns:
+        int: The waiting time in seconds, between 2 and 3 minutes.
     """
-    time_to_wait = random.randint(1500, 2100)
-    logging.info(f"Not the right time to iterate the bot. Waiting for "
-                 f"{int(time_to_wait / 60)} minutes before the next iteration.")
-    time.sleep(time_to_wait)
-    logging.info("Waiting completed. Retrying.")
+    return random.randint(2, 3) * 60
 
 def amz_wait_time() -> None:
     """Waits for a random amount of time before retrying the bot iteration.
 
     The function waits for a randomly chosen duration between 2 and 3 minutes
-    before retrying the bot iteration.
+    before retrying the bot iteration. The wait ends early if the scheduler 
+    is shutting down.
     """
-    time_to_wait = random.randint(2, 3)
-    logging.debug(f"Waiting {time_to_wait} minutes for Status Code: 429.")
-    time.sleep(time_to_wait*60)
\ No newline at end of file
+    time_to_wait = amz_retry_delay()
+    logging.debug(f"Waiting {time_to_wait // 60} minutes for Status Code: 429.")
+    get_scheduler().sleep(time_to_wait)
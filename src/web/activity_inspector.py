@@ -12,81 +12,269 @@
 # Github website <https://github.com/Piero24>
 
 # Standard library modules
+import os
+import gzip
+import json
+import hashlib
 import logging
 import threading
-from http.server import BaseHTTPRequestHandler, HTTPServer
+from email.utils import formatdate
+from urllib.parse import parse_qs, urlsplit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 # Importing internal modules
 from configs import settings
+from utils import metrics
+from utils.health import get_health
+from utils.pipeline_state import get_state
+from utils.job_scheduler import get_scheduler
 from utils.log_manager import setup_logger
 
 # Setting up logger
 setup_logger()
 logger = logging.getLogger(__name__)
 
+WEB_DIR = os.path.dirname(os.path.abspath(__file__))
+# Files served by the inspector, by name, with their content type
+STATIC_FILES = {
+    'index.html': 'text/html; charset=utf-8',
+    'style.css': 'text/css; charset=utf-8',
+}
+# Responses smaller than this aren't compressed
+GZIP_MIN_SIZE = 512
+# Default number of offers returned by /api/recent
+RECENT_LIMIT = 20
+
+_server = None
+_server_thread = None
+
+class StaticFile:
+    """A file served by the inspector, preloaded in memory.
+
+    Attributes:
+        content (bytes): The content of the file.
+        gzip_content (bytes): The content compressed with gzip.
+        content_type (str): The content type of the file.
+        etag (str): The ETag of the file (hash of the content).
+        last_modified (str): The modification time of the file as an 
+            HTTP date.
+    """
+    def __init__(self, path: str, content_type: str) -> None:
+        """Reads and compresses a file.
+
+        Args:
+            path (str): The path of the file.
+            content_type (str): The content type of the file.
+        """
+        with open(path, 'rb') as file:
+            self.content = file.read()
+
+        self.gzip_content = gzip.compress(self.content)
+        self.content_type = content_type
+        self.etag = f'"{hashlib.sha1(self.content).hexdigest()}"'
+        self.last_modified = formatdate(os.path.getmtime(path), usegmt=True)
+
+def load_static_files(directory: str = WEB_DIR) -> dict[str, StaticFile]:
+    """Preloads the files served by the inspector.
+
+    Args:
+        directory (str): The directory of the files. Defaults to the 
+            directory of this package.
+
+    Returns:
+        dict[str, StaticFile]: The files by name. Missing files are skipped.
+    """
+    files = {}
+
+    for name, content_type in STATIC_FILES.items():
+        try:
+            files[name] = StaticFile(os.path.join(directory, name), 
+                                     content_type)
+        except OSError as e:
+            logging.error(f"Can't load the web file {name}: {e}")
+
+    return files
+
 class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
-    """Handles HTTP requests and serves files from the current directory.
+    """Handles HTTP requests and serves the files preloaded in memory.
 
-    This class extends BaseHTTPRequestHandler and implements GET and HEAD 
-    methods for serving files and handling HTTP requests.
+    This class extends BaseHTTPRequestHandler and implements the GET method 
+    for serving files and handling HTTP requests. The files are revalidated 
+    with ETag and Last-Modified and sent compressed with gzip when the 
+    client accepts it.
+
+    Attributes:
+        files (dict[str, StaticFile]): The preloaded files, set by 
+            run_server.
 
     Methods:
         do_GET(self): Handles GET requests.
+        send_file(self, file): Sends a preloaded file.
+        send_text(self, text, content_type, status): Sends a text generated 
+            in memory (e.g. the /metrics page).
     """
+    files = {}
+
     def do_GET(self) -> None:
-        """Handles GET requests. Sets up the response status, header, 
-            and sends HTML content with the response status.
+        """Handles GET requests. Sends the page matching the path, 
+            index.html for every unknown path.
 
         Args:
             self: The instance of the class handling the request.
         """
-        # Set response status (200 OK)
-        response_ok = 200
+        path = self.path.split('?')[0]
+
+        if path == '/metrics':
+            self.send_text(metrics.exposition(), 
+                           'text/plain; version=0.0.4; charset=utf-8')
+            return
+
+        if path == '/api/state':
+            state = get_state().snapshot()
+            state["scheduler"] = get_scheduler().state()
+            state["health"] = {"last_sweep": get_health().last_sweep, 
+                               "last_send": get_health().last_send}
+            self.send_text(json.dumps(state), 'application/json')
+            return
+
+        if path == '/api/recent':
+            query = parse_qs(urlsplit(self.path).query)
+            try:
+                limit = int(query.get('limit', [RECENT_LIMIT])[0])
+            except ValueError:
+                limit = RECENT_LIMIT
+            self.send_text(json.dumps(get_state().recent_offers(limit)), 
+                           'application/json')
+            return
+
+        if path in ('/healthz', '/readyz'):
+            health = get_health()
+            ok, report = (health.liveness() if path == '/healthz' 
+                          else health.readiness())
+            self.send_text(json.dumps(report), 'application/json', 
+                           200 if ok else 503)
+            return
         
         # Check if the request is for CSS
-        if self.path.endswith('.css'):
-            content_type = 'text/css'
-            # Construct the full path to the CSS file
-            file_path = 'src/web/style.css'
+        if path.endswith('.css'):
+            file = self.files.get('style.css')
         else:
             # For other requests, assume HTML
-            content_type = 'text/html'
-            file_path = 'src/web/index.html'
+            file = self.files.get('index.html')
         
-        try:
-            with open(file_path, 'rb') as file:
-                content = file.read()
-        except FileNotFoundError:
+        if file is None:
             # If file not found, send a 404 response
             self.send_error(404, "File not found")
             return
         
-        # Set response headers
-        self.send_response(response_ok)
+        self.send_file(file)
+
+    def accepts_gzip(self) -> bool:
+        """Returns True if the client accepts gzip responses."""
+        return 'gzip' in self.headers.get('Accept-Encoding', '')
+
+    def send_file(self, file: StaticFile) -> None:
+        """Sends a preloaded file, or 304 Not Modified if the client 
+            already has it.
+
+        Args:
+            file (StaticFile): The file to send.
+        """
+        if_none_match = self.headers.get('If-None-Match')
+        if_modified_since = self.headers.get('If-Modified-Since')
+
+        if ((if_none_match is not None and file.etag in if_none_match) or 
+            (if_none_match is None and 
+             if_modified_since == file.last_modified)):
+            self.send_response(304)
+            self.send_header('ETag', file.etag)
+            self.end_headers()
+            return
+
+        compressed = self.accepts_gzip()
+        content = file.gzip_content if compressed else file.content
+
+        self.send_response(200)
+        self.send_header('Content-type', file.content_type)
+        self.send_header('Content-Length', str(len(content)))
+        self.send_header('ETag', file.etag)
+        self.send_header('Last-Modified', file.last_modified)
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Vary', 'Accept-Encoding')
+        if compressed:
+            self.send_header('Content-Encoding', 'gzip')
+        self.end_headers()
+        self.wfile.write(content)
+
+    def send_text(
+            self, 
+            text: str, 
+            content_type: str, 
+            status: int = 200
+        ) -> None:
+        """Sends a text generated in memory, compressed with gzip when it 
+            is big and the client accepts it.
+
+        Args:
+            text (str): The body of the response.
+            content_type (str): The content type of the body.
+            status (int): The response status. Defaults to 200.
+        """
+        content = text.encode('utf-8')
+        compressed = len(content) >= GZIP_MIN_SIZE and self.accepts_gzip()
+        if compressed:
+            content = gzip.compress(content, compresslevel=5)
+
+        self.send_response(status)
         self.send_header('Content-type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        self.send_header('Cache-Control', 'no-store')
+        if compressed:
+            self.send_header('Content-Encoding', 'gzip')
         self.end_headers()
-        
-        # Converts the content to bytes and sends it as a response
         self.wfile.write(content)
 
 def run_server() -> None:
     """Runs the web server. Starts the server on a specified IP 
         address and port. Prints server start-up messages.
+
+    Each request is handled on its own thread, so a slow client can't 
+        block the health checks.
     """
+    global _server
+
     logging.info('Start the server...')
+    SimpleHTTPRequestHandler.files = load_static_files()
     # Specifies the IP address and port on which the server will run
     server_address = ('', settings.PORT)
     # Create a web server instance
-    httpd = HTTPServer(server_address, SimpleHTTPRequestHandler)
+    httpd = ThreadingHTTPServer(server_address, SimpleHTTPRequestHandler)
+    httpd.daemon_threads = True
+    _server = httpd
     # Start the server
     logging.info(f'The server is running at localhost:{settings.PORT}.')
     httpd.serve_forever()
+    httpd.server_close()
 
 def run_server_thread() -> None:
-    """Runs the web server in a separate thread. Creates a thread for 
-        running the server and starts the thread.
+    """Runs the web server in a separate daemon thread, so it never keeps 
+        the process alive at shutdown.
     """
+    global _server_thread
+
     # Create a thread for the server
-    server_thread = threading.Thread(target=run_server)
+    _server_thread = threading.Thread(target=run_server, 
+                                      name="activity-inspector", daemon=True)
     # Start the server thread
-    server_thread.start()
+    _server_thread.start()
+
+def stop_server(timeout: float = 5) -> None:
+    """Stops the web server and waits for its thread.
+
+    Args:
+        timeout (float): The maximum number of seconds to wait.
+    """
+    if _server is not None:
+        _server.shutdown()
+    if _server_thread is not None:
+        _server_thread.join(timeout)